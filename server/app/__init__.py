@@ -10,4 +10,5 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Location", "Retry-After", "Upload-Offset", "ETag", "Content-Range", "Accept-Ranges"],
 )
\ No newline at end of file
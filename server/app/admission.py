@@ -0,0 +1,96 @@
+import os
+import shutil
+
+from fastapi import HTTPException
+
+from app.jobs import JobQueue
+from app.memory import MemoryBudget, available_memory
+
+
+# Unfinished render jobs across all clients before uploads are turned away
+ADMISSION_MAX_JOBS = int(os.getenv('ADMISSION_MAX_JOBS', 60))
+
+# Unfinished render jobs one client may have before its uploads get 429
+ADMISSION_MAX_CLIENT_JOBS = int(os.getenv('ADMISSION_MAX_CLIENT_JOBS', 15))
+
+# Queued work, in seconds of audio summed over producers and their previews
+# (duration x producers, plus up to PREVIEW_SECONDS per preview)
+ADMISSION_MAX_BACKLOG = float(os.getenv('ADMISSION_MAX_BACKLOG', 4 * 60 * 60))
+
+# Memory and volume space that must stay free for jobs already admitted
+ADMISSION_MIN_FREE_MEMORY = int(os.getenv('ADMISSION_MIN_FREE_MEMORY', 512 * 1024 * 1024))
+ADMISSION_MIN_FREE_DISK = int(os.getenv('ADMISSION_MIN_FREE_DISK', 512 * 1024 * 1024))
+
+# Seconds clients are told to wait before retrying a rejected upload
+ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', 30))
+
+
+def reject(status_code: int, detail: str, retry_after: int = ADMISSION_RETRY_AFTER):
+    raise HTTPException(
+        status_code=status_code,
+        detail=detail,
+        headers={"Retry-After": str(retry_after)}
+    )
+
+
+class AdmissionControl:
+    """
+    Decides whether the server takes on another upload. Overload is turned
+    into a 503 (server busy) or 429 (this client has enough queued), both
+    with Retry-After, instead of into OOM kills and a full volume.
+
+    check_capacity() runs before the upload is read; check_cost() once its
+    duration is known. With a memory budget, tracks not even a preview of
+    which fits in it are refused with 413.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        volume: str,
+        producers: int,
+        memory: MemoryBudget = None,
+        previews: dict = None
+    ):
+        self.queue = queue
+        self.volume = volume
+        self.producers = producers
+        self.memory = memory
+        # Preview style -> seconds of audio a preview covers at most
+        self.previews = previews or {}
+
+    def check_capacity(self, client_id: str, upload_bytes: int = None):
+        if available_memory() < ADMISSION_MIN_FREE_MEMORY:
+            reject(503, "Server is low on memory, try again later")
+
+        # The upload plus an output of similar size per producer
+        needed = ADMISSION_MIN_FREE_DISK + (upload_bytes or 0) * (1 + self.producers)
+        if shutil.disk_usage(self.volume).free < needed:
+            reject(503, "Server is low on storage, try again later")
+
+        backlog = self.queue.backlog()
+        if backlog['jobs'] >= ADMISSION_MAX_JOBS:
+            reject(503, "Server is busy, try again later")
+
+        if self.queue.backlog(client_id)['jobs'] >= ADMISSION_MAX_CLIENT_JOBS:
+            reject(429, "Too many uploads in progress, wait for some to finish")
+
+    def check_cost(self, duration: float):
+        """Reject an upload whose renders would push the backlog over budget"""
+        if self.memory is not None and self.previews:
+            rates = self.queue.memory_rates()
+            if all(
+                self.memory.fit(style, min(duration, seconds), rates, track_seconds=duration)
+                < min(duration, seconds)
+                for style, seconds in self.previews.items()
+            ):
+                raise HTTPException(
+                    status_code=413,
+                    detail="Track needs more memory than the server allows per render"
+                )
+
+        cost = duration * self.producers + sum(min(duration, seconds) for seconds in self.previews.values())
+        backlog = self.queue.backlog()
+        # An empty queue always takes one upload, however long
+        if backlog['jobs'] and backlog['cost'] + cost > ADMISSION_MAX_BACKLOG:
+            reject(503, "Server is busy, try again later")
@@ -0,0 +1,150 @@
+import os
+import json
+import shutil
+import fcntl
+import hashlib
+
+
+# Bump to invalidate every cached render regardless of source changes
+CACHE_FORMAT = 1
+
+# Held while an entry is stored and the cache trimmed to its budget
+LOCK_FILE = '.lock'
+
+# Suffix of the empty file next to each entry whose mtime is its last use
+USED_SUFFIX = '.atime'
+
+
+def hash_files(paths) -> str:
+    """Digest of a set of source files, used as the render code version"""
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        with open(path, "rb") as source:
+            digest.update(source.read())
+    return digest.hexdigest()[:16]
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for block in iter(lambda: source.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Content-addressed store of finished renders on the volume, keyed by
+    (content hash, producer, parameters, code version) and bounded in size
+    with least-recently-used eviction.
+
+    Entries are hard-linked into place where possible, so a cached render
+    and the processed file it was published as share the same blocks.
+    Several processes (the API and the render workers) share one cache
+    directory, so the directory itself is the index: a hit refreshes the
+    mtime of the entry's `<key>.atime` marker, and stores size the cache
+    and evict the least recently used entries from a listing taken under a
+    lock file that every process honours. Recency is kept on the marker
+    rather than the entry because the entry shares its inode, and so its
+    mtime (Last-Modified), with every output published from it.
+    """
+
+    def __init__(self, root: str, max_bytes: int, code_version: str):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.code_version = code_version
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, content_hash: str, style: str, params: dict) -> str:
+        material = json.dumps({
+            "format": CACHE_FORMAT,
+            "content": content_hash,
+            "style": style,
+            "params": params,
+            "version": self.code_version,
+        }, sort_keys=True)
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def lookup(self, key: str, file_extension: str):
+        """Path of a cached render, or None; a hit marks it recently used"""
+        path = os.path.join(self.root, f"{key}{file_extension}")
+        if not os.path.exists(path):
+            return None
+        self._touch(key)
+        return path
+
+    def _touch(self, key: str):
+        marker = os.path.join(self.root, f"{key}{USED_SUFFIX}")
+        with open(marker, 'a'):
+            pass
+        os.utime(marker)
+
+    def publish(self, key: str, file_extension: str, output_path: str) -> bool:
+        """Materialize a cached render at output_path; False on a miss"""
+        path = self.lookup(key, file_extension)
+        if path is None:
+            return False
+        try:
+            _link_or_copy(path, output_path)
+        except FileNotFoundError:
+            # Evicted by another process since the lookup
+            return False
+        return True
+
+    def store(self, key: str, file_extension: str, source_path: str):
+        path = os.path.join(self.root, f"{key}{file_extension}")
+        with open(os.path.join(self.root, LOCK_FILE), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            _link_or_copy(source_path, path)
+            self._touch(key)
+            self._evict(keep=path)
+
+    def _entries(self) -> list:
+        """(last used, size, path) of every entry, least recently used first"""
+        files = os.listdir(self.root)
+        markers = {}
+        entries = []
+        for file in files:
+            key, file_extension = os.path.splitext(file)
+            path = os.path.join(self.root, file)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if file_extension == USED_SUFFIX:
+                markers[key] = (stat.st_mtime, path)
+            elif file != LOCK_FILE and file_extension != '.tmp':
+                entries.append((key, stat.st_mtime, stat.st_size, path))
+
+        # Markers a hit touched just as its entry was evicted
+        for key in markers.keys() - {key for key, _, _, _ in entries}:
+            os.remove(markers[key][1])
+        # Entries stored before markers existed fall back to their own mtime
+        return sorted(
+            (markers[key][0] if key in markers else mtime, size, path)
+            for key, mtime, size, path in entries
+        )
+
+    def _evict(self, keep: str):
+        # The newest entry is never evicted, even if it alone exceeds the budget
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            marker = f"{os.path.splitext(path)[0]}{USED_SUFFIX}"
+            for evicted in [path, marker]:
+                if os.path.exists(evicted):
+                    os.remove(evicted)
+            total -= size
+
+
+def _link_or_copy(source: str, target: str):
+    tmp_target = f"{target}.{os.getpid()}.tmp"
+    try:
+        os.link(source, tmp_target)
+    except OSError:
+        shutil.copyfile(source, tmp_target)
+    os.replace(tmp_target, target)
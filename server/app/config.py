@@ -0,0 +1,26 @@
+import os
+
+# Use Railway volume paths for storage. Shared by the API and the render
+# workers, which may run as separate processes.
+
+RAILWAY_VOLUME = os.getenv('RAILWAY_VOLUME_MOUNT_PATH', 'server/data')
+UPLOAD_DIR = os.path.join(RAILWAY_VOLUME, "uploads")
+PROCESSED_DIR = os.path.join(RAILWAY_VOLUME, "processed")
+CACHE_DIR = os.path.join(RAILWAY_VOLUME, "cache")
+ANALYSIS_DIR = os.path.join(RAILWAY_VOLUME, "analysis")
+
+# Waveform peaks of uploads and renders, named by the hash of their audio
+PEAKS_DIR = os.path.join(RAILWAY_VOLUME, "peaks")
+
+# Resumable uploads still being sent, kept apart from accepted uploads
+INCOMING_DIR = os.path.join(RAILWAY_VOLUME, "incoming")
+
+def peaks_path_for(audio_hash: str) -> str:
+    return os.path.join(PEAKS_DIR, f"{audio_hash}.peaks.npz")
+
+
+# Durable job queue shared by the API and every worker
+JOB_DB = os.path.join(RAILWAY_VOLUME, "jobs.sqlite3")
+
+# Disk budget for cached renders before least-recently-used eviction
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', 512 * 1024 * 1024))
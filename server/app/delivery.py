@@ -0,0 +1,197 @@
+import os
+import asyncio
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+
+
+# Renders never change once published, so clients may keep them for a year
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# Read size when streaming a file or a range of it
+BLOCK_SIZE = 256 * 1024
+
+# Seconds between checks for new data in a file that is still being written
+FOLLOW_INTERVAL = 0.25
+
+# What the writer of a followed file is doing
+WRITING = 'writing'
+DONE = 'done'
+GONE = 'gone'
+
+
+def _read(path: str, start: int, length: int):
+    with open(path, "rb") as source:
+        source.seek(start)
+        while length > 0:
+            block = source.read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+def _matches(header: str, etag: str) -> bool:
+    """Whether an If-None-Match / If-Range list names etag (weak comparison)"""
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def _not_modified_since(header: str, mtime: float) -> bool:
+    try:
+        return int(mtime) <= parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+def byte_range(header: str, size: int):
+    """
+    (start, end) of a single 'bytes=' range, end inclusive. None when the
+    header asks for something else (several ranges, other units), in which
+    case the whole file is sent; (None, None) when it cannot be satisfied.
+    """
+    unit, _, ranges = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+    first, _, last = ranges.strip().partition("-")
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                return None, None
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return None, None
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+def file_response(
+    request: Request,
+    path: str,
+    etag: str,
+    media_type: str,
+    cache_control: str = IMMUTABLE,
+    headers: dict = None
+) -> Response:
+    """
+    Serve a file with validators and byte ranges: 304 when the client's copy
+    is current (If-None-Match, If-Modified-Since), 206 for a single Range
+    (honouring If-Range), 416 for a range past the end, otherwise the whole
+    file. etag is the file's strong validator, unquoted.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = f'"{etag}"'
+    headers = {
+        **(headers or {}),
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        if _matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+    elif if_modified_since and _not_modified_since(if_modified_since, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    start, end = 0, size - 1
+    status_code = 200
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and size and (
+        if_range is None
+        # If-Range needs a strong match, or the exact modification date
+        or if_range.strip() == etag
+        or if_range.strip() == headers["Last-Modified"]
+    ):
+        requested = byte_range(range_header, size)
+        if requested == (None, None):
+            return Response(
+                status_code=416,
+                headers={**headers, "Content-Range": f"bytes */{size}"}
+            )
+        if requested is not None:
+            start, end = requested
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _read(path, start, end - start + 1),
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers
+    )
+
+
+async def follow(current_path, status, final_path: str = None, interval: float = FOLLOW_INTERVAL):
+    """
+    Yield the bytes of a file another process is still writing, as they
+    are written. current_path() gives the file being written, or None while
+    the writer has not started. status() says what the writer is up to:
+    WRITING (wait for more), DONE (send the rest and stop) or GONE (stop).
+    A writer that publishes by renaming the file to final_path may finish
+    before it is opened, in which case final_path is sent instead.
+
+    The stream also stops if the file is deleted, replaced or superseded
+    by another before the writer is done, e.g. when a failed render is
+    retried, since the new file's bytes do not follow on from what was
+    already sent.
+    """
+    source = None
+    path = None
+    try:
+        while source is None:
+            path = current_path()
+            try:
+                source = open(path, "rb") if path is not None else None
+            except FileNotFoundError:
+                pass
+            if source is None:
+                state = status()
+                if state == DONE and final_path is not None:
+                    source = open(final_path, "rb")
+                elif state != WRITING:
+                    return
+                else:
+                    await asyncio.sleep(interval)
+
+        inode = os.fstat(source.fileno()).st_ino
+        finishing = False
+        while True:
+            block = await run_in_threadpool(source.read, BLOCK_SIZE)
+            if block:
+                yield block
+                continue
+            if finishing:
+                return
+            state = status()
+            if state == DONE:
+                # Drain whatever was written since the last read
+                finishing = True
+                continue
+            if state == GONE or os.fstat(source.fileno()).st_nlink == 0 or current_path() != path:
+                return
+            try:
+                if os.stat(path).st_ino != inode:
+                    return
+            except FileNotFoundError:
+                # Renamed into place; DONE follows once the queue says so
+                pass
+            await asyncio.sleep(interval)
+    finally:
+        if source is not None:
+            source.close()
@@ -0,0 +1,205 @@
+import os
+import fcntl
+import inspect
+import tempfile
+
+import numpy as np
+
+from app.cache import hash_files
+from producers import audio_io
+from producers.analysis import AnalysisCache
+from producers.audio_io import SAMPLE_RATE, load_audio
+from producers.peaks import PeaksBuilder
+from producers.preview import preview_signal
+from producers.jdilla import apply_j_dilla_effect
+from producers.steve_albini import apply_steve_albini_effect
+from producers.scott_burns import apply_scott_burns_effect
+from producers.time_stretch import STRETCH_MODES
+from producers.tracing import span
+
+
+# Scratch space for decoded PCM shared between worker processes
+PCM_DIR = os.getenv('PCM_DIR', os.path.join(tempfile.gettempdir(), 'mixmaster-pcm'))
+
+PRODUCERS = {
+    'dilla': apply_j_dilla_effect,
+    'albini': apply_steve_albini_effect,
+    'burns': apply_scott_burns_effect,
+}
+
+# Accepted values of every render parameter: an inclusive (low, high) range
+# for numbers, the allowed choices for strings. The stretch factor is kept
+# away from zero since the Dilla output is the track's length over it.
+PARAM_LIMITS = {
+    'dilla': {
+        'swing_amount': (0.0, 1.0),
+        'quantize_strength': (0.0, 1.0),
+        'time_stretch_factor': (0.5, 2.0),
+        'lofi_amount': (0.0, 1.0),
+        'seed': (0, 2**32 - 1),
+        'stretch_mode': ('auto', *STRETCH_MODES),
+    },
+    'albini': {
+        'dynamics_ratio': (0.0, 1.0),
+        'noise_floor': (0.0, 0.1),
+        'saturation': (0.0, 10.0),
+    },
+    'burns': {
+        'bass_boost': (0.0, 2.0),
+        'high_end_crisp': (0.0, 2.0),
+        'drum_punch': (0.0, 2.0),
+        'distortion': (0.0, 10.0),
+    },
+}
+
+# Name suffix of a producer's preview render, e.g. 'dilla_preview'
+PREVIEW_SUFFIX = '_preview'
+
+# Arguments every producer takes that are not render parameters
+_PLUMBING_ARGS = {
+    'input_path', 'output_path', 'task_id', 'y', 'sr', 'progress', 'peaks',
+    'analysis_cache', 'content_hash',
+}
+
+# Digest of the DSP sources; any change to them invalidates cached renders
+_PRODUCER_DIR = os.path.dirname(os.path.abspath(audio_io.__file__))
+CODE_VERSION = hash_files(
+    os.path.join(_PRODUCER_DIR, file)
+    for file in os.listdir(_PRODUCER_DIR) if file.endswith('.py')
+)
+
+os.makedirs(PCM_DIR, exist_ok=True)
+
+
+def check_param(style: str, name: str, value, default):
+    """value if it is a valid setting of a producer parameter; raises ValueError otherwise"""
+    limits = PARAM_LIMITS.get(style, {}).get(name)
+    if isinstance(default, str):
+        if not isinstance(value, str) or (limits is not None and value not in limits):
+            choices = ', '.join(limits) if limits else 'a string'
+            raise ValueError(f"{style} {name} must be one of: {choices}")
+        return value
+
+    # bool is an int to Python, but never a valid setting here
+    numeric = (int,) if isinstance(default, int) else (int, float)
+    if isinstance(value, bool) or not isinstance(value, numeric):
+        kind = 'an integer' if numeric == (int,) else 'a number'
+        raise ValueError(f"{style} {name} must be {kind}")
+    if limits is not None:
+        low, high = limits
+        # Also rejects NaN, which json.loads lets through
+        if not low <= value <= high:
+            raise ValueError(f"{style} {name} must be between {low} and {high}")
+    return value if numeric == (int,) else float(value)
+
+
+def producer_params(style: str, overrides: dict = None) -> dict:
+    """
+    Effective render parameters of a producer: its defaults plus overrides.
+    Raises ValueError for unknown parameters and invalid values.
+    """
+    params = {
+        name: parameter.default
+        for name, parameter in inspect.signature(PRODUCERS[style]).parameters.items()
+        if name not in _PLUMBING_ARGS
+    }
+    if overrides:
+        unknown = set(overrides) - set(params)
+        if unknown:
+            raise ValueError(f"Unknown {style} parameters: {', '.join(sorted(unknown))}")
+        for name, value in overrides.items():
+            params[name] = check_param(style, name, value, params[name])
+    return params
+
+
+def preview_style(style: str) -> str:
+    return f"{style}{PREVIEW_SUFFIX}"
+
+
+def split_render(render: str):
+    """(producer style, is preview) of a render name"""
+    if render.endswith(PREVIEW_SUFFIX) and render[:-len(PREVIEW_SUFFIX)] in PRODUCERS:
+        return render[:-len(PREVIEW_SUFFIX)], True
+    return render, False
+
+
+def pcm_path_for(task_id: str) -> str:
+    return os.path.join(PCM_DIR, f"{task_id}.npy")
+
+
+def decode_to_pcm(input_path: str, pcm_path: str) -> int:
+    """
+    Decode an upload and park the float32 buffer on disk for the producers.
+    Runs in a render worker. Workers rendering other styles of the same
+    upload wait on a lock file and reuse the buffer instead of decoding it
+    again. Returns the sample rate.
+    """
+    with open(pcm_path + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not os.path.exists(pcm_path):
+            with span('decode'):
+                y, _ = load_audio(input_path, sr=SAMPLE_RATE)
+            tmp_path = pcm_path + '.tmp.npy'
+            np.save(tmp_path, y)
+            os.replace(tmp_path, pcm_path)
+    return SAMPLE_RATE
+
+
+def discard_pcm(pcm_path: str):
+    for path in [pcm_path, pcm_path + '.lock']:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def run_producer(
+    style: str,
+    input_path: str,
+    pcm_path: str,
+    sr: int,
+    output_path: str,
+    task_id: str,
+    params: dict = None,
+    content_hash: str = None,
+    analysis_dir: str = None,
+    max_seconds: float = None,
+    progress=None
+) -> dict:
+    """
+    Run one producer in a render worker against the shared PCM buffer.
+    The buffer is memory-mapped read-only, so all producers share one copy.
+    Producers that analyse the track also get the persistent analysis cache.
+    Returns the waveform peaks of the output, collected from the blocks
+    the producer encoded rather than by decoding the file again.
+
+    A preview render (style 'dilla_preview' etc.) runs the producer on a
+    short, lower-rate excerpt instead; its analysis is not cached since it
+    only covers the excerpt. A render limited to max_seconds (to fit the
+    memory budget) only covers the start of the track, and its analysis is
+    not cached either: it would be stored under the whole track's hash.
+    """
+    y = np.asarray(np.load(pcm_path, mmap_mode='r'))
+    truncated = bool(max_seconds) and int(max_seconds * sr) < len(y)
+    if truncated:
+        y = y[:int(max_seconds * sr)]
+    style, preview = split_render(style)
+    if preview:
+        with span('preview_excerpt'):
+            y, sr = preview_signal(y, sr)
+    producer = PRODUCERS[style]
+    extras = {}
+    if analysis_dir and not preview and not truncated and 'analysis_cache' in inspect.signature(producer).parameters:
+        extras['analysis_cache'] = AnalysisCache(analysis_dir)
+        extras['content_hash'] = content_hash
+    peaks = PeaksBuilder(sr)
+    producer(
+        **(params or {}),
+        **extras,
+        input_path=input_path,
+        output_path=output_path,
+        task_id=task_id,
+        y=y,
+        sr=sr,
+        progress=progress,
+        peaks=peaks
+    )
+    return peaks.finish()
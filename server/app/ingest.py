@@ -0,0 +1,404 @@
+import os
+import struct
+import hashlib
+from collections import namedtuple
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from multipart.multipart import MultipartParser, parse_options_header
+
+from app.registry import PARTIAL_MARKER
+from producers import tracing
+
+
+CHUNK_SIZE = 1024 * 1024  # 1MB chunks for file handling
+
+# Largest upload accepted, in bytes
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', 100 * 1024 * 1024))
+
+# Longest track accepted, in seconds. Only the first MAX_AUDIO_LENGTH seconds
+# are rendered, but the whole file is kept and hashed.
+MAX_UPLOAD_SECONDS = float(os.getenv('MAX_UPLOAD_SECONDS', 30 * 60))
+
+# Form fields other than the file are small; anything bigger is refused
+MAX_FIELD_BYTES = 64 * 1024
+
+# How far past the ID3 tag to look for the first MPEG frame
+SYNC_SEARCH = 64 * 1024
+
+# Layer III bitrates in kbit/s by bitrate index, for MPEG-1 and MPEG-2/2.5
+_BITRATES = {
+    True: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    False: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+# Sample rates by version bits (3: MPEG-1, 2: MPEG-2, 0: MPEG-2.5) and rate index
+_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    0: (11025, 12000, 8000),
+}
+
+FrameHeader = namedtuple(
+    'FrameHeader',
+    ['bitrate', 'sample_rate', 'samples_per_frame', 'frame_length', 'side_info']
+)
+
+
+def parse_frame_header(header: bytes):
+    """Decode a 4-byte MPEG Layer III frame header; None if it is not one"""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = (header[1] >> 3) & 3
+    layer = (header[1] >> 1) & 3
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 3
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    mpeg1 = version == 3
+    bitrate = _BITRATES[mpeg1][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    padding = (header[2] >> 1) & 1
+    mono = header[3] >> 6 == 3
+    samples_per_frame = 1152 if mpeg1 else 576
+    frame_length = samples_per_frame // 8 * bitrate // sample_rate + padding
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    return FrameHeader(bitrate, sample_rate, samples_per_frame, frame_length, side_info)
+
+
+class Mp3Info(namedtuple('Mp3Info', ['audio_start', 'header', 'frames'])):
+    """First audio frame of an MP3 stream and its frame count, when the file declares one"""
+
+    def duration(self, total_bytes: int = None):
+        """
+        Length in seconds: exact from a Xing/Info or VBRI frame count,
+        otherwise from the bitrate and total_bytes (a constant bitrate
+        estimate, which a VBR file without a tag can be far off). None
+        when neither is known.
+        """
+        if self.frames:
+            return self.frames * self.header.samples_per_frame / self.header.sample_rate
+        if total_bytes is None:
+            return None
+        return max(total_bytes - self.audio_start, 0) * 8 / self.header.bitrate
+
+    def min_duration(self, total_bytes: int) -> float:
+        """
+        Seconds the stream lasts at least: exact from a frame count,
+        otherwise total_bytes at the highest bitrate its version allows
+        """
+        if self.frames:
+            return self.duration()
+        highest = _BITRATES[self.header.samples_per_frame == 1152][-1] * 1000
+        return max(total_bytes - self.audio_start, 0) * 8 / highest
+
+
+def scan_duration(path: str, audio_start: int = 0, chunk_size: int = CHUNK_SIZE) -> float:
+    """
+    Exact length in seconds of the MP3 stream in a file, from walking its
+    frame headers without decoding them. Bytes between frames (tags,
+    garbage) are skipped up to the next frame header.
+    """
+    seconds = 0.0
+    with open(path, "rb") as source:
+        source.seek(audio_start)
+        head = b""
+        position = 0
+        while True:
+            if position > len(head):
+                # The last frame ran past what has been read
+                source.seek(position - len(head), os.SEEK_CUR)
+                head, position = b"", 0
+            if len(head) - position < 4:
+                more = source.read(chunk_size)
+                if not more:
+                    break
+                head, position = head[position:] + more, 0
+                continue
+            header = parse_frame_header(head[position:position + 4])
+            if header is None:
+                sync = head.find(b"\xff", position + 1)
+                position = sync if sync != -1 else len(head)
+                continue
+            seconds += header.samples_per_frame / header.sample_rate
+            position += header.frame_length
+    return seconds
+
+
+class Mp3Sniffer:
+    """
+    Finds the first MPEG audio frame at the head of a stream fed to it in
+    pieces. ID3v2 tags are skipped without being buffered; after them at
+    most SYNC_SEARCH bytes are examined. A frame only counts when the next
+    frame header follows where its length says it should.
+    """
+
+    def __init__(self):
+        self.info = None
+        self.done = False
+        self._head = bytearray()
+        self._offset = 0  # stream offset of _head[0]
+        self._skip = None  # stream offset where audio may start
+        self._scanned = 0
+
+    def feed(self, data: bytes):
+        if self.done:
+            return
+        self._head += data
+
+        if self._skip is None:
+            if len(self._head) < 10:
+                return
+            self._skip = 0
+            if self._head[:3] == b'ID3':
+                size = 0
+                for byte in self._head[6:10]:
+                    size = (size << 7) | (byte & 0x7F)
+                self._skip = 10 + size + (10 if self._head[5] & 0x10 else 0)
+
+        if self._offset < self._skip:
+            drop = min(self._skip - self._offset, len(self._head))
+            del self._head[:drop]
+            self._offset += drop
+            if self._offset < self._skip:
+                return
+
+        self._scan()
+
+    def _scan(self):
+        head = self._head
+        for i in range(self._scanned, len(head) - 3):
+            if head[i] != 0xFF:
+                continue
+            header = parse_frame_header(head[i:i + 4])
+            if header is None:
+                continue
+            # Enough of the frame for its Xing/VBRI tag and the next header
+            needed = i + max(header.frame_length, 4 + 32 + 18) + 4
+            if len(head) < needed:
+                self._scanned = i
+                break
+            following = head[i + header.frame_length:i + header.frame_length + 4]
+            if parse_frame_header(following) is None:
+                continue
+            self.info = self._frame_info(i, header)
+            self.done = True
+            self._head = bytearray()
+            return
+        else:
+            self._scanned = max(len(head) - 3, 0)
+
+        if len(head) > SYNC_SEARCH:
+            self.done = True
+            self._head = bytearray()
+
+    def _frame_info(self, i: int, header: FrameHeader) -> Mp3Info:
+        head = self._head
+        start = self._offset + i
+        xing = i + 4 + header.side_info
+        if head[xing:xing + 4] in (b'Xing', b'Info'):
+            (flags,) = struct.unpack('>I', head[xing + 4:xing + 8])
+            frames = struct.unpack('>I', head[xing + 8:xing + 12])[0] if flags & 1 else None
+            # The tag frame itself carries no audio
+            return Mp3Info(start + header.frame_length, header, frames)
+        vbri = i + 4 + 32
+        if head[vbri:vbri + 4] == b'VBRI':
+            (frames,) = struct.unpack('>I', head[vbri + 14:vbri + 18])
+            return Mp3Info(start + header.frame_length, header, frames)
+        return Mp3Info(start, header, None)
+
+
+class UploadSink:
+    """
+    Writes one uploaded file to the volume as it streams in: counts and
+    hashes the bytes, sniffs the MP3 header for the duration and refuses
+    the file with 413 as soon as it is known to be too big or too long.
+    Data is staged under a partial name and only renamed into place by
+    commit(), so a crash never leaves a truncated upload behind.
+
+    Without a frame count in the header the duration is only a constant
+    bitrate estimate, so in flight the file is only refused once even the
+    highest bitrate cannot fit it in the limit, and commit() measures the
+    real length by walking the frames.
+    """
+
+    def __init__(
+        self,
+        input_path: str,
+        expected_bytes: int = None,
+        max_bytes: int = MAX_UPLOAD_BYTES,
+        max_seconds: float = MAX_UPLOAD_SECONDS
+    ):
+        stem, file_extension = os.path.splitext(input_path)
+        self.input_path = input_path
+        self.partial_path = f"{stem}{PARTIAL_MARKER}{file_extension}"
+        self.expected_bytes = expected_bytes
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.size = 0
+        self.content_hash = None
+        self.sniffer = Mp3Sniffer()
+        self._scanned_duration = None
+        self._digest = hashlib.sha256()
+        self._file = open(self.partial_path, "wb")
+        # Write time summed over the upload's blocks, when tracing
+        self._spans = tracing.SpanTotals() if tracing.enabled() else None
+        self._write = tracing.timed(self._file.write, self._spans, 'upload_write')
+
+    @property
+    def duration(self):
+        """Length of the track in seconds, estimated until the upload is committed"""
+        info = self.sniffer.info
+        if info is None:
+            return None
+        if self._scanned_duration is not None:
+            return self._scanned_duration
+        if self.content_hash is not None:
+            return info.duration(self.size)
+        return info.duration(self.expected_bytes)
+
+    def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File is larger than {self.max_bytes // (1024 * 1024)} MB"
+            )
+        self._digest.update(data)
+        self.sniffer.feed(data)
+        self._write(data)
+
+        info = self.sniffer.info
+        # What has arrived so far bounds the length even without a size
+        if info is not None and info.min_duration(self.size) > self.max_seconds:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Track is longer than {self.max_seconds / 60:.0f} minutes"
+            )
+
+    def commit(self) -> str:
+        """fsync and publish the upload; returns its SHA-256 content hash"""
+        task_id = os.path.splitext(os.path.basename(self.input_path))[0]
+        with tracing.span('upload_publish', task_id=task_id):
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            os.replace(self.partial_path, self.input_path)
+        info = self.sniffer.info
+        if info is not None and not info.frames:
+            self._scanned_duration = scan_duration(self.input_path, info.audio_start)
+        self.content_hash = self._digest.hexdigest()
+        if self._spans is not None:
+            self._spans.record(task_id=task_id, bytes=self.size)
+        return self.content_hash
+
+    def abort(self):
+        self._file.close()
+        for path in [self.partial_path, self.input_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+async def receive_upload(request, file_field: str, open_sink, on_write=None):
+    """
+    Stream a multipart/form-data request body straight into an UploadSink
+    instead of spooling it first, so limits apply while the file arrives.
+
+    open_sink(filename, content_type) is called when the file part starts
+    and returns the sink; await on_write(sink) runs after every block is
+    written. The sink is committed when the request ends. Returns the other
+    form fields and the sink (None if the request had no file_field part).
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+
+    events = []
+    header = {'field': b"", 'value': b"", 'headers': {}}
+
+    def on_header_field(data, start, end):
+        header['field'] += data[start:end]
+
+    def on_header_value(data, start, end):
+        header['value'] += data[start:end]
+
+    def on_header_end():
+        header['headers'][header['field'].lower()] = header['value']
+        header['field'], header['value'] = b"", b""
+
+    def on_headers_finished():
+        events.append(('part', header['headers']))
+        header['headers'] = {}
+
+    def on_part_data(data, start, end):
+        events.append(('data', bytes(data[start:end])))
+
+    def on_part_end():
+        events.append(('end', None))
+
+    parser = MultipartParser(boundary, {
+        'on_header_field': on_header_field,
+        'on_header_value': on_header_value,
+        'on_header_end': on_header_end,
+        'on_headers_finished': on_headers_finished,
+        'on_part_data': on_part_data,
+        'on_part_end': on_part_end,
+    })
+
+    fields = {}
+    sink = None
+    name = None
+    pending = bytearray()
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for kind, payload in events:
+                if kind == 'part':
+                    _, disposition = parse_options_header(payload.get(b"content-disposition", b""))
+                    name = disposition.get(b"name", b"").decode("latin-1")
+                    filename = disposition.get(b"filename")
+                    if name == file_field and filename is not None and sink is None:
+                        sink = open_sink(
+                            filename.decode("utf-8", "replace"),
+                            payload.get(b"content-type", b"").decode("latin-1")
+                        )
+                    elif filename is not None:
+                        # Any other file is ignored
+                        name = None
+                    else:
+                        fields[name] = bytearray()
+                elif kind == 'data':
+                    if name == file_field and sink is not None:
+                        pending += payload
+                    elif name is not None:
+                        fields[name] += payload
+                        if len(fields[name]) > MAX_FIELD_BYTES:
+                            raise HTTPException(status_code=413, detail=f"Field {name} is too large")
+                elif name == file_field and sink is not None:
+                    await run_in_threadpool(sink.write, bytes(pending))
+                    pending.clear()
+                    await run_in_threadpool(sink.commit)
+                    name = None
+
+                # Blocks go out at CHUNK_SIZE, but straight away until the
+                # MP3 header has been found so limits apply early
+                if pending and (len(pending) >= CHUNK_SIZE or not sink.sniffer.done):
+                    await run_in_threadpool(sink.write, bytes(pending))
+                    pending.clear()
+                    if on_write is not None:
+                        await on_write(sink)
+            events.clear()
+        parser.finalize()
+    except BaseException:
+        if sink is not None:
+            await run_in_threadpool(sink.abort)
+        raise
+
+    if sink is not None and sink.content_hash is None:
+        # The body ended in the middle of the file
+        await run_in_threadpool(sink.abort)
+        raise HTTPException(status_code=400, detail="Upload ended before the file was complete")
+
+    return {key: value.decode("utf-8", "replace") for key, value in fields.items()}, sink
@@ -0,0 +1,491 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+from contextlib import contextmanager
+
+import psutil
+
+from app.memory import MEMORY_HISTORY, MEMORY_JOB_OVERHEAD
+from app.registry import COMPLETE, FAILED, PROCESSING, QUEUED, TERMINAL_STATES, partial_path_for
+
+
+# Seconds a claimed job stays leased without a heartbeat before another
+# worker may take it over
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', 30))
+
+# Attempts per render (crashes and errors alike) before it is failed for good
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+
+# Jobs one client may have rendering at the same time
+JOB_CLIENT_CONCURRENCY = int(os.getenv('JOB_CLIENT_CONCURRENCY', 3))
+
+# Priority classes, most urgent first
+PRIORITY_PREVIEW = 0
+PRIORITY_FULL = 1
+
+# Client of jobs queued without one (e.g. resumed from an older version)
+DEFAULT_CLIENT = 'anonymous'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id TEXT NOT NULL,
+    style TEXT NOT NULL,
+    input_path TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    content_hash TEXT,
+    cache_key TEXT,
+    params TEXT NOT NULL,
+    state TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    seq INTEGER NOT NULL,
+    UNIQUE (task_id, style)
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id);
+CREATE INDEX IF NOT EXISTS jobs_seq ON jobs (seq);
+CREATE TABLE IF NOT EXISTS clients (
+    client_id TEXT PRIMARY KEY,
+    last_claimed REAL NOT NULL
+);
+"""
+
+# Columns added after the first release of the schema, with their definitions
+MIGRATIONS = {
+    'client_id': f"TEXT NOT NULL DEFAULT '{DEFAULT_CLIENT}'",
+    'priority': f"INTEGER NOT NULL DEFAULT {PRIORITY_FULL}",
+    'cost': "REAL NOT NULL DEFAULT 0",
+    'output_hash': "TEXT",
+    'max_seconds': "REAL",
+    'memory_estimate': "INTEGER NOT NULL DEFAULT 0",
+    'memory_peak': "INTEGER",
+    'memory': "TEXT",
+    'partial_path': "TEXT",
+}
+
+
+def worker_id() -> str:
+    """Lease owner name of this process"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _job(row: sqlite3.Row) -> dict:
+    job = dict(row)
+    job['params'] = json.loads(job['params'])
+    if job.get('memory') is not None:
+        job['memory'] = json.loads(job['memory'])
+    return job
+
+
+class JobQueue:
+    """
+    Durable render queue in SQLite on the volume: one row per (task, style).
+
+    Workers claim queued jobs under a lease and keep it alive with
+    heartbeats; a job whose lease runs out (its worker died) is claimed
+    again until it has used max_attempts. Every visible change bumps the
+    row's seq from a table-wide counter, so readers can follow the queue
+    with changes(since).
+
+    Each call opens its own connection, so one instance can be shared by
+    threads, and any number of processes can use the same file.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        lease_seconds: float = JOB_LEASE_SECONDS,
+        max_attempts: int = JOB_MAX_ATTEMPTS
+    ):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        db = self._connect()
+        try:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.executescript(SCHEMA)
+            columns = {row['name'] for row in db.execute('PRAGMA table_info(jobs)')}
+            for column, definition in MIGRATIONS.items():
+                if column not in columns:
+                    db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+        finally:
+            db.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        db.execute('PRAGMA synchronous=NORMAL')
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._connect()
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            yield db
+            db.execute('COMMIT')
+        except BaseException:
+            if db.in_transaction:
+                db.execute('ROLLBACK')
+            raise
+        finally:
+            db.close()
+
+    @contextmanager
+    def _reader(self):
+        db = self._connect()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def _update(self, db: sqlite3.Connection, job_id: int, **columns):
+        """Update a job and make the change visible to changes()"""
+        (seq,) = db.execute('SELECT COALESCE(MAX(seq), 0) + 1 FROM jobs').fetchone()
+        columns.update(seq=seq, updated_at=time.time())
+        assignments = ', '.join(f"{column} = ?" for column in columns)
+        db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*columns.values(), job_id))
+
+    def enqueue(
+        self,
+        task_id: str,
+        input_path: str,
+        content_hash: str,
+        renders: list,
+        client_id: str = DEFAULT_CLIENT,
+        cost: float = 0.0
+    ):
+        """
+        Add a task's renders. Each render is a dict with style, output_path,
+        params, cache_key and state (QUEUED, COMPLETE for a cache hit, with
+        the output's output_hash, or FAILED with an error), and optionally a
+        priority class (default PRIORITY_FULL), its own cost, the seconds of
+        the track it is limited to (max_seconds) and its memory_estimate in
+        bytes. cost is the estimated work of each render, in seconds of
+        audio. Renders already in the queue are left alone.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            (seq,) = db.execute('SELECT COALESCE(MAX(seq), 0) FROM jobs').fetchone()
+            for render in renders:
+                seq += 1
+                db.execute(
+                    """
+                    INSERT INTO jobs (
+                        task_id, style, input_path, output_path, content_hash,
+                        cache_key, params, state, progress, max_attempts,
+                        created_at, updated_at, seq, client_id, priority, cost,
+                        output_hash, max_seconds, memory_estimate, error
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (task_id, style) DO NOTHING
+                    """,
+                    (
+                        task_id, render['style'], input_path, render['output_path'],
+                        content_hash, render['cache_key'], json.dumps(render['params']),
+                        render['state'], 1.0 if render['state'] == COMPLETE else 0.0,
+                        self.max_attempts, now, now, seq, client_id,
+                        render.get('priority', PRIORITY_FULL), render.get('cost', cost),
+                        render.get('output_hash'), render.get('max_seconds'),
+                        render.get('memory_estimate', 0), render.get('error'),
+                    )
+                )
+
+    def claim(
+        self,
+        owner: str,
+        client_concurrency: int = JOB_CLIENT_CONCURRENCY,
+        memory_available: int = None
+    ):
+        """
+        Lease the next job to owner; None when there is nothing to do.
+        The job's partial_path is where this attempt writes its output.
+
+        The most urgent priority class goes first. Within it, clients take
+        turns: the job comes from the client with the fewest renders in
+        flight, then the one served longest ago, so one client's batch
+        cannot starve everyone else. Clients already at client_concurrency
+        are skipped. Each client's own jobs run by priority, then in
+        submission order.
+
+        With memory_available, jobs are packed by their memory estimates: a
+        job is only taken while its estimate fits in the memory available
+        now less what the jobs rendering are still expected to allocate
+        (their estimate beyond the memory they reported using so far).
+        When nothing is rendering the next job always runs, so a large one
+        cannot be starved.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            running = dict(db.execute(
+                """
+                SELECT client_id, COUNT(*) FROM jobs
+                WHERE state = ? AND lease_expires >= ?
+                GROUP BY client_id
+                """,
+                (PROCESSING, now)
+            ).fetchall())
+            last_claimed = dict(db.execute('SELECT client_id, last_claimed FROM clients').fetchall())
+
+            # Next runnable job of every client
+            heads = db.execute(
+                """
+                SELECT * FROM (
+                    SELECT *, ROW_NUMBER() OVER (
+                        PARTITION BY client_id ORDER BY priority, id
+                    ) AS position
+                    FROM jobs
+                    WHERE state = ?
+                       OR (state = ? AND lease_expires < ? AND attempts < max_attempts)
+                )
+                WHERE position = 1
+                """,
+                (QUEUED, PROCESSING, now)
+            ).fetchall()
+            heads = [row for row in heads if running.get(row['client_id'], 0) < client_concurrency]
+            if memory_available is not None and running:
+                available = memory_available - self._unallocated(db, now)
+                heads = [row for row in heads if row['memory_estimate'] <= available]
+            if not heads:
+                return None
+
+            row = min(heads, key=lambda head: (
+                head['priority'],
+                running.get(head['client_id'], 0),
+                last_claimed.get(head['client_id'], 0.0),
+                head['id'],
+            ))
+            attempt = row['attempts'] + 1
+            partial_path = partial_path_for(row['output_path'], attempt)
+            self._update(
+                db, row['id'],
+                state=PROCESSING,
+                progress=0.0,
+                attempts=attempt,
+                lease_owner=owner,
+                lease_expires=now + self.lease_seconds,
+                memory=None,
+                partial_path=partial_path
+            )
+            db.execute(
+                """
+                INSERT INTO clients (client_id, last_claimed) VALUES (?, ?)
+                ON CONFLICT (client_id) DO UPDATE SET last_claimed = excluded.last_claimed
+                """,
+                (row['client_id'], now)
+            )
+            job = _job(row)
+            del job['position']
+            job.update(
+                state=PROCESSING, attempts=attempt, lease_owner=owner, memory=None, partial_path=partial_path
+            )
+            return job
+
+    def _unallocated(self, db: sqlite3.Connection, now: float) -> int:
+        """Memory the jobs rendering are estimated to need on top of what they use now"""
+        rows = db.execute(
+            'SELECT memory_estimate, memory FROM jobs WHERE state = ? AND lease_expires >= ?',
+            (PROCESSING, now)
+        ).fetchall()
+        unallocated = 0
+        for row in rows:
+            memory = json.loads(row['memory']) if row['memory'] else {}
+            used = memory.get('used', 0) if isinstance(memory, dict) else 0
+            unallocated += max(row['memory_estimate'] - used, 0)
+        return unallocated
+
+    def reap(self) -> list:
+        """Fail jobs whose lease ran out on their last attempt; returns them"""
+        now = time.time()
+        with self._transaction() as db:
+            rows = db.execute(
+                """
+                SELECT * FROM jobs
+                WHERE state = ? AND lease_expires < ? AND attempts >= max_attempts
+                """,
+                (PROCESSING, now)
+            ).fetchall()
+            for row in rows:
+                self._update(
+                    db, row['id'],
+                    state=FAILED,
+                    lease_owner=None,
+                    lease_expires=None,
+                    error='worker lost on final attempt'
+                )
+        return [_job(row) for row in rows]
+
+    def heartbeat(
+        self,
+        job_id: int,
+        owner: str,
+        progress: float = None,
+        memory_used: int = None
+    ) -> bool:
+        """
+        Extend owner's lease, recording progress and the bytes of memory
+        the job uses so far when given. False if the lease was lost to
+        another worker in the meantime.
+        """
+        with self._transaction() as db:
+            row = db.execute(
+                'SELECT lease_owner, state FROM jobs WHERE id = ?', (job_id,)
+            ).fetchone()
+            if row is None or row['lease_owner'] != owner or row['state'] != PROCESSING:
+                return False
+            lease_expires = time.time() + self.lease_seconds
+            if memory_used is not None:
+                db.execute(
+                    'UPDATE jobs SET memory = ? WHERE id = ?',
+                    (json.dumps({'used': memory_used}), job_id)
+                )
+            if progress is None:
+                db.execute(
+                    'UPDATE jobs SET lease_expires = ? WHERE id = ?', (lease_expires, job_id)
+                )
+            else:
+                self._update(db, job_id, lease_expires=lease_expires, progress=progress)
+            return True
+
+    def complete(
+        self,
+        job_id: int,
+        owner: str,
+        output_hash: str = None,
+        memory: dict = None,
+        memory_peak: int = None
+    ) -> bool:
+        """
+        Record a finished render, the SHA-256 of its published output and
+        the memory it used: a per-stage MemoryMeter report, and the peak of
+        the render itself (without decoding the upload) that estimates for
+        later renders of its style are based on
+        """
+        columns = {'output_hash': output_hash, 'memory_peak': memory_peak}
+        if memory is not None:
+            columns['memory'] = json.dumps(memory)
+        return self._finish(job_id, owner, COMPLETE, **columns)
+
+    def fail(self, job_id: int, owner: str, error: str) -> str:
+        """Requeue a failed attempt, or fail the job for good on its last; returns the new state"""
+        with self._transaction() as db:
+            row = db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None or row['lease_owner'] != owner:
+                return None
+            state = QUEUED if row['attempts'] < row['max_attempts'] else FAILED
+            self._update(
+                db, job_id,
+                state=state,
+                progress=0.0,
+                lease_owner=None,
+                lease_expires=None,
+                error=error
+            )
+            return state
+
+    def _finish(self, job_id: int, owner: str, state: str, **columns) -> bool:
+        with self._transaction() as db:
+            row = db.execute('SELECT lease_owner FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None or row['lease_owner'] != owner:
+                return False
+            self._update(
+                db, job_id,
+                state=state,
+                progress=1.0 if state == COMPLETE else 0.0,
+                lease_owner=None,
+                lease_expires=None,
+                **columns
+            )
+            return True
+
+    def release_orphans(self) -> int:
+        """
+        Expire the leases of jobs held by processes on this host that no
+        longer exist, so they are picked up at once instead of after the
+        lease timeout. Returns the number of jobs released.
+        """
+        host = socket.gethostname()
+        released = 0
+        with self._transaction() as db:
+            rows = db.execute(
+                'SELECT id, lease_owner FROM jobs WHERE state = ? AND lease_owner IS NOT NULL',
+                (PROCESSING,)
+            ).fetchall()
+            for row in rows:
+                owner_host, _, pid = row['lease_owner'].rpartition(':')
+                if owner_host == host and pid.isdigit() and not psutil.pid_exists(int(pid)):
+                    db.execute('UPDATE jobs SET lease_expires = 0 WHERE id = ?', (row['id'],))
+                    released += 1
+        return released
+
+    def remaining(self, task_id: str) -> int:
+        """Renders of a task that have not finished yet"""
+        placeholders = ', '.join('?' for _ in TERMINAL_STATES)
+        with self._reader() as db:
+            (count,) = db.execute(
+                f"SELECT COUNT(*) FROM jobs WHERE task_id = ? AND state NOT IN ({placeholders})",
+                (task_id, *TERMINAL_STATES)
+            ).fetchone()
+        return count
+
+    def backlog(self, client_id: str = None) -> dict:
+        """
+        Number of unfinished full renders and total cost of all unfinished
+        jobs (previews included), overall or for one client. Previews are
+        left out of the count so that each upload counts once per producer.
+        """
+        placeholders = ', '.join('?' for _ in TERMINAL_STATES)
+        query = f"""
+            SELECT COUNT(CASE WHEN priority = ? THEN 1 END), COALESCE(SUM(cost), 0)
+            FROM jobs WHERE state NOT IN ({placeholders})
+        """
+        args = [PRIORITY_FULL, *TERMINAL_STATES]
+        if client_id is not None:
+            query += " AND client_id = ?"
+            args.append(client_id)
+        with self._reader() as db:
+            jobs, cost = db.execute(query, args).fetchone()
+        return {'jobs': jobs, 'cost': cost}
+
+    def memory_rates(self, history: int = MEMORY_HISTORY) -> dict:
+        """
+        Measured memory per second of audio of each style, in bytes: the
+        most any of its last `history` finished renders needed, less the
+        fixed overhead every render has
+        """
+        with self._reader() as db:
+            rows = db.execute(
+                """
+                SELECT style, MAX(MAX(memory_peak - ?, 0) / cost) AS rate FROM (
+                    SELECT style, memory_peak, cost, ROW_NUMBER() OVER (
+                        PARTITION BY style ORDER BY updated_at DESC
+                    ) AS position
+                    FROM jobs
+                    WHERE state = ? AND memory_peak IS NOT NULL AND cost > 0
+                )
+                WHERE position <= ?
+                GROUP BY style
+                """,
+                (MEMORY_JOB_OVERHEAD, COMPLETE, history)
+            ).fetchall()
+        return {row['style']: row['rate'] for row in rows}
+
+    def task_ids(self) -> set:
+        with self._reader() as db:
+            return {row['task_id'] for row in db.execute('SELECT DISTINCT task_id FROM jobs')}
+
+    def changes(self, since: int = 0) -> list:
+        """Jobs changed after seq `since`, in the order they changed"""
+        with self._reader() as db:
+            rows = db.execute(
+                'SELECT * FROM jobs WHERE seq > ? ORDER BY seq', (since,)
+            ).fetchall()
+        return [_job(row) for row in rows]
@@ -1,122 +1,724 @@
 import os
+import json
+import asyncio
 import uuid
-import shutil
-from fastapi import File, UploadFile, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
-import time
+from typing import Optional
+from fastapi import Query, Request, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel
 from app import app
 
-from producers.jdilla import apply_j_dilla_effect
-from producers.steve_albini import apply_steve_albini_effect
-from producers.scott_burns import apply_scott_burns_effect
-
-# Use Railway volume paths for storage
-
-RAILWAY_VOLUME = os.getenv('RAILWAY_VOLUME_MOUNT_PATH', 'server/data')
-UPLOAD_DIR = os.path.join(RAILWAY_VOLUME, "uploads")
-PROCESSED_DIR = os.path.join(RAILWAY_VOLUME, "processed")
+from app.admission import AdmissionControl
+from app.cache import ResultCache, hash_file
+from app.config import (
+    ANALYSIS_DIR,
+    CACHE_DIR,
+    CACHE_MAX_BYTES,
+    INCOMING_DIR,
+    JOB_DB,
+    PEAKS_DIR,
+    PROCESSED_DIR,
+    RAILWAY_VOLUME,
+    UPLOAD_DIR,
+    peaks_path_for,
+)
+from app.delivery import DONE, GONE, IMMUTABLE, WRITING, file_response, follow
+from app.engine import CODE_VERSION, PRODUCERS, preview_style, producer_params
+from app.ingest import (
+    MAX_FIELD_BYTES,
+    MAX_UPLOAD_BYTES,
+    MAX_UPLOAD_SECONDS,
+    UploadSink,
+    receive_upload,
+)
+from app.jobs import DEFAULT_CLIENT, PRIORITY_PREVIEW, JobQueue
+from app.memory import MemoryBudget
+from app.uploads import RECEIVING, UPLOAD_CHUNK_MAX, ResumableUploads, parse_checksum
+from app.registry import (
+    TaskRegistry,
+    COMPLETE,
+    FAILED,
+    PROCESSING,
+    QUEUED,
+    TERMINAL_STATES,
+)
+from app.worker import WorkerPool
+from producers.audio_io import audio_duration
+from producers.peaks import PEAKS_SCALE, read_peaks, select_peaks
+from producers.preview import PREVIEW_SECONDS
 
 
 # Constants for audio processing
-CHUNK_SIZE = 1024 * 1024  # 1MB chunks for file handling
 MAX_AUDIO_LENGTH = 600  # Maximum audio length in seconds
 SAMPLE_RATE = 44100  # Standard sample rate
 
 
+# Most waveform buckets a client may ask for
+PEAKS_MAX_BUCKETS = 10000
+
+# Seconds between keep-alive comments on idle event streams
+EVENT_KEEPALIVE = 15
+
+# Seconds between polls of the job queue for state and progress changes
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 0.25))
+
+
 # Create directories in Railway volume
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(PROCESSED_DIR, exist_ok=True)
+os.makedirs(ANALYSIS_DIR, exist_ok=True)
+os.makedirs(PEAKS_DIR, exist_ok=True)
+
+queue = JobQueue(JOB_DB)
+workers = WorkerPool(queue)
+registry = TaskRegistry(PRODUCERS, [preview_style(style) for style in PRODUCERS])
+cache = ResultCache(CACHE_DIR, CACHE_MAX_BYTES, CODE_VERSION)
+memory = MemoryBudget()
+admission = AdmissionControl(
+    queue, RAILWAY_VOLUME, len(PRODUCERS),
+    memory=memory, previews={preview_style(style): PREVIEW_SECONDS for style in PRODUCERS}
+)
+uploads = ResumableUploads(INCOMING_DIR)
+
+# Strong references to background tasks so they are not collected
+_background_tasks = set()
+
+
+@app.on_event("startup")
+async def restore_tasks():
+    workers.start()
+
+    # Rebuild the task index from the volume, then queue uploads left by a
+    # version without the job queue; the queue itself resumes everything else
+    known = await run_in_threadpool(queue.task_ids)
+    for task_id in registry.rebuild(UPLOAD_DIR, PROCESSED_DIR):
+        if task_id in known:
+            continue
+        input_path = registry.get(task_id)['input_path']
+        file_extension = os.path.splitext(input_path)[1]
+        await run_in_threadpool(enqueue_task, input_path, task_id, file_extension)
+
+    task = asyncio.create_task(watch_jobs())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    for task in list(_background_tasks):
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    workers.shutdown()
+
+
+async def watch_jobs():
+    """
+    Mirror job state and progress from the queue into the registry. Errors
+    are logged and the mirror carries on, so statuses never freeze; a job
+    that cannot be mirrored is skipped.
+    """
+    seq = 0
+    while True:
+        try:
+            jobs = await run_in_threadpool(queue.changes, seq)
+        except Exception as e:
+            print(f"Error reading job queue: {e}")
+            jobs = []
+        for job in jobs:
+            seq = job['seq']
+            try:
+                registry.sync(job)
+            except Exception as e:
+                print(f"Error mirroring job {job['id']}: {e}")
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+
+
+def enqueue_task(
+    input_path: str,
+    task_id: str,
+    file_extension: str,
+    content_hash: str = None,
+    params: dict = None,
+    client_id: str = DEFAULT_CLIENT,
+    cost: float = 0.0
+):
+    """
+    Queue a render job per producer, plus a preview render of a short
+    excerpt that workers pick up first. Renders already in the result
+    cache are published straight away and recorded as complete (with no
+    preview needed); the render workers pick up the rest.
+
+    Renders are fitted to the per-job memory budget: one that would not
+    fit only covers the start of the track (and is not cached), and one
+    that could not even cover a preview's worth is failed, leaving just
+    its preview.
+    """
+    if content_hash is None:
+        content_hash = hash_file(input_path)
+
+    def render(style: str, style_params: dict, **job) -> dict:
+        cache_key = cache.key(content_hash, style, style_params)
+        output_path = os.path.join(PROCESSED_DIR, f"{task_id}_{style}{file_extension}")
+        hit = cache.publish(cache_key, file_extension, output_path)
+        return {
+            'style': style,
+            'output_path': output_path,
+            'params': style_params,
+            'cache_key': cache_key,
+            'state': COMPLETE if hit else QUEUED,
+            'output_hash': hash_file(output_path) if hit else None,
+            **job,
+        }
+
+    def fit(render: dict, seconds: float) -> dict:
+        if render['state'] == COMPLETE:
+            return render
+        allowed = memory.fit(render['style'], seconds, rates, track_seconds=cost)
+        if allowed < min(seconds, PREVIEW_SECONDS):
+            render.update(state=FAILED, error="Track needs more memory than the server allows per render")
+        elif allowed < seconds:
+            render.update(max_seconds=allowed, cost=allowed, cache_key=None)
+            seconds = allowed
+        render['memory_estimate'] = memory.estimate(render['style'], seconds, rates, track_seconds=cost)
+        return render
+
+    rates = queue.memory_rates()
+    renders = []
+    for style in PRODUCERS:
+        style_params = producer_params(style, (params or {}).get(style))
+        full = fit(render(style, style_params), cost)
+        renders.append(full)
+        if full['state'] != COMPLETE:
+            renders.append(fit(
+                render(
+                    preview_style(style), style_params,
+                    priority=PRIORITY_PREVIEW, cost=min(cost, PREVIEW_SECONDS)
+                ),
+                min(cost, PREVIEW_SECONDS)
+            ))
+
+    queue.enqueue(task_id, input_path, content_hash, renders, client_id=client_id, cost=cost)
+    if all(render['state'] in TERMINAL_STATES for render in renders):
+        os.remove(input_path)
+
 
 @app.get("/")
 def read_root():
     return {"message": "J Dilla Remix API"}
 
 
-@app.post("/process-audio")
-async def process_audio(
-    background_tasks: BackgroundTasks,
-    audio: UploadFile = File(...)
-):
+def parse_params(raw: str) -> dict:
+    """
+    Per-producer render overrides from the request, as a JSON object keyed
+    by style, e.g. {"dilla": {"stretch_mode": "phase_vocoder"}}
+    """
+    if not raw:
+        return {}
+    try:
+        params = json.loads(raw)
+        if not isinstance(params, dict):
+            raise ValueError("params must be a JSON object keyed by producer")
+        for style, overrides in params.items():
+            if style not in PRODUCERS:
+                raise ValueError(f"Unknown producer: {style}")
+            if not isinstance(overrides, dict):
+                raise ValueError(f"{style} params must be a JSON object")
+            producer_params(style, overrides)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid params: {e}")
+    return params
+
+
+def client_id_for(request: Request) -> str:
+    """Who a job is scheduled for: an explicit X-Client-Id, else the caller's address"""
+    client_id = request.headers.get("x-client-id")
+    if client_id:
+        return client_id[:128]
+    return request.client.host if request.client else DEFAULT_CLIENT
+
+
+# Request body of /process-audio, which is parsed by hand rather than by FastAPI
+UPLOAD_FORM_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["audio"],
+                    "properties": {
+                        "audio": {"type": "string", "format": "binary"},
+                        "params": {"type": "string"},
+                    },
+                },
+            },
+        },
+    },
+}
+
+
+async def queue_upload(
+    task_id: str,
+    input_path: str,
+    content_hash: str,
+    duration: float,
+    client_id: str,
+    overrides: dict,
+    admitted: bool = False
+) -> JSONResponse:
     """
-    Upload an MP3 file and process it to sound like J Dilla
+    Admit a stored upload and queue its renders; the upload is removed if
+    it is refused. Shared by every way of uploading a track.
     """
-    if not audio.content_type or "audio/mpeg" not in audio.content_type:
+    file_extension = os.path.splitext(input_path)[1]
+    try:
+        if duration is None:
+            try:
+                duration = await run_in_threadpool(audio_duration, input_path)
+            except Exception as e:
+                print(f"Error reading {input_path}: {e}")
+                raise HTTPException(status_code=400, detail="Could not read the audio file")
+        # Uploads are only refused in flight once they are surely too long;
+        # the duration measured after commit settles the rest
+        if duration > MAX_UPLOAD_SECONDS:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Track is longer than {MAX_UPLOAD_SECONDS / 60:.0f} minutes"
+            )
+        duration = min(duration, MAX_AUDIO_LENGTH)
+        if not admitted:
+            await run_in_threadpool(admission.check_cost, duration)
+    except HTTPException:
+        os.remove(input_path)
+        raise
+
+    registry.register(task_id, input_path)
+    await run_in_threadpool(
+        enqueue_task, input_path, task_id, file_extension,
+        content_hash=content_hash, params=overrides, client_id=client_id, cost=duration
+    )
+    return accepted(task_id)
+
+
+def accepted(task_id: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=202,
+        headers={"Location": f"/status/{task_id}"},
+        content={
+            "status": "queued",
+            "message": "Audio accepted for processing",
+            "taskId": task_id,
+            "statusUrl": f"/status/{task_id}",
+            "eventsUrl": f"/events/{task_id}"
+        }
+    )
+
+
+@app.post("/process-audio", status_code=202, openapi_extra=UPLOAD_FORM_SCHEMA)
+async def process_audio(request: Request):
+    """
+    Upload an MP3 file (form field `audio`) and queue it for processing.
+
+    The body is streamed straight to the volume: files over the size or
+    duration limit are refused with 413 while they arrive, and the job cost
+    is checked as soon as the MP3 header gives away the duration.
+
+    Responds 202 as soon as the upload is on disk and the job is queued;
+    follow the Location header (or /events/{taskId}) for progress. The
+    optional params field overrides producer settings per style. When the
+    server is overloaded the upload is refused with 503, or 429 if this
+    client already has many uploads in progress, and a Retry-After header.
+    """
+    client_id = client_id_for(request)
+    content_length = request.headers.get("content-length")
+    content_length = int(content_length) if content_length and content_length.isdigit() else None
+    if content_length and content_length > MAX_UPLOAD_BYTES + MAX_FIELD_BYTES:
         raise HTTPException(
-            status_code=400, 
-            detail="Only MP3 files are accepted"
+            status_code=413,
+            detail=f"File is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"
         )
-    
+    await run_in_threadpool(admission.check_capacity, client_id, content_length)
+
     task_id = str(uuid.uuid4())
-    file_extension = os.path.splitext(audio.filename)[1] if audio.filename else ".mp3"
-    
-    input_path = os.path.join(UPLOAD_DIR, f"{task_id}{file_extension}")
 
-    with open(input_path, "wb") as buffer:
-        shutil.copyfileobj(audio.file, buffer)
+    def open_upload(filename: str, content_type: str) -> UploadSink:
+        if "audio/mpeg" not in content_type:
+            raise HTTPException(
+                status_code=400, 
+                detail="Only MP3 files are accepted"
+            )
+        file_extension = os.path.splitext(filename)[1] or ".mp3"
+        input_path = os.path.join(UPLOAD_DIR, f"{task_id}{file_extension}")
+        return UploadSink(input_path, expected_bytes=content_length)
 
-    for style in ['dilla', 'albini', 'burns']:
-        output_path = os.path.join(PROCESSED_DIR, f"{task_id}_{style}{file_extension}")
-        if style == 'dilla':
-            proc_func = apply_j_dilla_effect
-        elif style == 'albini':
-            proc_func = apply_steve_albini_effect
-        else:
-            proc_func = apply_scott_burns_effect
-    
-        background_tasks.add_task(
-            proc_func,
-            input_path=input_path,
-            output_path=output_path,
-            task_id=task_id
+    admitted = False
+
+    async def admit(sink: UploadSink):
+        # Refuse an expensive job before the rest of it is uploaded
+        nonlocal admitted
+        if not admitted and sink.duration is not None:
+            await run_in_threadpool(admission.check_cost, min(sink.duration, MAX_AUDIO_LENGTH))
+            admitted = True
+
+    fields, sink = await receive_upload(request, "audio", open_upload, admit)
+    if sink is None:
+        raise HTTPException(status_code=400, detail="No audio file in the upload")
+
+    try:
+        overrides = parse_params(fields.get("params"))
+    except HTTPException:
+        os.remove(sink.input_path)
+        raise
+
+    return await queue_upload(
+        task_id, sink.input_path, sink.content_hash, sink.duration,
+        client_id, overrides, admitted=admitted
+    )
+
+
+class UploadInit(BaseModel):
+    filename: str
+    size: int
+    contentType: str = "audio/mpeg"
+
+
+class UploadCommit(BaseModel):
+    params: Optional[str] = None
+    checksum: Optional[str] = None
+
+
+def upload_state(meta: dict) -> JSONResponse:
+    return JSONResponse(
+        headers={"Upload-Offset": str(meta['offset'])},
+        content={
+            "uploadId": meta['id'],
+            "offset": meta['offset'],
+            "size": meta['size'],
+            "status": meta['state'],
+            "chunkSize": UPLOAD_CHUNK_MAX
+        }
+    )
+
+
+@app.post("/uploads", status_code=201)
+async def create_upload(upload: UploadInit, request: Request):
+    """
+    Start a resumable upload of an MP3 file of the given size.
+
+    Send the file in chunks with PATCH /uploads/{uploadId}, each with an
+    Upload-Offset header saying where it starts and an Upload-Checksum
+    header ('sha256 <base64 digest>'), then POST /uploads/{uploadId}/commit.
+    After a dropped connection, GET /uploads/{uploadId} tells where to
+    carry on from. Admission works as for /process-audio.
+    """
+    if "audio/mpeg" not in upload.contentType:
+        raise HTTPException(status_code=400, detail="Only MP3 files are accepted")
+    if upload.size <= 0:
+        raise HTTPException(status_code=400, detail="Upload size must be positive")
+    if upload.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"
         )
-    
-    time.sleep(2)  # Simulate processing time
-    
-    return {
-        "status": "success",
-        "message": "Audio processed successfully",
-        "taskId": task_id
-    }
+    client_id = client_id_for(request)
+    await run_in_threadpool(admission.check_capacity, client_id, upload.size)
+
+    meta = await run_in_threadpool(uploads.create, upload.filename, upload.size, client_id)
+    response = upload_state(meta)
+    response.status_code = 201
+    response.headers["Location"] = f"/uploads/{meta['id']}"
+    return response
+
+
+@app.get("/uploads/{upload_id}")
+async def get_upload(upload_id: str):
+    """Offset at which the next chunk of a resumable upload must start"""
+    return upload_state(await run_in_threadpool(uploads.get, upload_id))
+
+
+@app.patch("/uploads/{upload_id}")
+async def append_upload(upload_id: str, request: Request):
+    """
+    Append one chunk to a resumable upload. Responds 409 with the current
+    Upload-Offset if the chunk does not start there, and 400 if it does not
+    match its checksum; either way the chunk is not written.
+    """
+    offset = request.headers.get("upload-offset", "")
+    if not offset.isdigit():
+        raise HTTPException(status_code=400, detail="Upload-Offset header is required")
+    checksum = parse_checksum(request.headers.get("upload-checksum"))
+
+    data = bytearray()
+    async for block in request.stream():
+        data += block
+        if len(data) > UPLOAD_CHUNK_MAX:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Chunks are limited to {UPLOAD_CHUNK_MAX // (1024 * 1024)} MB"
+            )
+
+    meta = await run_in_threadpool(uploads.append, upload_id, int(offset), bytes(data), checksum)
+
+    # Refuse an expensive job before the rest of it is uploaded
+    if not meta['admitted'] and meta['duration'] is not None:
+        try:
+            await run_in_threadpool(admission.check_cost, min(meta['duration'], MAX_AUDIO_LENGTH))
+        except HTTPException:
+            await run_in_threadpool(uploads.discard, upload_id)
+            raise
+        await run_in_threadpool(uploads.mark_admitted, upload_id)
+
+    return upload_state(meta)
+
+
+@app.post("/uploads/{upload_id}/commit", status_code=202)
+async def commit_upload(upload_id: str, commit: Optional[UploadCommit] = None):
+    """
+    Finish a resumable upload and queue it for processing, exactly as
+    /process-audio would. The optional checksum is the hex SHA-256 of the
+    whole file. Committing again returns the same task.
+    """
+    commit = commit or UploadCommit()
+    meta = await run_in_threadpool(uploads.get, upload_id)
+    if meta['state'] != RECEIVING:
+        if registry.get(meta['id']) is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+        return accepted(meta['id'])
+
+    overrides = parse_params(commit.params)
+    # The upload id doubles as the task id
+    input_path = os.path.join(UPLOAD_DIR, f"{meta['id']}{meta['extension']}")
+    meta = await run_in_threadpool(uploads.commit, upload_id, input_path, commit.checksum)
+    try:
+        return await queue_upload(
+            meta['id'], input_path, meta['content_hash'], meta['duration'],
+            meta['client_id'], overrides, admitted=meta['admitted']
+        )
+    except HTTPException:
+        await run_in_threadpool(uploads.discard, upload_id)
+        raise
+
+
+@app.delete("/uploads/{upload_id}", status_code=204)
+async def cancel_upload(upload_id: str):
+    """Abandon a resumable upload and free its space"""
+    meta = await run_in_threadpool(uploads.get, upload_id)
+    if meta['state'] == RECEIVING:
+        await run_in_threadpool(uploads.discard, upload_id)
+    return Response(status_code=204)
+
 
 @app.get("/audio/{file_id}")
-async def get_audio(file_id: str):
+async def get_audio(file_id: str, request: Request):
     """
     Retrieve a processed audio file by ID
+
+    Supports byte ranges (for seeking) and conditional requests: the ETag
+    is the SHA-256 of the file. Per-style URLs never change once complete
+    and are cacheable for good; the bare task URL serves whichever style
+    finished first, so clients revalidate it.
     """
-    # Look for the file in the processed directory
-    for file in os.listdir(PROCESSED_DIR):
-        if file.startswith(file_id):
-            file_path = os.path.join(PROCESSED_DIR, file)
-            return FileResponse(
-                file_path,
-                media_type="audio/mpeg",
-                headers={
-                    "Content-Disposition": f"attachment; filename={file}"
-                }
-            )
-    
+    task_id, style = registry.split_id(file_id)
+    task = registry.get(task_id)
+    if task is not None:
+        styles = [style] if style else list(registry.primary)
+        for name in styles:
+            entry = task['styles'][name]
+            if entry['state'] == COMPLETE:
+                if entry.get('output_hash') is None:
+                    # Output restored from the volume without a queue record
+                    entry['output_hash'] = await run_in_threadpool(hash_file, entry['output_path'])
+                file = os.path.basename(entry['output_path'])
+                return await run_in_threadpool(
+                    file_response,
+                    request,
+                    entry['output_path'],
+                    entry['output_hash'],
+                    "audio/mpeg",
+                    cache_control=IMMUTABLE if style else "no-cache",
+                    headers={
+                        "Content-Disposition": f"attachment; filename={file}"
+                    }
+                )
+
     raise HTTPException(status_code=404, detail="Audio file not found")
 
+@app.get("/stream/{file_id}")
+async def stream_audio(file_id: str, request: Request):
+    """
+    Play a render ({taskId}_{style}) while it is still being rendered.
+
+    Producers encode block by block, so the output grows as they go; this
+    sends what has been encoded so far and then the rest as it arrives,
+    ending when the render is published. The stream has no length or
+    duration header up front. A finished render is served as by /audio,
+    and a stream cut short by a failed attempt simply ends: play it again
+    to follow the retry.
+    """
+    task_id, style = registry.split_id(file_id)
+    task = registry.get(task_id)
+    if task is None or style is None:
+        raise HTTPException(status_code=404, detail="Audio file not found")
+
+    entry = task['styles'][style]
+    if entry['state'] == COMPLETE:
+        return await get_audio(file_id, request)
+    if entry['state'] == FAILED:
+        raise HTTPException(status_code=404, detail="Audio file not found")
+
+    output_path = entry['output_path'] or os.path.join(
+        PROCESSED_DIR, f"{file_id}{os.path.splitext(task['input_path'] or '.mp3')[1]}"
+    )
+
+    def status():
+        state = registry.get(task_id, style)['state']
+        if state == COMPLETE:
+            return DONE
+        return GONE if state == FAILED else WRITING
+
+    def partial_path():
+        # The current attempt's file; None until the render is claimed
+        return registry.get(task_id, style).get('partial_path')
+
+    return StreamingResponse(
+        follow(partial_path, status, final_path=output_path),
+        media_type="audio/mpeg",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/peaks/{file_id}")
+async def get_peaks(file_id: str, buckets: int = Query(1000, ge=1, le=PEAKS_MAX_BUCKETS)):
+    """
+    Waveform of a render ({taskId}_{style}) or of the upload ({taskId}), so
+    players can draw it before the audio has downloaded.
+
+    Returns about `buckets` min/max pairs covering the whole track,
+    interleaved as integers where `scale` is full scale.
+    """
+    task_id, style = registry.split_id(file_id)
+    task = registry.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    if style:
+        entry = task['styles'][style]
+        audio_hash = entry['output_hash'] if entry['state'] == COMPLETE else None
+    else:
+        audio_hash = task['content_hash']
+    if audio_hash is None or not os.path.exists(peaks_path_for(audio_hash)):
+        raise HTTPException(status_code=404, detail="Peaks not available")
+
+    peaks = await run_in_threadpool(read_peaks, peaks_path_for(audio_hash))
+    samples_per_bucket, pairs = select_peaks(peaks, buckets)
+    return JSONResponse(
+        headers={"Cache-Control": IMMUTABLE},
+        content={
+            "sampleRate": peaks['sr'],
+            "duration": peaks['frames'] / peaks['sr'],
+            "samplesPerBucket": samples_per_bucket,
+            "scale": PEAKS_SCALE,
+            "peaks": pairs.tolist()
+        }
+    )
+
 @app.get("/status/{task_id}")
 async def get_task_status(task_id: str):
     """
     Check the status of a processing task and return the file URL if complete
     """
-    # Check if the processed file exists
-    for file in os.listdir(PROCESSED_DIR):
-        if file.startswith(task_id):
-            return {
-                "status": "complete",
-                "taskId": task_id,
-                "audioUrl": f"/audio/{task_id}"
-            }
-    
-    # Check if the file is still being processed
-    for file in os.listdir(UPLOAD_DIR):
-        if file.startswith(task_id):
-            return {
-                "status": "processing",
-                "taskId": task_id
-            }
-    
-    raise HTTPException(status_code=404, detail="Task not found")
\ No newline at end of file
+    file_id = task_id
+    task_id, style = registry.split_id(file_id)
+    if registry.get(task_id) is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    if style:
+        state = registry.get(task_id, style)['state']
+    else:
+        state = registry.task_state(task_id)
+
+    if state == COMPLETE:
+        return {
+            "status": "complete",
+            "taskId": file_id,
+            "audioUrl": f"/audio/{file_id}"
+        }
+
+    return {
+        "status": state,
+        "taskId": file_id
+    }
+
+
+def render_snapshot(task_id: str, style: str) -> dict:
+    entry = registry.get(task_id, style)
+    snapshot = {
+        "status": entry['state'],
+        "progress": round(entry['progress'] * 100)
+    }
+    if entry.get('max_seconds'):
+        # Shortened to fit the memory budget
+        snapshot["maxSeconds"] = round(entry['max_seconds'], 1)
+    if entry['state'] == COMPLETE:
+        snapshot["audioUrl"] = f"/audio/{task_id}_{style}"
+        snapshot["peaksUrl"] = f"/peaks/{task_id}_{style}"
+    elif entry['state'] == PROCESSING:
+        snapshot["streamUrl"] = f"/stream/{task_id}_{style}"
+    return snapshot
+
+
+def task_snapshot(task_id: str) -> dict:
+    """
+    Per-producer state and percent-complete of a task, each with the state
+    of its preview render (absent when the full render came from the cache)
+    """
+    producers = {}
+    for style in PRODUCERS:
+        producer = render_snapshot(task_id, style)
+        preview = render_snapshot(task_id, preview_style(style))
+        # A full render published from the cache never had a preview queued
+        if producer["status"] != COMPLETE or preview["status"] != QUEUED:
+            producer["preview"] = preview
+        producers[style] = producer
+
+    return {
+        "taskId": task_id,
+        "status": registry.task_state(task_id),
+        "producers": producers
+    }
+
+
+@app.get("/events/{task_id}")
+async def stream_task_events(task_id: str):
+    """
+    Stream per-producer state and progress of a task as Server-Sent Events.
+    The stream closes once every producer has finished.
+    """
+    if registry.get(task_id) is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    async def event_stream():
+        changes = registry.subscribe(task_id)
+        try:
+            snapshot = task_snapshot(task_id)
+            yield f"data: {json.dumps(snapshot)}\n\n"
+            while snapshot["status"] not in TERMINAL_STATES:
+                try:
+                    await asyncio.wait_for(changes.get(), timeout=EVENT_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                # Coalesce bursts of updates into a single event
+                while not changes.empty():
+                    changes.get_nowait()
+                snapshot = task_snapshot(task_id)
+                yield f"data: {json.dumps(snapshot)}\n\n"
+        finally:
+            registry.unsubscribe(task_id, changes)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,182 @@
+import os
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+import psutil
+
+from app.engine import split_render
+
+
+# Memory one render may use, in bytes. Renders estimated to need more are
+# shortened, cut down to their preview, or refused.
+MEMORY_JOB_BUDGET = int(os.getenv('MEMORY_JOB_BUDGET', 3 * 1024 * 1024 * 1024))
+
+# Memory a render needs whatever the length of the track
+MEMORY_JOB_OVERHEAD = int(os.getenv('MEMORY_JOB_OVERHEAD', 64 * 1024 * 1024))
+
+# Bytes per second of audio a render of each producer needs, used until
+# renders of that style have been measured. Dilla holds the whole track
+# through beat tracking and slicing; the others stream block by block.
+MEMORY_PER_SECOND = {
+    'dilla': 5 * 1024 * 1024,
+    'albini': 256 * 1024,
+    'burns': 256 * 1024,
+}
+MEMORY_DEFAULT_PER_SECOND = 1024 * 1024
+
+# Bytes per second of audio needed to decode an upload, which whichever
+# render of a task runs first does for the whole track
+MEMORY_DECODE_PER_SECOND = 2 * 1024 * 1024
+
+# Measured renders per style that estimates are based on
+MEMORY_HISTORY = 20
+
+# Seconds between RSS samples while a job runs
+MEMORY_SAMPLE_INTERVAL = 0.05
+
+# Also trace Python and NumPy allocations with tracemalloc, which catches
+# peaks shorter than the sample interval but can double render times
+MEMORY_TRACE_ALLOCATIONS = os.getenv('MEMORY_TRACE_ALLOCATIONS', '0') == '1'
+
+# Memory limit and usage of this container under cgroup v2, then v1
+_CGROUP_MEMORY = [
+    ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory.current'),
+    ('/sys/fs/cgroup/memory/memory.limit_in_bytes', '/sys/fs/cgroup/memory/memory.usage_in_bytes'),
+]
+
+
+def available_memory() -> int:
+    """
+    Bytes of memory still available to this process: what the host has
+    free, capped by the container's cgroup limit where there is one
+    """
+    available = psutil.virtual_memory().available
+    for limit_path, usage_path in _CGROUP_MEMORY:
+        try:
+            with open(limit_path) as limit_file, open(usage_path) as usage_file:
+                limit, usage = limit_file.read().strip(), usage_file.read().strip()
+        except OSError:
+            continue
+        if limit.isdigit() and usage.isdigit():
+            available = min(available, max(int(limit) - int(usage), 0))
+        break
+    return available
+
+
+class MemoryMeter:
+    """
+    Peak memory of one job, stage by stage. RSS is sampled by a background
+    thread; with trace on, tracemalloc also records the peak of Python and
+    NumPy allocations in each stage, which no sample can miss.
+    """
+
+    def __init__(self, interval: float = MEMORY_SAMPLE_INTERVAL, trace: bool = MEMORY_TRACE_ALLOCATIONS):
+        self.interval = interval
+        self.trace = trace
+        self.stages = {}
+        self._process = psutil.Process()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+        self._stage = None
+        self._start_rss = 0
+
+    def start(self):
+        if self.trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._start_rss = self._process.memory_info().rss
+        self._sampler = threading.Thread(target=self._sample_forever, daemon=True)
+        self._sampler.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+
+    def _sample(self):
+        rss = self._process.memory_info().rss
+        with self._lock:
+            if self._stage is not None and rss > self._stage['rss']:
+                self._stage['rss'] = rss
+
+    def _sample_forever(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Attribute the memory used inside the block to stage `name`"""
+        entry = {'rss': self._process.memory_info().rss, 'allocated': 0}
+        traced = self.trace and tracemalloc.is_tracing()
+        if traced:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        with self._lock:
+            self._stage = entry
+        try:
+            yield
+        finally:
+            self._sample()
+            with self._lock:
+                self._stage = None
+            if traced:
+                entry['allocated'] = max(tracemalloc.get_traced_memory()[1] - base, 0)
+            self.stages[name] = entry
+
+    def peak(self, *stages) -> int:
+        """
+        Most memory the job added on top of what the worker held when it
+        started, in the given stages or in all of them
+        """
+        return max(
+            [
+                max(entry['rss'] - self._start_rss, entry['allocated'])
+                for name, entry in self.stages.items() if not stages or name in stages
+            ],
+            default=0
+        )
+
+    def used(self) -> int:
+        """Memory the job holds now on top of what the worker held when it started"""
+        return max(self._process.memory_info().rss - self._start_rss, 0)
+
+    def report(self) -> dict:
+        return {'peak': self.peak(), 'stages': self.stages}
+
+
+class MemoryBudget:
+    """
+    Estimates the footprint of a render from its producer and length, and
+    fits renders to the per-job budget. Estimates start from
+    MEMORY_PER_SECOND and follow the footprints workers measure. Any render
+    may be the one that decodes the upload first, so its estimate is the
+    larger of that and the render itself.
+    """
+
+    def __init__(self, budget: int = MEMORY_JOB_BUDGET, overhead: int = MEMORY_JOB_OVERHEAD):
+        self.budget = budget
+        self.overhead = overhead
+
+    def rate(self, style: str, rates: dict = None) -> float:
+        """Bytes per second of audio a render of style needs"""
+        if rates and style in rates:
+            return rates[style]
+        producer, _ = split_render(style)
+        return MEMORY_PER_SECOND.get(producer, MEMORY_DEFAULT_PER_SECOND)
+
+    def estimate(self, style: str, seconds: float, rates: dict = None, track_seconds: float = None) -> int:
+        """Bytes a render of `seconds` of a track `track_seconds` long needs"""
+        decode = MEMORY_DECODE_PER_SECOND * (seconds if track_seconds is None else track_seconds)
+        return int(self.overhead + max(decode, self.rate(style, rates) * seconds))
+
+    def fit(self, style: str, seconds: float, rates: dict = None, track_seconds: float = None) -> float:
+        """The longest part of `seconds` a render of style can cover within the budget"""
+        if self.estimate(style, seconds, rates, track_seconds) <= self.budget:
+            return seconds
+        if self.estimate(style, 0, rates, track_seconds) > self.budget:
+            # Decoding the track alone is too much
+            return 0.0
+        return max((self.budget - self.overhead) / self.rate(style, rates), 0.0)
@@ -0,0 +1,166 @@
+import os
+import asyncio
+
+
+# Producer task states
+QUEUED = 'queued'
+PROCESSING = 'processing'
+COMPLETE = 'complete'
+FAILED = 'failed'
+
+TERMINAL_STATES = (COMPLETE, FAILED)
+
+# Marker in the file name of outputs that are still being written
+PARTIAL_MARKER = '.part'
+
+
+def partial_path_for(output_path: str, attempt: int) -> str:
+    """
+    Where one attempt at a render writes its output until it is published.
+    Every attempt has its own file, so a worker that lost its lease can
+    never write into the file of the attempt that took over.
+    """
+    stem, file_extension = os.path.splitext(output_path)
+    return f"{stem}.{attempt}{PARTIAL_MARKER}{file_extension}"
+
+
+class TaskRegistry:
+    """
+    In-memory index of task_id/style -> state and output path, so status
+    and audio lookups never scan the storage volume. The volume and the job
+    queue stay the source of truth: after a restart rebuild() restores
+    finished outputs from the volume and sync() replays the queue's jobs.
+
+    Must only be mutated from the event loop thread; subscribers are woken
+    through asyncio queues whenever a task changes.
+    """
+
+    def __init__(self, styles, previews=()):
+        # Previews are tracked like any other render but do not count
+        # towards the state of the task
+        self.primary = tuple(styles)
+        self.styles = self.primary + tuple(previews)
+        self._tasks = {}
+        self._subscribers = {}
+
+    def register(self, task_id: str, input_path: str = None):
+        self._tasks[task_id] = {
+            'input_path': input_path,
+            'content_hash': None,
+            'styles': {
+                style: {'state': QUEUED, 'progress': 0.0, 'output_path': None, 'output_hash': None}
+                for style in self.styles
+            },
+        }
+
+    def sync(self, job: dict):
+        """Mirror a render job from the queue into the index"""
+        task = self._tasks.get(job['task_id'])
+        if task is None:
+            self.register(job['task_id'], job['input_path'])
+            task = self._tasks[job['task_id']]
+        task['content_hash'] = job['content_hash']
+        entry = task['styles'].get(job['style'])
+        if entry is None:
+            return
+        entry.update(
+            state=job['state'],
+            progress=job['progress'],
+            output_path=job['output_path'],
+            partial_path=job.get('partial_path'),
+            max_seconds=job.get('max_seconds')
+        )
+        if job['state'] == COMPLETE:
+            entry['output_hash'] = job.get('output_hash')
+        self._notify(job['task_id'])
+
+    def subscribe(self, task_id: str) -> asyncio.Queue:
+        """Get a queue that receives an item every time the task changes"""
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(task_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, task_id: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(task_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[task_id]
+
+    def _notify(self, task_id: str):
+        for queue in self._subscribers.get(task_id, ()):
+            queue.put_nowait(task_id)
+
+    def get(self, task_id: str, style: str = None):
+        task = self._tasks.get(task_id)
+        if task is None:
+            return None
+        if style is None:
+            return task
+        return task['styles'].get(style)
+
+    def split_id(self, file_id: str):
+        """Split a `{task_id}_{style}` id; bare task ids return style None"""
+        # Longest first, so 'dilla_preview' wins over a style named 'preview'
+        for style in sorted(self.styles, key=len, reverse=True):
+            task_id = file_id[:-len(style) - 1]
+            if task_id and file_id.endswith(f"_{style}"):
+                return task_id, style
+        return file_id, None
+
+    def task_state(self, task_id: str):
+        """Aggregate state of all producers of a task"""
+        task = self._tasks.get(task_id)
+        if task is None:
+            return None
+        states = [task['styles'][style]['state'] for style in self.primary]
+        if all(state in TERMINAL_STATES for state in states):
+            return COMPLETE if COMPLETE in states else FAILED
+        if all(state == QUEUED for state in states):
+            return QUEUED
+        return PROCESSING
+
+    def rebuild(self, upload_dir: str, processed_dir: str):
+        """
+        Rebuild the index from the volume with one scan of each directory.
+        Returns the task ids whose upload is still on disk, i.e. tasks that
+        still have producers left to run.
+        """
+        self._tasks = {}
+
+        for file in os.listdir(processed_dir):
+            file_path = os.path.join(processed_dir, file)
+            stem = os.path.splitext(file)[0]
+            if stem.endswith(PARTIAL_MARKER):
+                # Output still being written (or left by a dead worker, which
+                # the job's next attempt removes)
+                continue
+            task_id, style = self.split_id(stem)
+            if style is None:
+                continue
+            if task_id not in self._tasks:
+                self.register(task_id)
+            entry = self._tasks[task_id]['styles'][style]
+            entry.update(state=COMPLETE, progress=1.0, output_path=file_path)
+
+        interrupted = []
+        for file in os.listdir(upload_dir):
+            task_id = os.path.splitext(file)[0]
+            if task_id.endswith(PARTIAL_MARKER):
+                # Upload that was cut off before it was accepted
+                os.remove(os.path.join(upload_dir, file))
+                continue
+            if task_id not in self._tasks:
+                self.register(task_id)
+            self._tasks[task_id]['input_path'] = os.path.join(upload_dir, file)
+            interrupted.append(task_id)
+
+        # Producers of finished tasks that never published an output
+        for task_id, task in self._tasks.items():
+            if task['input_path'] is None:
+                for style in self.primary:
+                    entry = task['styles'][style]
+                    if entry['state'] == QUEUED:
+                        entry['state'] = FAILED
+
+        return interrupted
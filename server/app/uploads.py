@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import base64
+import hashlib
+from contextlib import contextmanager
+
+from fastapi import HTTPException
+
+from app.cache import hash_file
+from app.ingest import CHUNK_SIZE, MAX_UPLOAD_SECONDS, Mp3Sniffer, scan_duration
+from producers.tracing import span
+
+
+# Largest single chunk accepted by an append
+UPLOAD_CHUNK_MAX = int(os.getenv('UPLOAD_CHUNK_MAX', 8 * 1024 * 1024))
+
+# Seconds an idle or committed upload session is kept before it is removed
+UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', 24 * 60 * 60))
+
+# Session states
+RECEIVING = 'receiving'
+COMMITTED = 'committed'
+
+
+def parse_checksum(header: str) -> bytes:
+    """Digest from an Upload-Checksum header of the form 'sha256 <base64>'"""
+    algorithm, _, value = (header or "").strip().partition(" ")
+    if algorithm.lower() != "sha256":
+        raise HTTPException(status_code=400, detail="Upload-Checksum must be 'sha256 <base64 digest>'")
+    try:
+        return base64.b64decode(value.strip(), validate=True)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Upload-Checksum is not valid base64")
+
+
+class ResumableUploads:
+    """
+    Uploads sent in chunks over several requests, which survive dropped
+    connections and server restarts. Each session is a data file on the
+    volume plus a JSON sidecar; the data file's length is the offset the
+    next chunk must start at, so a client that lost a response asks for the
+    offset and carries on from there.
+
+    Chunks carry a SHA-256 checksum and are verified before they are
+    written. The MP3 header is sniffed as soon as it has arrived so tracks
+    over the duration limit are refused early, like direct uploads. Without
+    a frame count the duration is an estimate until commit, which measures
+    it by walking the frames.
+    """
+
+    def __init__(self, root: str, ttl: int = UPLOAD_SESSION_TTL):
+        self.root = root
+        self.ttl = ttl
+        os.makedirs(root, exist_ok=True)
+
+    def _paths(self, upload_id: str):
+        try:
+            upload_id = str(uuid.UUID(upload_id))
+        except ValueError:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        stem = os.path.join(self.root, upload_id)
+        return f"{stem}.json", f"{stem}.data", f"{stem}.lock"
+
+    def _save(self, meta: dict):
+        meta_path = self._paths(meta['id'])[0]
+        meta['updated_at'] = time.time()
+        with open(f"{meta_path}.tmp", "w") as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    @contextmanager
+    def _session(self, upload_id: str):
+        """Lock a session against concurrent appends and commits and load it"""
+        meta_path, data_path, lock_path = self._paths(upload_id)
+        try:
+            lock = open(lock_path, "r")
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        with lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Read under the lock: the session may have moved on or be gone
+            try:
+                with open(meta_path) as meta_file:
+                    meta = json.load(meta_file)
+            except FileNotFoundError:
+                raise HTTPException(status_code=404, detail="Upload not found")
+            if meta['state'] == RECEIVING:
+                meta['offset'] = os.path.getsize(data_path)
+            yield meta, data_path
+
+    def create(self, filename: str, size: int, client_id: str) -> dict:
+        self.expire()
+        upload_id = str(uuid.uuid4())
+        _, data_path, lock_path = self._paths(upload_id)
+        open(data_path, "wb").close()
+        open(lock_path, "wb").close()
+        meta = {
+            'id': upload_id,
+            'filename': filename,
+            'extension': os.path.splitext(filename)[1] or ".mp3",
+            'size': size,
+            'offset': 0,
+            'client_id': client_id,
+            'duration': None,
+            'min_duration': None,
+            'sniffed': False,
+            'admitted': False,
+            'state': RECEIVING,
+            'created_at': time.time(),
+        }
+        self._save(meta)
+        return meta
+
+    def get(self, upload_id: str) -> dict:
+        with self._session(upload_id) as (meta, _):
+            return meta
+
+    def append(self, upload_id: str, offset: int, data: bytes, checksum: bytes) -> dict:
+        """
+        Write one chunk at offset. Raises 409 (with the current offset) if
+        the chunk does not start where the upload left off, 400 if it fails
+        its checksum and 413 once the track is known to be too long.
+        """
+        with self._session(upload_id) as (meta, data_path):
+            if meta['state'] != RECEIVING:
+                raise HTTPException(status_code=409, detail="Upload is already committed")
+            if offset != meta['offset']:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Upload is at offset {meta['offset']}",
+                    headers={"Upload-Offset": str(meta['offset'])}
+                )
+            if offset + len(data) > meta['size']:
+                raise HTTPException(status_code=400, detail="Chunk goes past the declared upload size")
+            if hashlib.sha256(data).digest() != checksum:
+                raise HTTPException(status_code=400, detail="Chunk checksum does not match")
+
+            with span('upload_write', task_id=upload_id, bytes=len(data)):
+                with open(data_path, "r+b") as data_file:
+                    data_file.seek(offset)
+                    data_file.write(data)
+                    data_file.flush()
+                    os.fsync(data_file.fileno())
+            meta['offset'] = offset + len(data)
+
+            if not meta['sniffed']:
+                self._sniff(meta, data_path)
+            self._save(meta)
+
+        if meta.get('min_duration') is not None and meta['min_duration'] > MAX_UPLOAD_SECONDS:
+            self.discard(upload_id)
+            raise HTTPException(
+                status_code=413,
+                detail=f"Track is longer than {MAX_UPLOAD_SECONDS / 60:.0f} minutes"
+            )
+        return meta
+
+    def _sniff(self, meta: dict, data_path: str):
+        # Chunks may split the header anywhere, so rescan from the start
+        # until it is found; this stops after the first few chunks
+        sniffer = Mp3Sniffer()
+        with open(data_path, "rb") as data_file:
+            for block in iter(lambda: data_file.read(CHUNK_SIZE), b""):
+                sniffer.feed(block)
+                if sniffer.done:
+                    break
+        if sniffer.done or meta['offset'] == meta['size']:
+            meta['sniffed'] = True
+            if sniffer.info is not None:
+                meta['duration'] = sniffer.info.duration(meta['size'])
+                meta['min_duration'] = sniffer.info.min_duration(meta['size'])
+                meta['audio_start'] = sniffer.info.audio_start
+                meta['exact'] = bool(sniffer.info.frames)
+
+    def mark_admitted(self, upload_id: str):
+        with self._session(upload_id) as (meta, _):
+            meta['admitted'] = True
+            self._save(meta)
+
+    def commit(self, upload_id: str, input_path: str, checksum: str = None) -> dict:
+        """
+        Move a complete upload to input_path and record it as committed.
+        Returns the session with its content hash and, for an MP3 without
+        a frame count, its measured duration. An optional hex SHA-256 of
+        the whole file is checked first.
+        """
+        with self._session(upload_id) as (meta, data_path):
+            if meta['state'] != RECEIVING:
+                raise HTTPException(status_code=409, detail="Upload is already committed")
+            if meta['offset'] != meta['size']:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Upload is incomplete: {meta['offset']} of {meta['size']} bytes",
+                    headers={"Upload-Offset": str(meta['offset'])}
+                )
+            content_hash = hash_file(data_path)
+            if checksum and checksum.lower() != content_hash:
+                raise HTTPException(status_code=400, detail="File checksum does not match")
+
+            with span('upload_publish', task_id=upload_id):
+                os.replace(data_path, input_path)
+            if meta['duration'] is not None and not meta.get('exact'):
+                meta['duration'] = scan_duration(input_path, meta.get('audio_start', 0))
+            meta['content_hash'] = content_hash
+            meta['input_path'] = input_path
+            meta['state'] = COMMITTED
+            self._save(meta)
+            return meta
+
+    def discard(self, upload_id: str):
+        for path in self._paths(upload_id):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def expire(self):
+        """Remove sessions nobody has touched within the TTL"""
+        cutoff = time.time() - self.ttl
+        for file in os.listdir(self.root):
+            upload_id, file_extension = os.path.splitext(file)
+            if file_extension != ".json":
+                continue
+            path = os.path.join(self.root, file)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    self.discard(upload_id)
+            except (OSError, HTTPException):
+                continue
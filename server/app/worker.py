@@ -0,0 +1,296 @@
+"""
+Render workers: processes that claim jobs from the queue and run them.
+
+The API starts WORKER_PROCESSES of them next to itself. To scale workers
+independently, set WORKER_PROCESSES=0 on the API and run, from server/:
+
+    python -m app.worker --processes 4
+"""
+import os
+import sys
+import time
+import signal
+import argparse
+import threading
+import multiprocessing
+
+import numpy as np
+
+from app.cache import ResultCache, hash_file
+from app.config import (
+    ANALYSIS_DIR,
+    CACHE_DIR,
+    CACHE_MAX_BYTES,
+    JOB_DB,
+    PEAKS_DIR,
+    PROCESSED_DIR,
+    peaks_path_for,
+)
+from app.engine import CODE_VERSION, decode_to_pcm, discard_pcm, pcm_path_for, run_producer
+from app.jobs import JobQueue, worker_id
+from app.memory import MemoryMeter, available_memory
+from app.registry import partial_path_for
+from producers.peaks import peaks_from_signal, write_peaks
+from producers.tracing import bind, span
+
+
+# Number of render worker processes the API starts (defaults to all cores)
+WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', os.cpu_count() or 1))
+
+# Seconds an idle worker waits before polling the queue again
+WORKER_POLL_INTERVAL = float(os.getenv('WORKER_POLL_INTERVAL', 0.5))
+
+# Minimum seconds between progress writes to the queue
+PROGRESS_INTERVAL = 0.25
+
+
+class LeaseLost(BaseException):
+    """
+    The job's lease went to another worker, which is now rendering it.
+    Raised from progress reports to abort the render; it is not an
+    Exception so the producers' error handling lets it through.
+    """
+
+
+def _remove_partial(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class Worker:
+    """Claims one job at a time and renders it, holding the job's lease with heartbeats"""
+
+    def __init__(self, queue: JobQueue, cache: ResultCache):
+        self.queue = queue
+        self.cache = cache
+        self.owner = worker_id()
+
+    def run_forever(self, stop: threading.Event = None):
+        stop = stop or threading.Event()
+        os.makedirs(PROCESSED_DIR, exist_ok=True)
+        os.makedirs(PEAKS_DIR, exist_ok=True)
+        while not stop.is_set():
+            for job in self.queue.reap():
+                print(f"Error rendering {job['style']} for {job['task_id']}: {job['error']}")
+                self._discard(job)
+            job = self.queue.claim(self.owner, memory_available=available_memory())
+            if job is None:
+                stop.wait(WORKER_POLL_INTERVAL)
+                continue
+            self.run(job)
+
+    def run(self, job: dict):
+        task_id, style = job['task_id'], job['style']
+        partial_path = job['partial_path']
+
+        # Outputs of earlier attempts whose worker died or lost its lease
+        for attempt in range(1, job['attempts']):
+            _remove_partial(partial_path_for(job['output_path'], attempt))
+
+        meter = MemoryMeter().start()
+
+        # Keep the lease alive through long stretches without progress
+        # reports, and record the memory the job holds so far
+        done = threading.Event()
+        lost = threading.Event()
+
+        def heartbeat():
+            while not done.wait(self.queue.lease_seconds / 3):
+                if not self.queue.heartbeat(job['id'], self.owner, memory_used=meter.used()):
+                    lost.set()
+                    return
+
+        beater = threading.Thread(target=heartbeat, daemon=True)
+        beater.start()
+
+        last_report = 0.0
+
+        def report(fraction: float):
+            nonlocal last_report
+            now = time.monotonic()
+            if not lost.is_set() and now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                progress = min(max(fraction, 0.0), 1.0)
+                if not self.queue.heartbeat(job['id'], self.owner, progress=progress, memory_used=meter.used()):
+                    lost.set()
+            if lost.is_set():
+                raise LeaseLost("lease lost to another worker")
+
+        try:
+            with bind(task_id=task_id, producer=style), span('job', attempt=job['attempts']):
+                output_hash = self._render(job, meter, report)
+            meter.stop()
+            done.set()
+            self.queue.complete(
+                job['id'], self.owner,
+                output_hash=output_hash,
+                memory=meter.report(),
+                memory_peak=meter.peak('render', 'publish')
+            )
+        except LeaseLost as e:
+            # The job and the task's upload are the new owner's now
+            lost.set()
+            print(f"Error rendering {style} for {task_id}: {e}")
+            _remove_partial(partial_path)
+        except Exception as e:
+            print(f"Error rendering {style} for {task_id}: {e}")
+            _remove_partial(partial_path)
+            self.queue.fail(job['id'], self.owner, repr(e))
+        finally:
+            meter.stop()
+            done.set()
+            beater.join()
+            if not lost.is_set() and self.queue.remaining(task_id) == 0:
+                self._cleanup(job)
+
+    def _render(self, job: dict, meter: MemoryMeter, report) -> str:
+        """Decode, render and publish one job; returns the output's hash"""
+        task_id, style = job['task_id'], job['style']
+        output_path, partial_path = job['output_path'], job['partial_path']
+        pcm_path = pcm_path_for(task_id)
+        with meter.stage('decode'):
+            sr = decode_to_pcm(job['input_path'], pcm_path)
+            self._write_peaks(
+                job['content_hash'],
+                lambda: peaks_from_signal(np.load(pcm_path, mmap_mode='r'), sr)
+            )
+        with meter.stage('render'):
+            peaks = run_producer(
+                style,
+                job['input_path'],
+                pcm_path,
+                sr,
+                partial_path,
+                task_id,
+                params=job['params'],
+                content_hash=job['content_hash'],
+                analysis_dir=ANALYSIS_DIR,
+                max_seconds=job['max_seconds'],
+                progress=report
+            )
+        with meter.stage('publish'), span('publish'):
+            # Hash before publishing: the hash is the output's ETag
+            output_hash = hash_file(partial_path)
+            self._write_peaks(output_hash, lambda: peaks)
+            if not self.queue.heartbeat(job['id'], self.owner):
+                raise LeaseLost("lease lost to another worker")
+            # Publish atomically so a half-written file is never served
+            os.replace(partial_path, output_path)
+            if job['cache_key']:
+                self.cache.store(job['cache_key'], os.path.splitext(output_path)[1], output_path)
+        return output_hash
+
+    def _write_peaks(self, audio_hash: str, compute):
+        """Waveform peaks for the audio with this hash, unless already on the volume"""
+        if audio_hash is None or os.path.exists(peaks_path_for(audio_hash)):
+            return
+        try:
+            with span('peaks'):
+                write_peaks(peaks_path_for(audio_hash), compute())
+        except Exception as e:
+            # Players fall back to decoding the audio themselves
+            print(f"Error writing peaks for {audio_hash}: {e}")
+
+    def _discard(self, job: dict):
+        if job['partial_path']:
+            _remove_partial(job['partial_path'])
+        if self.queue.remaining(job['task_id']) == 0:
+            self._cleanup(job)
+
+    def _cleanup(self, job: dict):
+        # Every render of the task has finished: the upload and PCM can go
+        if os.path.exists(job['input_path']):
+            os.remove(job['input_path'])
+        discard_pcm(pcm_path_for(job['task_id']))
+
+
+def run_worker():
+    """Entry point of a worker process"""
+    queue = JobQueue(JOB_DB)
+    cache = ResultCache(CACHE_DIR, CACHE_MAX_BYTES, CODE_VERSION)
+
+    # Stop claiming jobs once the pool that started us is gone
+    stop = threading.Event()
+    parent = multiprocessing.parent_process()
+    if parent is not None:
+        def watch_parent():
+            parent.join()
+            stop.set()
+
+        threading.Thread(target=watch_parent, daemon=True).start()
+
+    try:
+        Worker(queue, cache).run_forever(stop)
+    except KeyboardInterrupt:
+        pass
+
+
+class WorkerPool:
+    """
+    Starts render worker processes and restarts any that die (e.g. when
+    OOM-killed). A dead worker's job is released back to the queue at once
+    rather than waiting for its lease to time out.
+    """
+
+    def __init__(self, queue: JobQueue, processes: int = WORKER_PROCESSES, interval: float = 1.0):
+        self.queue = queue
+        self.processes = max(0, processes)
+        self.interval = interval
+        self._context = multiprocessing.get_context('spawn')
+        self._workers = []
+        self._stop = threading.Event()
+        self._supervisor = None
+
+    def _spawn(self):
+        process = self._context.Process(target=run_worker, daemon=True)
+        process.start()
+        return process
+
+    def start(self):
+        if not self.processes:
+            return
+        self.queue.release_orphans()
+        self._workers = [self._spawn() for _ in range(self.processes)]
+        self._supervisor = threading.Thread(target=self._supervise, daemon=True)
+        self._supervisor.start()
+
+    def _supervise(self):
+        while not self._stop.wait(self.interval):
+            for index, process in enumerate(self._workers):
+                if process.is_alive() or self._stop.is_set():
+                    continue
+                print(f"Error: render worker {process.pid} exited with {process.exitcode}, restarting")
+                self.queue.release_orphans()
+                self._workers[index] = self._spawn()
+
+    def shutdown(self, timeout: float = 5):
+        self._stop.set()
+        if self._supervisor is not None:
+            self._supervisor.join()
+            self._supervisor = None
+        for process in self._workers:
+            process.terminate()
+        for process in self._workers:
+            process.join(timeout)
+        self._workers = []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--processes', type=int, default=WORKER_PROCESSES)
+    args = parser.parse_args()
+
+    pool = WorkerPool(JobQueue(JOB_DB), processes=args.processes)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    pool.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
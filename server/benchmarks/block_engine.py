@@ -0,0 +1,127 @@
+"""
+Per-track cost of the block DSP engine against the chunk loops it replaced.
+
+The legacy functions below are the Albini and Burns chunk loops as they
+were before the block engine: every 2-second chunk allocates fresh arrays,
+the outputs are concatenated, and gc.collect() runs after each chunk. The
+engine side runs the producers' own build_chain() output over the same
+signal with reusable buffers and in-place ufuncs. Only the DSP is timed;
+decoding and encoding are identical on both sides and left out.
+
+Run from server/:
+
+    python -m benchmarks.block_engine --seconds 600
+"""
+import gc
+import time
+import argparse
+
+import librosa
+import numpy as np
+
+from benchmarks.corpus import synthetic_track
+from producers.audio_io import SAMPLE_RATE
+from producers import scott_burns, steve_albini
+from producers.streaming import BLOCK_SIZE, iter_blocks
+
+
+def legacy_process_in_chunks(y, chunk_size, process_func):
+    chunks = []
+    for i in range(0, len(y), chunk_size):
+        chunks.append(process_func(y[i:i + chunk_size], i))
+        gc.collect()
+    return np.concatenate(chunks)
+
+
+def legacy_albini(y, sr, dynamics_ratio=0.8, noise_floor=0.005, saturation=0.3):
+    chunk_size = sr * 2
+    output = np.zeros_like(y)
+    for i in range(0, len(y), chunk_size):
+        chunk = y[i:min(i + chunk_size, len(y))]
+        chunk = chunk + np.random.normal(0, noise_floor, len(chunk))
+        chunk = np.tanh(chunk * (1 + saturation)) / (1 + saturation)
+        chunk[np.abs(chunk) > dynamics_ratio] *= 1.2
+        envelope = np.abs(chunk)
+        chunk[np.diff(envelope, prepend=envelope[0]) > 0.1] *= 1.3
+        output[i:i + len(chunk)] = chunk
+        del chunk
+        gc.collect()
+    room_delay = int(sr * 0.02)
+    room = np.zeros_like(output)
+    room[room_delay:] = output[:-room_delay] * 0.1
+    output = output + room
+    return output / np.max(np.abs(output)) * 0.9
+
+
+def legacy_burns(y, sr, bass_boost=0.4, high_end_crisp=0.3, drum_punch=0.5, distortion=0.2):
+    def process_chunk(chunk, _):
+        bass = librosa.effects.preemphasis(chunk, coef=-0.95) * (1 + bass_boost)
+        high = librosa.effects.preemphasis(chunk, coef=0.95) * (1 + high_end_crisp)
+        processed = np.tanh((bass * 0.6 + high * 0.4) * (1 + distortion))
+        transients = np.diff(np.abs(processed), prepend=processed[0])
+        processed[transients > np.mean(np.abs(transients))] *= (1 + drum_punch)
+        return processed
+
+    def final(chunk, _):
+        chunk = chunk + np.sin(2 * np.pi * np.arange(len(chunk)) * 2 / sr) * 0.02
+        return np.where(
+            np.abs(chunk) > 0.3,
+            0.3 + (np.abs(chunk) - 0.3) / 4.0 * np.sign(chunk),
+            chunk
+        )
+
+    output = legacy_process_in_chunks(y, sr * 2, process_chunk)
+    output = legacy_process_in_chunks(output, sr * 2, final)
+    return output / np.max(np.abs(output)) * 0.95
+
+
+def run_engine(y, chain):
+    work = np.empty(BLOCK_SIZE, dtype=np.float32)
+    for _, block in iter_blocks(y):
+        buffer = work[:len(block)]
+        np.copyto(buffer, block)
+        chain.process(buffer)
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=600, help='synthetic track length')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case; best is reported')
+    args = parser.parse_args()
+
+    sr = SAMPLE_RATE
+    y = synthetic_track('drums', args.seconds, sr)
+    cases = [
+        (
+            'albini',
+            lambda: legacy_albini(y, sr),
+            lambda: run_engine(y, steve_albini.build_chain(sr, 0.8, 0.005, 0.3)),
+        ),
+        (
+            'burns',
+            lambda: legacy_burns(y, sr),
+            lambda: run_engine(y, scott_burns.build_chain(sr, 0.4, 0.3, 0.5, 0.2)),
+        ),
+    ]
+
+    print(f"{args.seconds:.0f}s track, best of {args.repeat}")
+    for name, legacy, engine in cases:
+        legacy_time = best_of(args.repeat, legacy)
+        engine_time = best_of(args.repeat, engine)
+        print(
+            f"{name:<8} legacy {legacy_time:7.3f}s  engine {engine_time:7.3f}s  "
+            f"speedup {legacy_time / engine_time:5.2f}x"
+        )
+
+
+if __name__ == '__main__':
+    main()
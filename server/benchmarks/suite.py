@@ -0,0 +1,219 @@
+"""
+Benchmark all three producers over the synthetic corpus.
+
+Each (producer, kind, duration) case runs in a fresh child process so peak
+RSS belongs to that case alone. Reported per case:
+
+- wall_s: elapsed time of the producer call, encode included
+- cpu_s: user + system CPU time of the child during the call
+- peak_rss_mb: highest resident set size of the child
+- realtime_factor: seconds of audio rendered per second of wall time
+- stages_s: seconds spent in each traced stage, when run with TRACING=1
+
+Results are written as JSON; pass an earlier file as --compare to flag
+regressions. Run from server/:
+
+    python -m benchmarks.suite --durations 30 180 --output before.json
+    python -m benchmarks.suite --durations 30 180 --compare before.json
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+
+import numpy as np
+import psutil
+
+from benchmarks.corpus import DURATIONS, KINDS, synthetic_track
+from producers import tracing
+from producers.audio_io import SAMPLE_RATE
+from producers.jdilla import apply_j_dilla_effect
+from producers.steve_albini import apply_steve_albini_effect
+from producers.scott_burns import apply_scott_burns_effect
+
+
+PRODUCERS = {
+    'dilla': apply_j_dilla_effect,
+    'albini': apply_steve_albini_effect,
+    'burns': apply_scott_burns_effect,
+}
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# Relative slowdown (or memory growth) that --compare reports as a regression
+REGRESSION_THRESHOLD = 0.10
+
+
+class PeakRSS:
+    """Track the peak RSS of this process by sampling it on a thread"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = 0
+        self._done = threading.Event()
+
+    def _sample(self):
+        while not self._done.is_set():
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            self._done.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self.process.memory_info().rss
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+
+def run_case(producer: str, kind: str, seconds: float, sr: int, connection):
+    """Child process body: render one case and send back its measurements"""
+    try:
+        y = synthetic_track(kind, seconds, sr)
+        np.random.seed(0)
+        with tempfile.TemporaryDirectory() as scratch:
+            output_path = os.path.join(scratch, f"{producer}_{kind}.mp3")
+            process = psutil.Process()
+            with PeakRSS() as rss:
+                cpu_start = process.cpu_times()
+                wall_start = time.perf_counter()
+                PRODUCERS[producer](
+                    input_path=None,
+                    output_path=output_path,
+                    task_id='benchmark',
+                    y=y,
+                    sr=sr
+                )
+                wall = time.perf_counter() - wall_start
+                cpu_end = process.cpu_times()
+
+        cpu = (cpu_end.user - cpu_start.user) + (cpu_end.system - cpu_start.system)
+        stages = {
+            entry['span']: round(entry['total_s'], 4) for entry in tracing.METRICS.snapshot()
+        }
+        connection.send({
+            'producer': producer,
+            'kind': kind,
+            'seconds': seconds,
+            'wall_s': round(wall, 4),
+            'cpu_s': round(cpu, 4),
+            'peak_rss_mb': round(rss.peak / 2**20, 1),
+            'realtime_factor': round(seconds / wall, 2) if wall > 0 else None,
+            **({'stages_s': stages} if stages else {}),
+        })
+    except Exception as e:
+        connection.send({'producer': producer, 'kind': kind, 'seconds': seconds, 'error': repr(e)})
+    finally:
+        connection.close()
+
+
+def measure(producer: str, kind: str, seconds: float, sr: int = SAMPLE_RATE) -> dict:
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    child = multiprocessing.Process(target=run_case, args=(producer, kind, seconds, sr, sender))
+    child.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = {'producer': producer, 'kind': kind, 'seconds': seconds, 'error': 'worker died'}
+    child.join()
+    return result
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'sample_rate': SAMPLE_RATE,
+    }
+
+
+def compare(results: list, baseline_path: str) -> int:
+    """Print per-case deltas against a baseline file; returns the regression count"""
+    with open(baseline_path) as baseline_file:
+        baseline = {
+            (case['producer'], case['kind'], case['seconds']): case
+            for case in json.load(baseline_file)['results']
+            if 'error' not in case
+        }
+
+    regressions = 0
+    print(f"\nCompared with {baseline_path}:")
+    for case in results:
+        before = baseline.get((case['producer'], case['kind'], case['seconds']))
+        if before is None or 'error' in case:
+            continue
+        flags = []
+        for metric in ('wall_s', 'cpu_s', 'peak_rss_mb'):
+            if before[metric] and case[metric] > before[metric] * (1 + REGRESSION_THRESHOLD):
+                flags.append(metric)
+        regressions += bool(flags)
+        print(
+            f"{case['producer']:<9}{case['kind']:<8}{case['seconds']:>6.0f}s  "
+            f"wall {before['wall_s']:8.2f} -> {case['wall_s']:8.2f}  "
+            f"rss {before['peak_rss_mb']:7.1f} -> {case['peak_rss_mb']:7.1f}"
+            + (f"  REGRESSION ({', '.join(flags)})" if flags else "")
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--producers', nargs='+', choices=list(PRODUCERS), default=list(PRODUCERS))
+    parser.add_argument('--kinds', nargs='+', choices=KINDS, default=list(KINDS))
+    parser.add_argument('--durations', nargs='+', type=float, default=list(DURATIONS))
+    parser.add_argument('--output', help='results file (default: results/<timestamp>.json)')
+    parser.add_argument('--compare', help='earlier results file to check for regressions')
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'producer':<9}{'kind':<8}{'length':>7}{'wall':>9}{'cpu':>9}{'rss MB':>9}{'x rt':>8}")
+    for seconds in args.durations:
+        for kind in args.kinds:
+            for producer in args.producers:
+                case = measure(producer, kind, seconds)
+                results.append(case)
+                if 'error' in case:
+                    print(f"{producer:<9}{kind:<8}{seconds:>6.0f}s  failed: {case['error']}")
+                    continue
+                print(
+                    f"{producer:<9}{kind:<8}{seconds:>6.0f}s"
+                    f"{case['wall_s']:>9.2f}{case['cpu_s']:>9.2f}"
+                    f"{case['peak_rss_mb']:>9.1f}{case['realtime_factor']:>8.1f}"
+                )
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, time.strftime('%Y%m%d-%H%M%S') + '.json')
+    with open(output, 'w') as output_file:
+        json.dump({'environment': environment(), 'results': results}, output_file, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare and compare(results, args.compare):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
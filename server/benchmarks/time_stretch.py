@@ -0,0 +1,49 @@
+"""
+Cost and fidelity of each time-stretch mode over the synthetic corpus.
+
+For every mode and rate this reports the best wall time of the stretch
+alone, its speedup over the phase vocoder, and the output/input RMS ratio
+as a rough check that a mode neither drops nor piles up energy. Run from
+server/:
+
+    python -m benchmarks.time_stretch --seconds 180 --rates 0.98 0.9 0.75
+"""
+import argparse
+
+import numpy as np
+
+from benchmarks.corpus import KINDS, synthetic_track
+from benchmarks.block_engine import best_of
+from producers.audio_io import SAMPLE_RATE
+from producers.time_stretch import STRETCH_MODES
+
+
+def rms(y: np.ndarray) -> float:
+    return float(np.sqrt(np.mean(np.square(y, dtype=np.float64))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=180, help='synthetic track length')
+    parser.add_argument('--rates', nargs='+', type=float, default=[0.98, 0.9, 0.75])
+    parser.add_argument('--kinds', nargs='+', choices=KINDS, default=['drums', 'sines'])
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case; best is reported')
+    args = parser.parse_args()
+
+    print(f"{args.seconds:.0f}s tracks, best of {args.repeat}")
+    print(f"{'kind':<8}{'rate':>6}  {'mode':<15}{'time':>9}{'speedup':>9}{'rms':>7}")
+    for kind in args.kinds:
+        y = synthetic_track(kind, args.seconds, SAMPLE_RATE)
+        for rate in args.rates:
+            reference = None
+            for mode, stretch in STRETCH_MODES.items():
+                elapsed = best_of(args.repeat, lambda: stretch(y, rate))
+                reference = reference or elapsed
+                print(
+                    f"{kind:<8}{rate:>6.2f}  {mode:<15}{elapsed:>8.3f}s"
+                    f"{reference / elapsed:>8.1f}x{rms(stretch(y, rate)) / rms(y):>7.2f}"
+                )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+import os
+import io
+from collections import namedtuple
+
+import librosa
+import numpy as np
+
+from producers.tracing import span
+
+
+# Bump when the analysis below changes so stale entries are ignored
+ANALYSIS_VERSION = 1
+
+# Cached analyses kept on disk before the least recently used are dropped
+ANALYSIS_MAX_ENTRIES = int(os.getenv('ANALYSIS_MAX_ENTRIES', 500))
+
+BeatAnalysis = namedtuple('BeatAnalysis', ['tempo', 'beat_frames', 'onset_envelope'])
+
+
+def analyze_beats(y: np.ndarray, sr: int, hop_length: int = 512) -> BeatAnalysis:
+    """Onset envelope, tempo and beat frames of a whole track"""
+    with span('beat_track'):
+        onset_envelope = librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop_length)
+        tempo, beat_frames = librosa.beat.beat_track(
+            onset_envelope=onset_envelope, sr=sr, hop_length=hop_length
+        )
+    return BeatAnalysis(float(np.atleast_1d(tempo)[0]), beat_frames, onset_envelope)
+
+
+class AnalysisCache:
+    """
+    Persistent beat analyses keyed by audio content hash, sample rate and
+    hop length. Safe to share between worker processes: entries are written
+    atomically and a hit refreshes the file's mtime, which is the LRU order
+    used to trim the directory to max_entries.
+    """
+
+    def __init__(self, root: str, max_entries: int = ANALYSIS_MAX_ENTRIES):
+        self.root = root
+        self.max_entries = max_entries
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, content_hash: str, sr: int, hop_length: int) -> str:
+        return os.path.join(
+            self.root, f"{content_hash}_{sr}_{hop_length}_v{ANALYSIS_VERSION}.npz"
+        )
+
+    def load(self, content_hash: str, sr: int, hop_length: int):
+        path = self.path_for(content_hash, sr, hop_length)
+        try:
+            with np.load(path) as data:
+                analysis = BeatAnalysis(
+                    float(data['tempo']), data['beat_frames'], data['onset_envelope']
+                )
+        except (OSError, KeyError, ValueError):
+            return None
+        os.utime(path)
+        return analysis
+
+    def store(self, content_hash: str, sr: int, hop_length: int, analysis: BeatAnalysis):
+        path = self.path_for(content_hash, sr, hop_length)
+        buffer = io.BytesIO()
+        np.savez(buffer, **analysis._asdict())
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as output:
+            output.write(buffer.getvalue())
+        os.replace(tmp_path, path)
+        self._trim()
+
+    def _trim(self):
+        entries = []
+        for file in os.listdir(self.root):
+            if not file.endswith('.npz'):
+                continue
+            path = os.path.join(self.root, file)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                # Trimmed by another worker in the meantime
+                continue
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort()
+        for _, path in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def beat_analysis(
+    y: np.ndarray,
+    sr: int,
+    hop_length: int = 512,
+    cache: AnalysisCache = None,
+    content_hash: str = None
+) -> BeatAnalysis:
+    """Beat analysis of a track, served from the cache when it has been seen"""
+    if cache is None or content_hash is None:
+        return analyze_beats(y, sr, hop_length)
+
+    analysis = cache.load(content_hash, sr, hop_length)
+    if analysis is None:
+        analysis = analyze_beats(y, sr, hop_length)
+        cache.store(content_hash, sr, hop_length, analysis)
+    return analysis
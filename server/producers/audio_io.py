@@ -0,0 +1,73 @@
+import os
+import librosa
+import numpy as np
+import soundfile as sf
+
+
+# Constants for audio processing
+MAX_AUDIO_LENGTH = 600  # Maximum audio length in seconds
+SAMPLE_RATE = 44100  # Standard sample rate
+ENCODE_BLOCK = 65536  # Frames handed to the encoder per write
+
+# Sample format of every buffer passed between processing stages. Only
+# running sums and phase accumulators, which need the precision, use float64.
+DTYPE = np.float32
+
+
+def load_audio(input_path: str, sr: int = SAMPLE_RATE, duration: float = MAX_AUDIO_LENGTH):
+    """
+    Decode an upload once into a mono float32 buffer at the target rate.
+
+    The returned array is marked read-only so it can be shared safely
+    between producers; each producer copies before modifying it.
+    """
+    y, sr = librosa.load(
+        input_path,
+        sr=sr,
+        duration=duration,
+        mono=True,
+        dtype=DTYPE
+    )
+    y = np.ascontiguousarray(y, dtype=DTYPE)
+    y.setflags(write=False)
+    return y, sr
+
+
+def check_dtype(y: np.ndarray, stage: str) -> np.ndarray:
+    """Fail loudly when a stage hands on audio that is not float32"""
+    if y.dtype != DTYPE:
+        raise TypeError(f"{stage} produced {y.dtype} audio, expected {np.dtype(DTYPE)}")
+    return y
+
+
+def audio_duration(input_path: str) -> float:
+    """Length of an audio file in seconds, read from its headers where possible"""
+    try:
+        return sf.info(input_path).duration
+    except RuntimeError:
+        return librosa.get_duration(path=input_path)
+
+
+def open_encoder(output_path: str, sr: int, channels: int = 1):
+    """
+    Open a streaming encoder for output_path; the format follows the file
+    extension. Write float blocks to it and close it (or use it as a
+    context manager) to finish the file.
+    """
+    file_format = os.path.splitext(output_path)[1].lstrip('.').upper()
+    if file_format not in sf.available_formats():
+        file_format = None
+    return sf.SoundFile(
+        output_path,
+        mode='w',
+        samplerate=sr,
+        channels=channels,
+        format=file_format
+    )
+
+
+def write_audio(output_path: str, y: np.ndarray, sr: int, block_size: int = ENCODE_BLOCK):
+    """Encode a float buffer straight to output_path, one block at a time"""
+    with open_encoder(output_path, sr) as encoder:
+        for start in range(0, len(y), block_size):
+            encoder.write(y[start:start + block_size])
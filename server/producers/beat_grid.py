@@ -0,0 +1,69 @@
+from collections import namedtuple
+
+import numpy as np
+
+
+# Destination [dest_start, dest_end) of each beat slice and where it is read from
+SlicePlan = namedtuple('SlicePlan', ['dest_start', 'dest_end', 'src_start'])
+
+
+def swing_onsets(beat_times: np.ndarray, swing_amount: float) -> np.ndarray:
+    """Push every other beat late by a fraction of the first beat interval"""
+    swung = np.array(beat_times, dtype=np.float64)
+    if len(swung) > 1:
+        swung[1::2] += swing_amount * (swung[1] - swung[0])
+    return swung
+
+
+def plan_slices(
+    beat_samples: np.ndarray,
+    length: int,
+    quantize_strength: float,
+    rng: np.random.Generator,
+    jitter_probability: float = 0.3,
+    jitter_depth: float = 0.08
+) -> SlicePlan:
+    """
+    Work out where every beat slice lands, all beats at once.
+
+    Each slice runs from one beat onset to the next. A random subset of
+    slices (jitter_probability) is nudged early or late by up to
+    jitter_depth * (1 - quantize_strength) / 2 of its own length, clipped to
+    the track. Where a nudged slice overlaps the next one, the later slice
+    wins, so the returned destination ranges never overlap.
+    """
+    starts = np.asarray(beat_samples[:-1], dtype=np.int64)
+    ends = np.asarray(beat_samples[1:], dtype=np.int64)
+    src_start = starts.copy()
+
+    # Slices that begin or end past the (stretched) track are skipped
+    valid = (starts < length) & (ends < length)
+
+    gate = rng.random(len(starts)) < jitter_probability
+    jitter = rng.random(len(starts)) - 0.5
+    adjustment = np.trunc(
+        (ends - starts) * jitter_depth * (1 - quantize_strength) * jitter
+    ).astype(np.int64)
+    adjustment[~gate] = 0
+    dest_start = np.maximum(starts + adjustment, 0)
+    dest_end = np.minimum(ends + adjustment, length)
+
+    # Later slices overwrite earlier ones: end each slice where the first
+    # later valid slice begins
+    later_starts = np.where(valid, dest_start, length)
+    first_later = np.minimum.accumulate(later_starts[::-1])[::-1]
+    dest_end = np.minimum(dest_end, np.append(first_later[1:], length))
+
+    valid &= dest_end > dest_start
+    return SlicePlan(dest_start[valid], dest_end[valid], src_start[valid])
+
+
+def apply_slices(source: np.ndarray, plan: SlicePlan, out: np.ndarray = None) -> np.ndarray:
+    """Copy every planned slice of source into a silent output buffer"""
+    if out is None:
+        out = np.zeros_like(source)
+    for dest_start, dest_end, src_start in zip(
+        plan.dest_start.tolist(), plan.dest_end.tolist(), plan.src_start.tolist()
+    ):
+        out[dest_start:dest_end] = source[src_start:src_start + dest_end - dest_start]
+    return out
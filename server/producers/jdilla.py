@@ -1,15 +1,29 @@
 import librosa
-import soundfile as sf
 import numpy as np
 
-async def apply_j_dilla_effect(
+from producers.analysis import AnalysisCache, beat_analysis
+from producers.audio_io import DTYPE, ENCODE_BLOCK, check_dtype, load_audio
+from producers.beat_grid import apply_slices, plan_slices, swing_onsets
+from producers.streaming import Chain, Gain, Preemphasis, render
+from producers.time_stretch import time_stretch
+from producers.tracing import span
+
+def apply_j_dilla_effect(
     input_path: str, 
     output_path: str,
     task_id: str,
     swing_amount: float = 0.3,
     quantize_strength: float = 0.7,
     time_stretch_factor: float = 0.98,
-    lofi_amount: float = 0.4
+    lofi_amount: float = 0.4,
+    seed: int = 0,
+    stretch_mode: str = 'auto',
+    y: np.ndarray = None,
+    sr: int = None,
+    progress=None,
+    peaks=None,
+    analysis_cache: AnalysisCache = None,
+    content_hash: str = None
 ):
     """
     Process audio to sound like J Dilla style with:
@@ -17,61 +31,76 @@ async def apply_j_dilla_effect(
     - Swing quantization
     - Time stretching
     - Lo-fi effects
+
+    Pass a pre-decoded buffer as ``y``/``sr`` to skip decoding input_path,
+    a ``progress`` callback to receive the completed fraction (0-1), and a
+    PeaksBuilder as ``peaks`` to collect the waveform of the output.
+    With an ``analysis_cache`` and the upload's ``content_hash``, beat
+    tracking is computed once per track and reused by later renders.
+    All randomness comes from ``seed``, so a render is reproducible; pass
+    another seed for a different take. stretch_mode picks the time-stretch
+    backend (see producers.time_stretch); 'auto' uses the cheap time-domain
+    stretch for the usual near-unity drag.
     """
-    # Load the audio file
-    y, sr = librosa.load(input_path, sr=None)
+    # Load the audio file unless the shared decode stage already did
+    if y is None:
+        y, sr = load_audio(input_path)
+    rng = np.random.default_rng(seed)
     
     # Step 1: Beat detection
-    tempo, beat_frames = librosa.beat.beat_track(y=y, sr=sr, hop_length=512)
+    tempo, beat_frames, _ = beat_analysis(
+        y, sr, hop_length=512, cache=analysis_cache, content_hash=content_hash
+    )
     beat_times = librosa.frames_to_time(beat_frames, sr=sr)
+    if progress:
+        progress(0.25)
     
     # Step 2: Apply swing feel (J Dilla's signature swing)
-    swung_beats = []
-    for i, beat in enumerate(beat_times):
-        if i % 2 == 1:  # Apply swing to every other beat
-            swung_beats.append(beat + swing_amount * (beat_times[1] - beat_times[0]))
-        else:
-            swung_beats.append(beat)
+    swung_beats = swing_onsets(beat_times, swing_amount)
     
     # Step 3: Time stretching for that "dragging" feel
-    y_stretched = librosa.effects.time_stretch(y, rate=time_stretch_factor)
+    with span('time_stretch', mode=stretch_mode):
+        y_stretched = time_stretch(y, time_stretch_factor, mode=stretch_mode)
+    if progress:
+        progress(0.6)
     
     # Step 4: Lo-fi effect
+    # time_stretch hands back a fresh float32 array, so work on it in place
     bit_depth = 16 - int(10 * lofi_amount)  # Reduce bit depth for lo-fi effect
-    y_quantized = np.round(y_stretched * (2**(bit_depth-1))) / (2**(bit_depth-1))
+    y_lofi = check_dtype(y_stretched, "Time stretch")
+    with span('bitcrush', bit_depth=bit_depth):
+        y_lofi *= 2**(bit_depth-1)
+        np.round(y_lofi, out=y_lofi)
+        y_lofi /= 2**(bit_depth-1)
     
-    # Add vinyl crackle
-    crackle_amplitude = lofi_amount * 0.01
-    vinyl_crackle = np.random.normal(0, crackle_amplitude, len(y_quantized))
-    y_with_crackle = y_quantized + vinyl_crackle
+    # Add vinyl crackle, drawn as float32 a block at a time
+    crackle_amplitude = np.float32(lofi_amount * 0.01)
+    vinyl_crackle = np.empty(min(ENCODE_BLOCK, len(y_lofi)), dtype=DTYPE)
+    with span('crackle'):
+        for start in range(0, len(y_lofi), len(vinyl_crackle)):
+            crackle = vinyl_crackle[:len(y_lofi) - start]
+            rng.standard_normal(len(crackle), dtype=DTYPE, out=crackle)
+            crackle *= crackle_amplitude
+            y_lofi[start:start + len(crackle)] += crackle
     
     # Step 5: Slice and rearrange beats slightly
-    output_audio = np.zeros_like(y_with_crackle)
     beat_samples = librosa.time_to_samples(swung_beats, sr=sr)
+    with span('slice'):
+        plan = plan_slices(beat_samples, len(y_lofi), quantize_strength, rng)
+        output_audio = apply_slices(y_lofi, plan)
+    if progress:
+        progress(0.8)
     
-    for i in range(len(beat_samples) - 1):
-        start = beat_samples[i]
-        end = beat_samples[i+1]
-        
-        if end >= len(y_with_crackle) or start >= len(y_with_crackle):
-            continue
-            
-        segment = y_with_crackle[start:end]
-        
-        if np.random.random() > 0.7:
-            adjustment = int(len(segment) * 0.08 * (1 - quantize_strength) * (np.random.random() - 0.5))
-            start = max(0, start + adjustment)
-            end = min(len(output_audio), end + adjustment)
-        
-        if end <= len(output_audio) and end > start:
-            output_audio[start:end] = segment[:end-start]
-    
-    # Apply a subtle low-pass filter for warmth
-    output_audio = librosa.effects.preemphasis(output_audio, coef=0.95)
+    # Beat analysis and slicing need the whole track, but the finishing
+    # stages stream block by block into the encoder: a subtle low-pass
+    # filter for warmth, then make-up gain
     gain = 15.5
-    output_audio *= gain
-    
-    # Save the processed audio
-    sf.write(output_path, output_audio, sr)
-    
+    chain = Chain(Preemphasis(coef=0.95), Gain(gain))
+
+    def finishing_progress(fraction):
+        if progress:
+            progress(0.8 + 0.2 * fraction)
+
+    render(output_audio, chain, output_path, sr, progress=finishing_progress, peaks=peaks)
+
     return {"status": "complete", "file_path": output_path}
\ No newline at end of file
@@ -0,0 +1,129 @@
+import os
+import numpy as np
+
+from producers.audio_io import ENCODE_BLOCK
+
+
+# Samples per min/max bucket at the finest resolution (~12ms at 44.1kHz)
+PEAKS_BASE_BUCKET = 512
+
+# Each coarser level merges this many buckets of the one before it
+PEAKS_LEVEL_FACTOR = 4
+
+# Coarsest level kept; a waveform is never drawn with fewer bars than this
+PEAKS_MIN_BUCKETS = 64
+
+# Peaks are stored as int8 fractions of full scale
+PEAKS_SCALE = 127
+
+
+class PeaksBuilder:
+    """
+    Min/max envelope of a signal fed to it in blocks of any size. Buckets
+    straddling block boundaries are carried over, so the result does not
+    depend on how the signal was split.
+    """
+
+    def __init__(self, sr: int, bucket: int = PEAKS_BASE_BUCKET):
+        self.sr = sr
+        self.bucket = bucket
+        self.frames = 0
+        self._mins = []
+        self._maxs = []
+        self._carry = np.empty((2, 0), dtype=np.float32)
+
+    def add(self, block: np.ndarray):
+        block = np.asarray(block, dtype=np.float32)
+        if block.ndim > 1:
+            # Envelope across channels
+            lows, highs = block.min(axis=1), block.max(axis=1)
+        else:
+            lows = highs = block
+        self.frames += len(block)
+        lows = np.concatenate([self._carry[0], lows])
+        highs = np.concatenate([self._carry[1], highs])
+        whole = len(lows) // self.bucket * self.bucket
+        if whole:
+            self._mins.append(lows[:whole].reshape(-1, self.bucket).min(axis=1))
+            self._maxs.append(highs[:whole].reshape(-1, self.bucket).max(axis=1))
+        self._carry = np.stack([lows[whole:], highs[whole:]])
+
+    def finish(self) -> dict:
+        mins, maxs = list(self._mins), list(self._maxs)
+        if self._carry.shape[-1]:
+            mins.append(self._carry[0].min(keepdims=True))
+            maxs.append(self._carry[1].max(keepdims=True))
+        mins = np.concatenate(mins) if mins else np.zeros(1, dtype=np.float32)
+        maxs = np.concatenate(maxs) if maxs else np.zeros(1, dtype=np.float32)
+
+        levels = {}
+        bucket = self.bucket
+        while True:
+            levels[bucket] = _quantize(mins, maxs)
+            if len(mins) < PEAKS_MIN_BUCKETS * PEAKS_LEVEL_FACTOR:
+                break
+            mins, maxs = _merge(mins, maxs, PEAKS_LEVEL_FACTOR)
+            bucket *= PEAKS_LEVEL_FACTOR
+        return {'sr': self.sr, 'frames': self.frames, 'levels': levels}
+
+
+def _merge(mins: np.ndarray, maxs: np.ndarray, factor: int):
+    starts = np.arange(0, len(mins), factor)
+    return np.minimum.reduceat(mins, starts), np.maximum.reduceat(maxs, starts)
+
+
+def _quantize(mins: np.ndarray, maxs: np.ndarray) -> np.ndarray:
+    """Interleaved min/max pairs as int8"""
+    pairs = np.empty(2 * len(mins), dtype=np.int8)
+    pairs[0::2] = np.clip(np.floor(mins * PEAKS_SCALE), -PEAKS_SCALE, PEAKS_SCALE)
+    pairs[1::2] = np.clip(np.ceil(maxs * PEAKS_SCALE), -PEAKS_SCALE, PEAKS_SCALE)
+    return pairs
+
+
+def peaks_from_signal(y: np.ndarray, sr: int, block_size: int = ENCODE_BLOCK) -> dict:
+    builder = PeaksBuilder(sr)
+    for start in range(0, len(y), block_size):
+        builder.add(y[start:start + block_size])
+    return builder.finish()
+
+
+def write_peaks(path: str, peaks: dict):
+    """Store peaks as a small .npz, written atomically"""
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(
+        tmp_path,
+        sr=peaks['sr'],
+        frames=peaks['frames'],
+        **{f"level_{bucket}": pairs for bucket, pairs in peaks['levels'].items()}
+    )
+    os.replace(tmp_path, path)
+
+
+def read_peaks(path: str) -> dict:
+    with np.load(path) as data:
+        levels = {
+            int(name[len('level_'):]): data[name]
+            for name in data.files if name.startswith('level_')
+        }
+        return {'sr': int(data['sr']), 'frames': int(data['frames']), 'levels': levels}
+
+
+def select_peaks(peaks: dict, buckets: int):
+    """
+    About `buckets` min/max pairs covering the whole signal, taken from the
+    coarsest level that still has enough resolution and merged down to
+    size. Returns (samples per bucket, interleaved int8 min/max pairs).
+    """
+    levels = peaks['levels']
+    bucket = min(levels)
+    for size in sorted(levels):
+        if len(levels[size]) // 2 >= buckets:
+            bucket = size
+    pairs = levels[bucket]
+    factor = max(len(pairs) // 2 // max(buckets, 1), 1)
+    if factor > 1:
+        mins, maxs = _merge(pairs[0::2], pairs[1::2], factor)
+        pairs = np.empty(2 * len(mins), dtype=np.int8)
+        pairs[0::2], pairs[1::2] = mins, maxs
+        bucket *= factor
+    return bucket, pairs
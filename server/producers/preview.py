@@ -0,0 +1,62 @@
+import librosa
+import numpy as np
+
+
+# Length of a preview excerpt in seconds
+PREVIEW_SECONDS = 25.0
+
+# Previews are rendered at a reduced rate: the lowest MPEG-1 rate, since
+# the MPEG-2 rates (22.05/24kHz) do not decode cleanly block by block
+PREVIEW_SAMPLE_RATE = 32000
+
+# Frame size of the energy envelope used to pick the excerpt
+ENVELOPE_HOP = 1024
+
+# Fade at the excerpt edges so it does not start or stop with a click
+EDGE_FADE_SECONDS = 0.05
+
+
+def find_excerpt(y: np.ndarray, sr: int, seconds: float = PREVIEW_SECONDS):
+    """
+    Start and end sample of the most representative `seconds` of y: the
+    window with the most energy plus the most onsets, each normalised to
+    the best window so neither dominates. Onsets are counted as rises in
+    frame log-energy, a cheap stand-in for a beat tracker.
+    """
+    length = int(seconds * sr)
+    if len(y) <= length:
+        return 0, len(y)
+
+    frames = len(y) // ENVELOPE_HOP
+    framed = y[:frames * ENVELOPE_HOP].reshape(frames, ENVELOPE_HOP)
+    energy = np.einsum('ij,ij->i', framed, framed, dtype=np.float64) / ENVELOPE_HOP
+    flux = np.maximum(np.diff(np.log10(energy + 1e-10), prepend=0.0), 0.0)
+
+    window = max(length // ENVELOPE_HOP, 1)
+
+    def window_sums(values):
+        totals = np.cumsum(np.concatenate([[0.0], values]))
+        sums = totals[window:] - totals[:-window]
+        peak = sums.max()
+        return sums / peak if peak > 0 else sums
+
+    score = window_sums(energy) + window_sums(flux)
+    start = int(np.argmax(score)) * ENVELOPE_HOP
+    start = min(start, len(y) - length)
+    return start, start + length
+
+
+def preview_signal(y: np.ndarray, sr: int, seconds: float = PREVIEW_SECONDS):
+    """The preview excerpt of y, faded at the edges and resampled to PREVIEW_SAMPLE_RATE"""
+    start, end = find_excerpt(y, sr, seconds)
+    excerpt = np.array(y[start:end], dtype=np.float32)
+    if sr != PREVIEW_SAMPLE_RATE:
+        excerpt = librosa.resample(excerpt, orig_sr=sr, target_sr=PREVIEW_SAMPLE_RATE)
+        sr = PREVIEW_SAMPLE_RATE
+
+    fade = min(int(EDGE_FADE_SECONDS * sr), len(excerpt) // 2)
+    if fade:
+        ramp = np.linspace(0.0, 1.0, fade, dtype=np.float32)
+        excerpt[:fade] *= ramp
+        excerpt[-fade:] *= ramp[::-1]
+    return np.ascontiguousarray(excerpt, dtype=np.float32), sr
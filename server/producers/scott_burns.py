@@ -1,23 +1,25 @@
 import os
-import librosa
-import soundfile as sf
 import numpy as np
-import gc
+
+from producers.audio_io import DTYPE, load_audio
+from producers.streaming import BlockProcessor, Callback, Chain, Preemphasis, render
 
 
 # Constants for audio processing
 CHUNK_SIZE = 1024 * 1024  # 1MB chunks for file handling
-MAX_AUDIO_LENGTH = 600  # Maximum audio length in seconds
-SAMPLE_RATE = 44100  # Standard sample rate
 
-async def apply_scott_burns_effect(
+def apply_scott_burns_effect(
     input_path: str,
     output_path: str,
     task_id: str,
     bass_boost: float = 0.4,
     high_end_crisp: float = 0.3,
     drum_punch: float = 0.5,
-    distortion: float = 0.2
+    distortion: float = 0.2,
+    y: np.ndarray = None,
+    sr: int = None,
+    progress=None,
+    peaks=None
 ):
     """
     Process audio to sound like Scott Burns' death metal production style:
@@ -26,122 +28,166 @@ async def apply_scott_burns_effect(
     - Aggressive midrange
     - Tight drum processing
     - Controlled distortion
+
+    Pass a pre-decoded buffer as ``y``/``sr`` to skip decoding input_path,
+    a ``progress`` callback to receive the completed fraction (0-1), and a
+    PeaksBuilder as ``peaks`` to collect the waveform of the output.
     """
     try:
-        # Load audio with high quality settings
-        y, sr = librosa.load(
-            input_path,
-            sr=SAMPLE_RATE,
-            duration=MAX_AUDIO_LENGTH,
-            mono=True
-        )
-
-        # Early cleanup
-        if os.path.exists(input_path):
-            os.remove(input_path)
-        gc.collect()
-
-        # Process in chunks
-        chunk_size = sr * 2  # 2-second chunks
-        output = np.zeros_like(y)
-        
-        def process_chunk(chunk, _):
-            # Enhance low end (typical Scott Burns bass treatment)
-            bass_frequencies = librosa.effects.preemphasis(chunk, coef=-0.95)
-            bass_enhanced = bass_frequencies * (1 + bass_boost)
-            
-            # Add high-end crispness
-            high_frequencies = librosa.effects.preemphasis(chunk, coef=0.95)
-            high_enhanced = high_frequencies * (1 + high_end_crisp)
-            
-            # Combine frequencies with proper balance
-            processed = (bass_enhanced * 0.6 + high_enhanced * 0.4)
-            
-            # Add controlled distortion (characteristic of death metal production)
-            processed = np.tanh(processed * (1 + distortion))
-            
-            # Enhance transients for drum punch
-            if len(processed) > 1:
-                transients = np.diff(np.abs(processed), prepend=processed[0])
-                transient_mask = transients > np.mean(np.abs(transients))
-                processed[transient_mask] *= (1 + drum_punch)
-            
-            return processed
-
-        # Process audio in chunks
-        output = process_in_chunks(y, chunk_size, process_chunk)
-        del y
-        gc.collect()
-
-        # Final processing stage
-        def apply_final_processing(chunk, _):
-            # Add subtle harmonics (characteristic of analog gear)
-            harmonics = np.sin(2 * np.pi * np.arange(len(chunk)) * 2 / sr) * 0.02
-            chunk = chunk + harmonics
-            
-            # Aggressive but controlled compression
-            threshold = 0.3
-            ratio = 4.0
-            chunk_compressed = np.where(
-                np.abs(chunk) > threshold,
-                threshold + (np.abs(chunk) - threshold) / ratio * np.sign(chunk),
-                chunk
-            )
-            
-            return chunk_compressed
-
-        output = process_in_chunks(output, chunk_size, apply_final_processing)
+        # Load audio unless the shared decode stage already did
+        if y is None:
+            y, sr = load_audio(input_path)
+
+        # Stream the track through the chain into the encoder; filter
+        # history, transient statistics and harmonic phase carry over
+        # between blocks
+        chain = build_chain(sr, bass_boost, high_end_crisp, drum_punch, distortion)
 
         # Normalize while preserving some dynamics (Scott Burns style)
-        max_amplitude = np.max(np.abs(output))
-        if max_amplitude > 0:
-            output = output / max_amplitude * 0.95
-
-        # Save as MP3 with appropriate quality settings
-        temp_wav = output_path + '.temp.wav'
-        try:
-            # First save as WAV
-            sf.write(
-                temp_wav,
-                output,
-                sr,
-                format='WAV',
-                subtype='PCM_16'
-            )
-            
-            # Convert to MP3 using librosa and soundfile
-            y_wav, sr_wav = librosa.load(temp_wav, sr=None)
-            sf.write(
-                output_path,
-                y_wav,
-                sr_wav,
-                format='MP3'
-            )
-        finally:
-            # Clean up temporary WAV file
-            if os.path.exists(temp_wav):
-                os.remove(temp_wav)
-
-        del output
-        gc.collect()
+        render(y, chain, output_path, sr, normalize_to=0.95, progress=progress, peaks=peaks)
 
         return {"status": "complete", "file_path": output_path}
 
     except Exception as e:
         print(f"Error processing audio: {e}")
-        # Cleanup on error
-        for path in [input_path, output_path]:
-            if os.path.exists(path):
-                os.remove(path)
-        gc.collect()
+        # Cleanup on error; the upload is shared, so only drop our output
+        if os.path.exists(output_path):
+            os.remove(output_path)
         raise
 
-def process_in_chunks(y: np.ndarray, chunk_size: int, process_func):
-    """Process audio data in chunks to reduce memory usage"""
-    chunks = []
-    for i in range(0, len(y), chunk_size):
-        chunk = y[i:i + chunk_size]
-        processed_chunk = process_func(chunk, i)  # Pass chunk index
-        chunks.append(processed_chunk)
-        gc.collect()  # Clean up after each chunk
-    return np.concatenate(chunks)
\ No newline at end of file
+
+def build_chain(
+    sr: int,
+    bass_boost: float,
+    high_end_crisp: float,
+    drum_punch: float,
+    distortion: float
+) -> Chain:
+    """The Scott Burns effect chain, one stateful processor per stage"""
+
+    def distort(processor, block):
+        # Add controlled distortion (characteristic of death metal production)
+        block *= 1 + distortion
+        np.tanh(block, out=block)
+        return block
+
+    def compress(processor, block):
+        # Aggressive but controlled compression:
+        # threshold + (|x| - threshold) / ratio * sign(x) above threshold
+        threshold = 0.3
+        ratio = 4.0
+        level = processor.scratch('level', len(block))
+        sign = processor.scratch('sign', len(block))
+        over = processor.scratch('over', len(block), dtype=bool)
+        np.abs(block, out=level)
+        np.greater(level, threshold, out=over)
+        np.sign(block, out=sign)
+        level -= threshold
+        level /= ratio
+        level *= sign
+        level += threshold
+        np.copyto(block, level, where=over)
+        return block
+
+    return Chain(
+        BandBalance(bass_boost, high_end_crisp),
+        Callback(distort, name='tanh'),
+        DrumPunch(drum_punch),
+        Harmonics(sr),
+        Callback(compress, name='compression'),
+    )
+
+
+class BandBalance(BlockProcessor):
+    """Blend boosted lows and highs, each split off by a preemphasis filter"""
+
+    name = 'preemphasis'
+
+    def __init__(self, bass_boost: float, high_end_crisp: float):
+        self.bass_boost = bass_boost
+        self.high_end_crisp = high_end_crisp
+        # Enhance low end (typical Scott Burns bass treatment)
+        self.bass = Preemphasis(coef=-0.95)
+        # Add high-end crispness
+        self.high = Preemphasis(coef=0.95)
+
+    def process(self, block):
+        high = self.scratch('high', len(block))
+        np.copyto(high, block)
+        high = self.high.process(high)
+        block = self.bass.process(block)
+        # Combine frequencies with proper balance
+        block *= (1 + self.bass_boost) * 0.6
+        high *= (1 + self.high_end_crisp) * 0.4
+        block += high
+        return block
+
+
+class DrumPunch(BlockProcessor):
+    """
+    Enhance transients for drum punch: boost samples whose envelope rises
+    faster than the average rise over the track so far
+    """
+
+    name = 'drum_punch'
+
+    def __init__(self, drum_punch: float):
+        self.drum_punch = drum_punch
+        self.previous = None
+        self.rise_total = 0.0
+        self.rise_count = 0
+
+    def process(self, block):
+        n = len(block)
+        if n == 0:
+            return block
+        envelope = self.scratch('envelope', n)
+        transients = self.scratch('transients', n)
+        rises = self.scratch('rises', n, dtype=np.float64)
+        mask = self.scratch('mask', n, dtype=bool)
+        np.abs(block, out=envelope)
+        previous = block[0] if self.previous is None else self.previous
+        self.previous = envelope[-1]
+        transients[0] = envelope[0] - previous
+        np.subtract(envelope[1:], envelope[:-1], out=transients[1:])
+
+        # Causal running mean of the rise up to and including each sample
+        np.abs(transients, out=envelope)
+        np.cumsum(envelope, out=rises)
+        rises += self.rise_total
+        self.rise_total = float(rises[-1])
+        rises /= self.counts(n)
+        self.rise_count += n
+
+        np.greater(transients, rises, out=mask)
+        np.multiply(block, 1 + self.drum_punch, out=block, where=mask)
+        return block
+
+    def counts(self, n: int) -> np.ndarray:
+        counts = self.scratch('counts', n, dtype=np.float64)
+        np.add(self.ramp(n), self.rise_count + 1, out=counts)
+        return counts
+
+
+class Harmonics(BlockProcessor):
+    """Add subtle harmonics (characteristic of analog gear), phase-continuous"""
+
+    def __init__(self, sr: int, frequency: float = 2.0, level: float = 0.02):
+        self.sr = sr
+        self.frequency = frequency
+        self.level = level
+        self.step = 2 * np.pi * frequency / sr
+        # Start phase of the next block, kept as a float64 wrapped to one
+        # turn so the float32 per-sample phase never loses precision
+        self.start_phase = 0.0
+
+    def process(self, block):
+        n = len(block)
+        phase = self.scratch('phase', n)
+        np.multiply(self.ramp(n, dtype=DTYPE), np.float32(self.step), out=phase)
+        phase += np.float32(self.start_phase)
+        self.start_phase = (self.start_phase + n * self.step) % (2 * np.pi)
+        np.sin(phase, out=phase)
+        phase *= self.level
+        block += phase
+        return block
@@ -1,22 +1,24 @@
 import os
-import librosa
-import soundfile as sf
 import numpy as np
-import gc
+
+from producers.audio_io import DTYPE, load_audio
+from producers.streaming import BlockProcessor, Callback, Chain, Delay, render
 
 
 # Constants for audio processing
 CHUNK_SIZE = 1024 * 1024  # 1MB chunks for file handling
-MAX_AUDIO_LENGTH = 600  # Maximum audio length in seconds
-SAMPLE_RATE = 44100  # Standard sample rate
 
-async def apply_steve_albini_effect(
+def apply_steve_albini_effect(
     input_path: str,
     output_path: str,
     task_id: str,
     dynamics_ratio: float = 0.8,
     noise_floor: float = 0.005,
-    saturation: float = 0.3
+    saturation: float = 0.3,
+    y: np.ndarray = None,
+    sr: int = None,
+    progress=None,
+    peaks=None
 ):
     """
     Process audio to sound like Steve Albini's recording style:
@@ -24,107 +26,94 @@ async def apply_steve_albini_effect(
     - Slight analog saturation
     - Natural room ambience
     - Raw, punchy character
+
+    Pass a pre-decoded buffer as ``y``/``sr`` to skip decoding input_path,
+    a ``progress`` callback to receive the completed fraction (0-1), and a
+    PeaksBuilder as ``peaks`` to collect the waveform of the output.
     """
     try:
-        # Load audio with high quality settings
-        y, sr = librosa.load(
-            input_path,
-            sr=SAMPLE_RATE,
-            duration=MAX_AUDIO_LENGTH,
-            mono=True
-        )
-
-        # Process in smaller chunks to manage memory
-        chunk_size = sr * 2  # 2-second chunks
-        output = np.zeros_like(y)
-        
-        for i in range(0, len(y), chunk_size):
-            chunk = y[i:min(i + chunk_size, len(y))]
-            
-            # Add subtle analog noise
-            noise = np.random.normal(0, noise_floor, len(chunk))
-            chunk = chunk + noise
-            
-            # Apply subtle tape saturation
-            chunk = np.tanh(chunk * (1 + saturation)) / (1 + saturation)
-            
-            # Preserve dynamics (anti-compression)
-            peaks = np.abs(chunk) > dynamics_ratio
-            chunk[peaks] *= 1.2  # Enhance peaks
-            
-            # Enhance transients
-            if len(chunk) > 1:
-                envelope = np.abs(chunk)
-                transients = np.diff(envelope, prepend=envelope[0]) > 0.1
-                chunk[transients] *= 1.3
-            
-            # Store processed chunk
-            chunk_end = min(i + chunk_size, len(output))
-            output[i:chunk_end] = chunk[:chunk_end-i]
-            
-            # Force garbage collection
-            del chunk
-            gc.collect()
-
-        # Add room ambience as a separate pass
-        room_delay = int(sr * 0.02)  # 20ms room reflection
-        if len(output) > room_delay:
-            room = np.zeros_like(output)
-            room[room_delay:] = output[:-room_delay] * 0.1
-            output = output + room
-            del room
-            gc.collect()
+        # Load audio unless the shared decode stage already did
+        if y is None:
+            y, sr = load_audio(input_path)
+
+        # Stream the track through the chain into the encoder; the room
+        # reflection and transient envelope carry over between blocks
+        chain = build_chain(sr, dynamics_ratio, noise_floor, saturation)
 
         # Normalize while preserving dynamics
-        max_amplitude = np.max(np.abs(output))
-        if max_amplitude > 0:
-            output = output / max_amplitude * 0.9
-
-        # Save as MP3 format
-        temp_wav = output_path + '.temp.wav'
-        try:
-            # First save as WAV
-            sf.write(
-                temp_wav,
-                output,
-                sr,
-                format='WAV',
-                subtype='PCM_16'
-            )
-            
-            # Convert to MP3 using librosa and soundfile
-            y_wav, sr_wav = librosa.load(temp_wav, sr=None)
-            sf.write(
-                output_path,
-                y_wav,
-                sr_wav,
-                format='MP3'
-            )
-        finally:
-            # Clean up temporary WAV file
-            if os.path.exists(temp_wav):
-                os.remove(temp_wav)
-
-        del output
-        gc.collect()
+        render(y, chain, output_path, sr, normalize_to=0.9, progress=progress, peaks=peaks)
 
         return {"status": "complete", "file_path": output_path}
 
     except Exception as e:
         print(f"Error processing audio: {e}")
-        # Cleanup on error
-        for path in [input_path, output_path]:
-            if os.path.exists(path):
-                os.remove(path)
-        gc.collect()
+        # Cleanup on error; the upload is shared, so only drop our output
+        if os.path.exists(output_path):
+            os.remove(output_path)
         raise
-    
-def process_in_chunks(y: np.ndarray, chunk_size: int, process_func):
-    """Process audio data in chunks to reduce memory usage"""
-    chunks = []
-    for i in range(0, len(y), chunk_size):
-        chunk = y[i:i + chunk_size]
-        processed_chunk = process_func(chunk, i)  # Pass chunk index
-        chunks.append(processed_chunk)
-        gc.collect()  # Clean up after each chunk
-    return np.concatenate(chunks)
\ No newline at end of file
+
+
+def build_chain(sr: int, dynamics_ratio: float, noise_floor: float, saturation: float) -> Chain:
+    """The Albini effect chain, one stateful processor per stage"""
+
+    noise_rng = np.random.default_rng()
+    noise_level = np.float32(noise_floor)
+
+    def add_noise(processor, block):
+        # Add subtle analog noise, drawn as float32 into reused scratch
+        noise = processor.scratch('noise', len(block))
+        noise_rng.standard_normal(len(block), dtype=DTYPE, out=noise)
+        noise *= noise_level
+        block += noise
+        return block
+
+    def saturate(processor, block):
+        # Apply subtle tape saturation
+        block *= 1 + saturation
+        np.tanh(block, out=block)
+        block /= 1 + saturation
+        return block
+
+    def enhance_peaks(processor, block):
+        # Preserve dynamics (anti-compression)
+        level = processor.scratch('level', len(block))
+        peaks = processor.scratch('peaks', len(block), dtype=bool)
+        np.abs(block, out=level)
+        np.greater(level, dynamics_ratio, out=peaks)
+        np.multiply(block, 1.2, out=block, where=peaks)
+        return block
+
+    return Chain(
+        Callback(add_noise),
+        Callback(saturate, name='tanh'),
+        Callback(enhance_peaks),
+        TransientEnhancer(threshold=0.1, boost=1.3),
+        Delay(int(sr * 0.02), mix=0.1, name='room_delay'),  # 20ms room reflection
+    )
+
+
+class TransientEnhancer(BlockProcessor):
+    """Boost samples where the envelope jumps by more than threshold"""
+
+    name = 'transients'
+
+    def __init__(self, threshold: float, boost: float):
+        self.threshold = threshold
+        self.boost = boost
+        self.previous = None
+
+    def process(self, block):
+        n = len(block)
+        if n == 0:
+            return block
+        envelope = self.scratch('envelope', n)
+        rise = self.scratch('rise', n)
+        transients = self.scratch('transients', n, dtype=bool)
+        np.abs(block, out=envelope)
+        previous = envelope[0] if self.previous is None else self.previous
+        self.previous = envelope[-1]
+        rise[0] = envelope[0] - previous
+        np.subtract(envelope[1:], envelope[:-1], out=rise[1:])
+        np.greater(rise, self.threshold, out=transients)
+        np.multiply(block, self.boost, out=block, where=transients)
+        return block
@@ -0,0 +1,248 @@
+import tempfile
+import numpy as np
+
+from producers import tracing
+from producers.audio_io import DTYPE, ENCODE_BLOCK, check_dtype, open_encoder
+
+
+# Frames per block pushed through an effect chain
+BLOCK_SIZE = ENCODE_BLOCK
+
+
+class BlockProcessor:
+    """
+    A stateful effect that processes audio one block at a time. Anything
+    that depends on earlier samples (filter history, envelopes, delay
+    lines) is carried across calls, so the output is continuous no matter
+    where the block boundaries fall.
+
+    process() owns the block it is given: it works in place and returns
+    it, using scratch() buffers that are allocated once and reused for
+    every block instead of producing new arrays.
+
+    name is the stage's span name when a chain is traced.
+    """
+
+    name = None
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def scratch(self, name: str, n: int, dtype=DTYPE) -> np.ndarray:
+        """A reusable work array of n elements, reallocated only to grow"""
+        buffers = self.__dict__.setdefault('_buffers', {})
+        buffer = buffers.get(name)
+        if buffer is None or len(buffer) < n or buffer.dtype != dtype:
+            buffer = buffers[name] = np.empty(n, dtype=dtype)
+        return buffer[:n]
+
+    def ramp(self, n: int, dtype=np.float64) -> np.ndarray:
+        """The sample offsets 0..n-1, built once per dtype and reused"""
+        ramps = self.__dict__.setdefault('_ramps', {})
+        ramp = ramps.get(dtype)
+        if ramp is None or len(ramp) < n:
+            ramp = ramps[dtype] = np.arange(n, dtype=dtype)
+        return ramp[:n]
+
+
+class Chain(BlockProcessor):
+    """
+    Run a block through several processors in order. When tracing, the time
+    each processor takes is summed over all blocks in `totals`.
+    """
+
+    def __init__(self, *processors):
+        self.processors = processors
+        self.totals = tracing.SpanTotals() if tracing.enabled() else None
+        self._steps = [
+            tracing.timed(processor.process, self.totals, processor.name or type(processor).__name__.lower())
+            for processor in processors
+        ]
+
+    def process(self, block):
+        for step in self._steps:
+            block = step(block)
+        return block
+
+
+class Preemphasis(BlockProcessor):
+    """
+    First-order preemphasis filter, y[n] = x[n] - coef * x[n - 1], with
+    its history carried between blocks. The first block is seeded the same
+    way librosa.effects.preemphasis seeds a whole signal.
+    """
+
+    name = 'preemphasis'
+
+    def __init__(self, coef: float):
+        self.coef = coef
+        self.state = None
+
+    def process(self, block):
+        n = len(block)
+        if n == 0:
+            return block
+        if self.state is None:
+            self.state = 2 * block[0] - block[1] if n > 1 else 0.0
+        last = block[-1]
+        history = self.scratch('history', n - 1)
+        np.multiply(block[:-1], -self.coef, out=history)
+        block[1:] += history
+        block[0] += self.state
+        self.state = -self.coef * last
+        return block
+
+
+class Gain(BlockProcessor):
+    name = 'gain'
+
+    def __init__(self, gain: float):
+        self.gain = gain
+
+    def process(self, block):
+        block *= self.gain
+        return block
+
+
+class Delay(BlockProcessor):
+    """Mix in a delayed copy of the signal, e.g. a single room reflection"""
+
+    name = 'delay'
+
+    def __init__(self, delay: int, mix: float, name: str = None):
+        self.delay = delay
+        self.name = name or self.name
+        self.mix = mix
+        self.history = np.zeros(delay, dtype=DTYPE)
+        self.next_history = np.zeros(delay, dtype=DTYPE)
+
+    def process(self, block):
+        n, d = len(block), self.delay
+        if d == 0:
+            block *= 1 + self.mix
+            return block
+
+        # Remember the last d input samples before the block is modified
+        if n >= d:
+            self.next_history[:] = block[n - d:]
+        else:
+            self.next_history[:d - n] = self.history[n:]
+            self.next_history[d - n:] = block
+
+        if n > d:
+            delayed = self.scratch('delayed', n - d)
+            np.multiply(block[:n - d], self.mix, out=delayed)
+            block[d:] += delayed
+        head = min(n, d)
+        delayed = self.scratch('head', head)
+        np.multiply(self.history[:head], self.mix, out=delayed)
+        block[:head] += delayed
+
+        self.history, self.next_history = self.next_history, self.history
+        return block
+
+
+class Callback(BlockProcessor):
+    """
+    Wrap a stateless per-sample function as a block processor. The function
+    gets the processor (for scratch buffers) and the block, and must modify
+    the block in place and return it. The span name defaults to the
+    function's.
+    """
+
+    def __init__(self, func, name: str = None):
+        self.func = func
+        self.name = name or func.__name__
+
+    def process(self, block):
+        return self.func(self, block)
+
+
+def iter_blocks(y: np.ndarray, block_size: int = BLOCK_SIZE):
+    for start in range(0, len(y), block_size):
+        yield start, y[start:start + block_size]
+
+
+def _encode(encoder, totals, peaks):
+    """encoder.write, timed into totals and feeding peaks when given"""
+    write = tracing.timed(encoder.write, totals, 'encode')
+    if peaks is None:
+        return write
+
+    def write_and_measure(block):
+        write(block)
+        peaks.add(block)
+
+    return write_and_measure
+
+
+def render(
+    y: np.ndarray,
+    chain: BlockProcessor,
+    output_path: str,
+    sr: int,
+    normalize_to: float = None,
+    block_size: int = BLOCK_SIZE,
+    progress=None,
+    peaks=None
+):
+    """
+    Stream y through an effect chain into the encoder for output_path.
+
+    Each block is copied into one preallocated work buffer, which the
+    chain then processes in place, so y itself is never modified.
+
+    Without normalization this is a single pass and only one block is ever
+    resident. Peak normalization needs the whole track's peak before the
+    first block can be encoded, so the chain output is parked in a
+    disk-backed scratch buffer and scaled on a second pass; memory stays
+    O(block) either way.
+
+    When the chain is traced, each of its stages and the encoder are
+    recorded as one span each once the track is done. Every block written
+    to the encoder is also added to peaks (a PeaksBuilder) when given, so
+    the waveform is drawn without decoding the output again.
+    """
+    check_dtype(y, "Producer")
+    total = max(len(y), 1)
+    work = np.empty(block_size, dtype=DTYPE)
+    totals = getattr(chain, 'totals', None)
+
+    if normalize_to is None:
+        with open_encoder(output_path, sr) as encoder:
+            encode = _encode(encoder, totals, peaks)
+            for start, block in iter_blocks(y, block_size):
+                buffer = work[:len(block)]
+                np.copyto(buffer, block)
+                encode(check_dtype(chain.process(buffer), "Effect chain"))
+                if progress:
+                    progress((start + len(block)) / total)
+        if totals is not None:
+            totals.record()
+        return
+
+    with tempfile.TemporaryFile() as scratch_file:
+        scratch = np.memmap(scratch_file, dtype=DTYPE, mode='w+', shape=(total,))
+        peak = 0.0
+        for start, block in iter_blocks(y, block_size):
+            buffer = work[:len(block)]
+            np.copyto(buffer, block)
+            processed = check_dtype(chain.process(buffer), "Effect chain")
+            scratch[start:start + len(processed)] = processed
+            if len(processed):
+                peak = max(peak, float(np.max(processed)), -float(np.min(processed)))
+            if progress:
+                progress(0.8 * (start + len(block)) / total)
+
+        scale = normalize_to / peak if peak > 0 else 1.0
+        with open_encoder(output_path, sr) as encoder:
+            encode = _encode(encoder, totals, peaks)
+            for start, block in iter_blocks(scratch[:len(y)], block_size):
+                buffer = work[:len(block)]
+                np.multiply(block, scale, out=buffer)
+                encode(buffer)
+                if progress:
+                    progress(0.8 + 0.2 * (start + len(block)) / total)
+        del scratch
+    if totals is not None:
+        totals.record()
@@ -0,0 +1,117 @@
+import librosa
+import numpy as np
+
+
+# Rates within this distance of 1.0 count as near-unity for the 'auto' mode
+NEAR_UNITY = 0.1
+
+# WSOLA frame, hop and alignment search, in samples
+WSOLA_FRAME = 2048
+WSOLA_TOLERANCE = 256
+# Alignment is searched on a decimated copy of the signal; frames are still
+# placed at full resolution
+WSOLA_DECIMATION = 4
+
+# Output samples interpolated per step by the varispeed resampler
+RESAMPLE_BLOCK = 65536
+
+
+def stretched_length(n: int, rate: float) -> int:
+    return int(round(n / rate))
+
+
+def phase_vocoder(y: np.ndarray, rate: float) -> np.ndarray:
+    """STFT phase vocoder: best quality at any rate, and the most expensive"""
+    return librosa.effects.time_stretch(y, rate=rate).astype(np.float32, copy=False)
+
+
+def wsola(y: np.ndarray, rate: float) -> np.ndarray:
+    """
+    Waveform-similarity overlap-add in the time domain. Each Hann frame is
+    read near its nominal position, shifted by up to WSOLA_TOLERANCE samples
+    to line up with the natural continuation of the previous frame, so
+    pitch is kept and there is no STFT. Transparent for near-unity rates.
+    """
+    frame = WSOLA_FRAME
+    hop = frame // 2
+    tolerance = WSOLA_TOLERANCE
+    step = WSOLA_DECIMATION
+
+    length = stretched_length(len(y), rate)
+    frames = length // hop + 2
+    padded = np.zeros(int(frames * hop * rate) + frame * 3 + tolerance * 2, dtype=np.float32)
+    padded[tolerance + frame:tolerance + frame + len(y)] = y
+    coarse = padded[::step]
+
+    window = np.hanning(frame + 1)[:frame].astype(np.float32)
+    output = np.zeros(frames * hop + frame, dtype=np.float32)
+    template_length = hop // step
+    search = 2 * tolerance // step
+
+    # The first frame starts half a frame early so output sample 0 lines up
+    # with input sample 0 at full gain
+    position = tolerance + frame - hop
+    for k in range(frames):
+        if k:
+            # Natural continuation of the previous frame against candidate
+            # positions around the nominal one
+            continuation = position + hop
+            nominal = int(round(k * hop * rate)) + tolerance + frame - hop
+            template = coarse[continuation // step:continuation // step + template_length]
+            start = (nominal - tolerance) // step
+            candidates = coarse[start:start + search + template_length]
+            if len(template) == template_length and len(candidates) == search + template_length:
+                scores = np.correlate(candidates, template, mode='valid')
+                position = (start + int(np.argmax(scores))) * step
+            else:
+                position = nominal
+        output[k * hop:k * hop + frame] += window * padded[position:position + frame]
+
+    return output[hop:hop + length]
+
+
+def resample(y: np.ndarray, rate: float) -> np.ndarray:
+    """
+    Varispeed: read the track faster or slower by linear interpolation.
+    Cheapest of all, but pitch moves with the rate like a tape slowing down.
+    """
+    length = stretched_length(len(y), rate)
+    output = np.empty(length, dtype=np.float32)
+    if len(y) < 2:
+        output[:] = y[0] if len(y) else 0.0
+        return output
+    # Blend each pair of neighbouring samples a block at a time, so only
+    # the block's positions are ever held as float64. Reads past the end
+    # hold the last sample, as np.interp does.
+    last = len(y) - 1
+    for start in range(0, length, RESAMPLE_BLOCK):
+        positions = np.arange(start, min(start + RESAMPLE_BLOCK, length), dtype=np.float64) * rate
+        np.minimum(positions, last, out=positions)
+        index = np.minimum(positions.astype(np.intp), last - 1)
+        fraction = (positions - index).astype(np.float32)
+        block = output[start:start + len(positions)]
+        np.subtract(y[index + 1], y[index], out=block)
+        block *= fraction
+        block += y[index]
+    return output
+
+
+STRETCH_MODES = {
+    'phase_vocoder': phase_vocoder,
+    'wsola': wsola,
+    'resample': resample,
+}
+
+
+def time_stretch(y: np.ndarray, rate: float, mode: str = 'auto') -> np.ndarray:
+    """
+    Time-stretch y by rate (below 1 is slower). 'auto' uses WSOLA for
+    near-unity rates and the phase vocoder for everything else.
+    """
+    if mode == 'auto':
+        mode = 'wsola' if abs(1 - rate) <= NEAR_UNITY else 'phase_vocoder'
+    if mode not in STRETCH_MODES:
+        raise ValueError(f"Unknown time-stretch mode: {mode}")
+    if rate == 1:
+        return np.array(y, dtype=np.float32)
+    return STRETCH_MODES[mode](y, rate)
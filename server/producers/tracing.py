@@ -0,0 +1,135 @@
+"""
+Timing spans for the remix pipeline. Each span is written to stdout as a
+JSON line tagged with the task and producer it ran for, and added to the
+in-process METRICS registry.
+
+Tracing is off unless TRACING=1. While it is off span() and bind() hand
+back one shared no-op context manager and timed() returns the function it
+was given, so instrumented code pays a function call per stage at most.
+"""
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager, nullcontext
+
+
+TRACING = os.getenv('TRACING', '0') == '1'
+
+# Tags (task_id, producer, ...) applied to every span in the current context
+_tags = contextvars.ContextVar('trace_tags', default={})
+
+_NO_SPAN = nullcontext()
+
+
+class Metrics:
+    """Count, total and longest duration of every span name, per producer"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans = {}
+
+    def observe(self, name: str, producer: str, seconds: float):
+        with self._lock:
+            entry = self._spans.setdefault(
+                (name, producer), {'count': 0, 'total_s': 0.0, 'max_s': 0.0}
+            )
+            entry['count'] += 1
+            entry['total_s'] += seconds
+            entry['max_s'] = max(entry['max_s'], seconds)
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [
+                {'span': name, 'producer': producer, **entry}
+                for (name, producer), entry in sorted(self._spans.items(), key=str)
+            ]
+
+    def reset(self):
+        with self._lock:
+            self._spans = {}
+
+
+METRICS = Metrics()
+
+
+def enabled() -> bool:
+    return TRACING
+
+
+def record(name: str, seconds: float, **tags):
+    """Log a finished span and add it to the metrics"""
+    tags = {**_tags.get(), **tags}
+    METRICS.observe(name, tags.get('producer'), seconds)
+    print(json.dumps({'span': name, 'seconds': round(seconds, 6), 'at': time.time(), **tags}), flush=True)
+
+
+@contextmanager
+def _span(name: str, tags: dict):
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        tags['error'] = type(e).__name__
+        raise
+    finally:
+        record(name, time.perf_counter() - start, **tags)
+
+
+def span(name: str, **tags):
+    """Time the block as a span called name"""
+    if not TRACING:
+        return _NO_SPAN
+    return _span(name, tags)
+
+
+@contextmanager
+def _bind(tags: dict):
+    token = _tags.set({**_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+def bind(**tags):
+    """Tag every span recorded in the block, e.g. with task_id and producer"""
+    if not TRACING:
+        return _NO_SPAN
+    return _bind(tags)
+
+
+class SpanTotals:
+    """
+    Time summed over many short calls, such as the blocks of one effect
+    stage, so that each name is recorded once instead of once per call
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+
+    def add(self, name: str, seconds: float):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def record(self, **tags):
+        for name, seconds in self.seconds.items():
+            record(name, seconds, calls=self.calls[name], **tags)
+        self.seconds, self.calls = {}, {}
+
+
+def timed(func, totals: SpanTotals, name: str):
+    """func, adding the time of every call to totals under name; func itself without totals"""
+    if totals is None:
+        return func
+
+    def timed_call(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            totals.add(name, time.perf_counter() - start)
+
+    return timed_call
@@ -0,0 +1,68 @@
+import os
+import time
+
+import pytest
+
+from app.cache import ResultCache
+
+
+@pytest.fixture
+def source(tmp_path):
+    sources = tmp_path / 'processed'
+    sources.mkdir()
+
+    def source(name: str, size: int = 100) -> str:
+        path = sources / name
+        path.write_bytes(b'x' * size)
+        os.utime(path, (1000, 1000))
+        return str(path)
+
+    return source
+
+
+def test_hits_from_any_process_protect_entries_from_eviction(tmp_path, source):
+    api = ResultCache(str(tmp_path / 'cache'), 250, 'v1')
+    worker = ResultCache(str(tmp_path / 'cache'), 250, 'v1')
+
+    worker.store('first', '.mp3', source('first.mp3'))
+    time.sleep(0.01)
+    worker.store('second', '.mp3', source('second.mp3'))
+    time.sleep(0.01)
+    assert api.lookup('first', '.mp3')
+    time.sleep(0.01)
+    worker.store('third', '.mp3', source('third.mp3'))
+
+    assert api.lookup('first', '.mp3')
+    assert api.lookup('second', '.mp3') is None
+    assert api.lookup('third', '.mp3')
+
+
+def test_budget_is_shared_by_every_process(tmp_path, source):
+    caches = [ResultCache(str(tmp_path / 'cache'), 250, 'v1') for _ in range(3)]
+
+    for i, cache in enumerate(caches):
+        cache.store(f'key{i}', '.mp3', source(f'{i}.mp3'))
+        time.sleep(0.01)
+
+    sizes = [entry.stat().st_size for entry in (tmp_path / 'cache').glob('*.mp3')]
+    assert sum(sizes) <= 250
+
+
+def test_hits_leave_published_outputs_unmodified(tmp_path, source):
+    cache = ResultCache(str(tmp_path / 'cache'), 1000, 'v1')
+    cache.store('key', '.mp3', source('render.mp3'))
+    output_path = str(tmp_path / 'processed' / 'again.mp3')
+
+    assert cache.publish('key', '.mp3', output_path)
+    assert cache.lookup('key', '.mp3')
+
+    assert os.path.getmtime(tmp_path / 'processed' / 'render.mp3') == 1000
+    assert os.path.getmtime(output_path) == 1000
+
+
+def test_newest_entry_is_kept_even_over_budget(tmp_path, source):
+    cache = ResultCache(str(tmp_path / 'cache'), 50, 'v1')
+    cache.store('key', '.mp3', source('render.mp3'))
+
+    assert cache.lookup('key', '.mp3')
+    assert not cache.publish('missing', '.mp3', str(tmp_path / 'out.mp3'))
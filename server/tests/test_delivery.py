@@ -0,0 +1,124 @@
+from email.utils import formatdate
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.delivery import byte_range, file_response
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=0-99', (0, 99)),
+    ('bytes=100-', (100, 999)),
+    ('bytes=990-2000', (990, 999)),
+    ('bytes=-100', (900, 999)),
+    ('bytes=-5000', (0, 999)),
+    ('Bytes = 5-5', (5, 5)),
+    ('bytes=1000-', (None, None)),
+    ('bytes=-0', (None, None)),
+    ('bytes=0-1,5-9', None),
+    ('items=0-9', None),
+    ('bytes=9-5', None),
+    ('bytes=a-b', None),
+])
+def test_byte_range(header, expected):
+    assert byte_range(header, 1000) == expected
+
+
+BODY = bytes(range(256)) * 4
+ETAG = 'abc123'
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / 'render.mp3'
+    path.write_bytes(BODY)
+    return path
+
+
+@pytest.fixture
+def last_modified(path):
+    return formatdate(path.stat().st_mtime, usegmt=True)
+
+
+@pytest.fixture
+def client(path):
+    app = FastAPI()
+
+    @app.get('/audio')
+    def audio(request: Request):
+        return file_response(request, str(path), ETAG, 'audio/mpeg')
+
+    return TestClient(app)
+
+
+def test_whole_file_with_validators(client):
+    response = client.get('/audio')
+
+    assert response.status_code == 200
+    assert response.content == BODY
+    assert response.headers['etag'] == f'"{ETAG}"'
+    assert response.headers['accept-ranges'] == 'bytes'
+    assert response.headers['content-length'] == str(len(BODY))
+
+
+def test_range(client):
+    response = client.get('/audio', headers={'Range': 'bytes=10-19'})
+
+    assert response.status_code == 206
+    assert response.content == BODY[10:20]
+    assert response.headers['content-range'] == f'bytes 10-19/{len(BODY)}'
+
+
+def test_range_past_the_end(client):
+    response = client.get('/audio', headers={'Range': f'bytes={len(BODY)}-'})
+
+    assert response.status_code == 416
+    assert response.headers['content-range'] == f'bytes */{len(BODY)}'
+
+
+@pytest.mark.parametrize('headers', [
+    {'If-None-Match': f'"{ETAG}"'},
+    {'If-None-Match': f'"other", W/"{ETAG}"'},
+    {'If-None-Match': '*'},
+])
+def test_not_modified_by_etag(client, headers):
+    assert client.get('/audio', headers=headers).status_code == 304
+
+
+def test_not_modified_since(client, last_modified):
+    response = client.get('/audio', headers={'If-Modified-Since': last_modified})
+
+    assert response.status_code == 304
+
+
+def test_if_none_match_wins_over_if_modified_since(client, last_modified):
+    response = client.get('/audio', headers={
+        'If-None-Match': '"other"',
+        'If-Modified-Since': last_modified,
+    })
+
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('if_range, status_code', [
+    (f'"{ETAG}"', 206),
+    (f'W/"{ETAG}"', 200),
+    ('"other"', 200),
+    (None, 206),
+])
+def test_if_range_by_etag(client, if_range, status_code):
+    headers = {'Range': 'bytes=0-9'}
+    if if_range is not None:
+        headers['If-Range'] = if_range
+
+    assert client.get('/audio', headers=headers).status_code == status_code
+
+
+def test_if_range_by_date(client, last_modified):
+    current = client.get('/audio', headers={'Range': 'bytes=0-9', 'If-Range': last_modified})
+    stale = client.get('/audio', headers={'Range': 'bytes=0-9', 'If-Range': 'Mon, 01 Jan 2001 00:00:00 GMT'})
+
+    assert current.status_code == 206
+    assert stale.status_code == 200
+    assert stale.content == BODY
@@ -0,0 +1,103 @@
+"""
+Every stage of every producer hands on float32 audio, from the decoded
+upload through the effect chains to the blocks written to the encoder.
+
+Run from server/ with python -m pytest -q.
+"""
+import numpy as np
+import pytest
+import soundfile as sf
+
+import producers.streaming
+from app.engine import PRODUCERS
+from benchmarks.corpus import KINDS, synthetic_track
+from producers import scott_burns, steve_albini
+from producers.audio_io import DTYPE, load_audio
+from producers.preview import preview_signal
+from producers.streaming import Chain, Gain, Preemphasis, iter_blocks
+from producers.time_stretch import STRETCH_MODES, time_stretch
+
+
+SR = 22050
+SECONDS = 4
+BLOCK = 4096
+
+CHAINS = {
+    'albini': lambda: steve_albini.build_chain(SR, dynamics_ratio=0.8, noise_floor=0.005, saturation=0.3),
+    'burns': lambda: scott_burns.build_chain(SR, bass_boost=1.2, high_end_crisp=0.8, drum_punch=1.5, distortion=0.4),
+    'dilla': lambda: Chain(Preemphasis(coef=0.95), Gain(15.5)),
+}
+
+
+@pytest.fixture(scope='module', params=KINDS)
+def track(request):
+    return synthetic_track(request.param, SECONDS, SR)
+
+
+@pytest.fixture
+def encoded(monkeypatch):
+    """Every block the producers hand to the encoder, which still writes them"""
+    blocks = []
+    open_encoder = producers.streaming.open_encoder
+
+    class Recorder:
+        def __init__(self, encoder):
+            self.encoder = encoder
+
+        def __enter__(self):
+            self.encoder.__enter__()
+            return self
+
+        def __exit__(self, *exc):
+            return self.encoder.__exit__(*exc)
+
+        def write(self, block):
+            blocks.append((block.dtype, len(block)))
+            return self.encoder.write(block)
+
+    monkeypatch.setattr(
+        producers.streaming, 'open_encoder', lambda *args, **kwargs: Recorder(open_encoder(*args, **kwargs))
+    )
+    return blocks
+
+
+def test_decode_is_float32(tmp_path):
+    path = tmp_path / 'in.wav'
+    sf.write(str(path), synthetic_track('sines', SECONDS, SR).astype(np.float64), SR, subtype='DOUBLE')
+    y, sr = load_audio(str(path), sr=SR)
+    assert sr == SR
+    assert y.dtype == DTYPE
+
+
+def test_synthetic_tracks_are_float32(track):
+    assert track.dtype == DTYPE
+
+
+@pytest.mark.parametrize('mode', ['auto', *STRETCH_MODES])
+def test_time_stretch_is_float32(track, mode):
+    assert time_stretch(track, 0.98, mode=mode).dtype == DTYPE
+
+
+def test_preview_is_float32(track):
+    excerpt, _ = preview_signal(track, SR)
+    assert excerpt.dtype == DTYPE
+
+
+@pytest.mark.parametrize('style', sorted(CHAINS))
+def test_chain_stages_are_float32(track, style):
+    chain = CHAINS[style]()
+    for _, block in iter_blocks(track, BLOCK):
+        block = np.array(block)
+        for processor in chain.processors:
+            block = processor.process(block)
+            assert block.dtype == DTYPE, processor.name or type(processor).__name__
+
+
+@pytest.mark.parametrize('style', sorted(PRODUCERS))
+def test_producer_encodes_float32(track, style, encoded, tmp_path):
+    output_path = str(tmp_path / f'{style}.wav')
+    PRODUCERS[style](input_path=None, output_path=output_path, task_id='test', y=track, sr=SR)
+
+    assert encoded
+    assert {dtype for dtype, _ in encoded} == {np.dtype(DTYPE)}
+    assert sf.info(output_path).frames == sum(frames for _, frames in encoded)
@@ -0,0 +1,170 @@
+import struct
+
+import pytest
+from fastapi import HTTPException
+
+from app.ingest import Mp3Sniffer, UploadSink, parse_frame_header, scan_duration
+
+# MPEG-1 Layer III, 128 kbit/s, 44.1 kHz, stereo: 417-byte frames of 1152 samples
+HEADER = bytes([0xFF, 0xFB, 0x90, 0x00])
+FRAME_LENGTH = 417
+FRAME_SECONDS = 1152 / 44100
+
+
+# The same at the lowest and highest bitrates
+LOW_HEADER, LOW_FRAME_LENGTH = bytes([0xFF, 0xFB, 0x10, 0x00]), 104
+HIGH_HEADER, HIGH_FRAME_LENGTH = bytes([0xFF, 0xFB, 0xE0, 0x00]), 1044
+
+
+def frame(payload: bytes = b'', header: bytes = HEADER, length: int = FRAME_LENGTH) -> bytes:
+    return header + payload + bytes(length - 4 - len(payload))
+
+
+def vbr_stream(low: int, high: int) -> bytes:
+    """Untagged VBR: low 32 kbit/s frames (a quiet intro) then high 320 kbit/s ones"""
+    return (
+        frame(header=LOW_HEADER, length=LOW_FRAME_LENGTH) * low
+        + frame(header=HIGH_HEADER, length=HIGH_FRAME_LENGTH) * high
+    )
+
+
+def xing_frame(frames: int) -> bytes:
+    # The tag follows the 32 bytes of stereo MPEG-1 side info
+    return frame(bytes(32) + b'Xing' + struct.pack('>II', 1, frames))
+
+
+def vbri_frame(frames: int) -> bytes:
+    return frame(bytes(32) + b'VBRI' + bytes(10) + struct.pack('>I', frames))
+
+
+def id3_tag(size: int) -> bytes:
+    syncsafe = bytes((size >> shift) & 0x7F for shift in (21, 14, 7, 0))
+    return b'ID3\x04\x00\x00' + syncsafe + bytes(size)
+
+
+def sniff(data: bytes, piece: int = None) -> Mp3Sniffer:
+    sniffer = Mp3Sniffer()
+    piece = piece or len(data)
+    for start in range(0, len(data), piece):
+        sniffer.feed(data[start:start + piece])
+    return sniffer
+
+
+def test_parse_frame_header():
+    header = parse_frame_header(HEADER)
+
+    assert (header.bitrate, header.sample_rate, header.frame_length) == (128000, 44100, FRAME_LENGTH)
+    assert parse_frame_header(b'\xff\xfb\xf0\x00') is None  # bad bitrate index
+    assert parse_frame_header(b'\xff\xfd\x90\x00') is None  # layer II
+    assert parse_frame_header(b'ID3\x04') is None
+
+
+def test_sniffs_constant_bitrate_stream():
+    sniffer = sniff(frame() * 10)
+
+    assert sniffer.done
+    assert sniffer.info.audio_start == 0
+    assert sniffer.info.frames is None
+    assert sniffer.info.duration(FRAME_LENGTH * 10) == pytest.approx(10 * FRAME_LENGTH * 8 / 128000)
+
+
+def test_skips_id3_tag():
+    sniffer = sniff(id3_tag(5000) + frame() * 3)
+
+    assert sniffer.info.audio_start == 10 + 5000
+
+
+@pytest.mark.parametrize('first_frame', [xing_frame(1000), vbri_frame(1000)])
+def test_frame_count_from_vbr_tag(first_frame):
+    sniffer = sniff(first_frame + frame() * 3)
+
+    assert sniffer.info.frames == 1000
+    assert sniffer.info.audio_start == FRAME_LENGTH
+    assert sniffer.info.duration() == pytest.approx(1000 * FRAME_SECONDS)
+
+
+@pytest.mark.parametrize('piece', [1, 3, 7, 100])
+def test_header_split_across_pieces(piece):
+    sniffer = sniff(id3_tag(300) + b'\xff\x00junk' + xing_frame(500) + frame() * 2, piece)
+
+    assert sniffer.info.frames == 500
+    assert sniffer.info.audio_start == 10 + 300 + 6 + FRAME_LENGTH
+
+
+def test_false_sync_without_a_following_frame_is_skipped():
+    sniffer = sniff(HEADER + bytes(600) + frame() * 3)
+
+    assert sniffer.info.audio_start == 4 + 600
+
+
+def test_gives_up_on_data_that_is_not_mp3():
+    sniffer = sniff(bytes(70 * 1024), 4096)
+
+    assert sniffer.done
+    assert sniffer.info is None
+
+
+def test_upload_sink_refuses_files_over_the_size_limit(tmp_path):
+    sink = UploadSink(str(tmp_path / 'task.mp3'), max_bytes=1000)
+    sink.write(frame() * 2)
+
+    with pytest.raises(HTTPException) as error:
+        sink.write(frame())
+    sink.abort()
+
+    assert error.value.status_code == 413
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_upload_sink_refuses_tracks_declared_too_long(tmp_path):
+    sink = UploadSink(str(tmp_path / 'task.mp3'), max_seconds=60)
+
+    with pytest.raises(HTTPException) as error:
+        sink.write(xing_frame(int(61 / FRAME_SECONDS)) + frame() * 2)
+    sink.abort()
+
+    assert error.value.status_code == 413
+
+
+def test_upload_sink_commits_under_the_final_name(tmp_path):
+    input_path = tmp_path / 'task.mp3'
+    sink = UploadSink(str(input_path), max_seconds=60)
+    for _ in range(4):
+        sink.write(frame() * 10)
+
+    content_hash = sink.commit()
+
+    assert [path.name for path in tmp_path.iterdir()] == ['task.mp3']
+    assert len(content_hash) == 64
+    assert sink.duration == pytest.approx(40 * FRAME_SECONDS)
+
+
+def test_scan_duration_walks_every_frame(tmp_path):
+    path = tmp_path / 'track.mp3'
+    path.write_bytes(id3_tag(300) + vbr_stream(20, 30) + b'junk' + frame() * 5 + b'TAG' + bytes(125))
+
+    assert scan_duration(str(path), 10 + 300, chunk_size=1000) == pytest.approx(55 * FRAME_SECONDS)
+
+
+def test_upload_sink_measures_untagged_vbr_tracks(tmp_path):
+    # At the intro's bitrate the file would estimate to over four minutes
+    data = vbr_stream(20, 1000)
+    sink = UploadSink(str(tmp_path / 'task.mp3'), max_seconds=60, expected_bytes=len(data))
+    for start in range(0, len(data), 64 * 1024):
+        sink.write(data[start:start + 64 * 1024])
+    assert sink.duration > 60
+
+    sink.commit()
+
+    assert sink.duration == pytest.approx(1020 * FRAME_SECONDS)
+
+
+def test_upload_sink_refuses_tracks_too_long_at_any_bitrate(tmp_path):
+    sink = UploadSink(str(tmp_path / 'task.mp3'), max_seconds=60)
+
+    with pytest.raises(HTTPException) as error:
+        for _ in range(24):
+            sink.write(vbr_stream(0, 100))
+    sink.abort()
+
+    assert error.value.status_code == 413
@@ -0,0 +1,173 @@
+import subprocess
+import sys
+
+import pytest
+
+from app.jobs import PRIORITY_FULL, PRIORITY_PREVIEW, JobQueue, worker_id
+from app.registry import COMPLETE, FAILED, PROCESSING, QUEUED
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / 'jobs.sqlite3'), lease_seconds=30, max_attempts=2)
+
+
+def render(style: str, **job) -> dict:
+    return {
+        'style': style,
+        'output_path': f'/processed/{style}.mp3',
+        'params': {},
+        'cache_key': None,
+        'state': QUEUED,
+        **job,
+    }
+
+
+def enqueue(queue: JobQueue, task_id: str, styles, client_id: str = 'client', **job):
+    queue.enqueue(task_id, f'/uploads/{task_id}.mp3', 'hash', [render(style, **job) for style in styles], client_id=client_id)
+
+
+def expire_leases(queue: JobQueue):
+    with queue._transaction() as db:
+        db.execute('UPDATE jobs SET lease_expires = 0 WHERE state = ?', (PROCESSING,))
+
+
+def test_claim_takes_previews_first_then_submission_order(queue):
+    enqueue(queue, 'task', ['albini', 'burns'])
+    enqueue(queue, 'task', ['albini_preview'], priority=PRIORITY_PREVIEW)
+
+    claimed = [queue.claim('worker')['style'] for _ in range(3)]
+
+    assert claimed == ['albini_preview', 'albini', 'burns']
+    assert queue.claim('worker') is None
+
+
+def test_claim_alternates_between_clients(queue):
+    enqueue(queue, 'a1', ['albini', 'burns', 'dilla'], client_id='a')
+    enqueue(queue, 'b1', ['albini', 'burns'], client_id='b')
+
+    clients = [queue.claim('worker')['client_id'] for _ in range(4)]
+
+    assert clients == ['a', 'b', 'a', 'b']
+
+
+def test_claim_skips_clients_at_their_concurrency_limit(queue):
+    enqueue(queue, 'a1', ['albini', 'burns'], client_id='a')
+    enqueue(queue, 'b1', ['albini'], client_id='b')
+
+    first = queue.claim('worker', client_concurrency=1)
+    second = queue.claim('worker', client_concurrency=1)
+
+    assert {first['client_id'], second['client_id']} == {'a', 'b'}
+    assert queue.claim('worker', client_concurrency=1) is None
+
+
+def test_claim_gives_every_attempt_its_own_partial_path(queue):
+    enqueue(queue, 'task', ['albini'])
+    first = queue.claim('worker')
+    expire_leases(queue)
+    second = queue.claim('other')
+
+    assert first['partial_path'] == '/processed/albini.1.part.mp3'
+    assert second['partial_path'] == '/processed/albini.2.part.mp3'
+
+
+def test_claim_reserves_memory_running_jobs_have_yet_to_use(queue):
+    enqueue(queue, 'a1', ['albini'], client_id='a', memory_estimate=500)
+    enqueue(queue, 'b1', ['dilla'], client_id='b', memory_estimate=600)
+
+    # An idle queue always runs its next job
+    running = queue.claim('worker', memory_available=100)
+    assert running['style'] == 'albini'
+    assert queue.claim('other', memory_available=1000) is None
+
+    queue.heartbeat(running['id'], 'worker', memory_used=400)
+    assert queue.claim('other', memory_available=1000)['style'] == 'dilla'
+
+
+def test_expired_lease_is_claimed_again(queue):
+    enqueue(queue, 'task', ['albini'])
+    job = queue.claim('worker')
+    assert queue.claim('other') is None
+
+    expire_leases(queue)
+    retry = queue.claim('other')
+
+    assert retry['id'] == job['id']
+    assert retry['attempts'] == 2
+    assert not queue.heartbeat(job['id'], 'worker')
+    assert not queue.complete(job['id'], 'worker')
+    assert queue.heartbeat(retry['id'], 'other', progress=0.5)
+
+
+def test_reap_fails_jobs_lost_on_their_last_attempt(queue):
+    enqueue(queue, 'task', ['albini'])
+    queue.claim('worker')
+    expire_leases(queue)
+    queue.claim('other')
+    expire_leases(queue)
+
+    reaped = queue.reap()
+
+    assert [job['state'] for job in reaped] == [PROCESSING]
+    assert queue.claim('worker') is None
+    assert queue.changes()[-1]['state'] == FAILED
+    assert queue.remaining('task') == 0
+
+
+def test_fail_requeues_until_the_last_attempt(queue):
+    enqueue(queue, 'task', ['albini'])
+
+    job = queue.claim('worker')
+    assert queue.fail(job['id'], 'worker', 'boom') == QUEUED
+    job = queue.claim('worker')
+    assert queue.fail(job['id'], 'worker', 'boom') == FAILED
+    assert queue.claim('worker') is None
+    assert queue.fail(job['id'], 'someone else', 'boom') is None
+
+
+def test_complete_records_the_output(queue):
+    enqueue(queue, 'task', ['albini'])
+    job = queue.claim('worker')
+
+    assert queue.complete(job['id'], 'worker', output_hash='abc', memory={'peak': 1}, memory_peak=1)
+
+    (finished,) = queue.changes()
+    assert finished['state'] == COMPLETE
+    assert finished['output_hash'] == 'abc'
+    assert finished['memory'] == {'peak': 1}
+    assert queue.remaining('task') == 0
+
+
+def test_release_orphans_expires_leases_of_dead_workers(queue):
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    dead = f"{worker_id().rpartition(':')[0]}:{process.pid}"
+    enqueue(queue, 'a1', ['albini'], client_id='a')
+    enqueue(queue, 'b1', ['albini'], client_id='b')
+    orphan = queue.claim(dead)
+    queue.claim(worker_id())
+
+    assert queue.release_orphans() == 1
+    assert queue.claim('other')['id'] == orphan['id']
+
+
+def test_backlog_counts_full_renders_and_the_cost_of_every_job(queue):
+    enqueue(queue, 'a1', ['albini', 'burns'], client_id='a', cost=60)
+    enqueue(queue, 'a1', ['albini_preview', 'burns_preview'], client_id='a', priority=PRIORITY_PREVIEW, cost=30)
+    enqueue(queue, 'b1', ['albini'], client_id='b', cost=60, priority=PRIORITY_FULL)
+
+    assert queue.backlog() == {'jobs': 3, 'cost': 240}
+    assert queue.backlog('a') == {'jobs': 2, 'cost': 180}
+    assert queue.backlog('nobody') == {'jobs': 0, 'cost': 0}
+
+
+def test_changes_follow_the_queue_in_order(queue):
+    enqueue(queue, 'task', ['albini', 'burns'])
+    since = queue.changes()[-1]['seq']
+    job = queue.claim('worker')
+    queue.heartbeat(job['id'], 'worker', progress=0.5)
+
+    changes = queue.changes(since)
+
+    assert [(change['style'], change['progress']) for change in changes] == [('albini', 0.5)]
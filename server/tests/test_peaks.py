@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+import soundfile as sf
+
+from app.engine import PRODUCERS
+from benchmarks.corpus import synthetic_track
+from producers.peaks import PeaksBuilder, peaks_from_signal, select_peaks
+from producers.streaming import Gain, render
+
+SR = 22050
+
+
+def test_builder_does_not_depend_on_block_boundaries():
+    y = synthetic_track('drums', 3, SR)
+    builder = PeaksBuilder(SR)
+    for start in range(0, len(y), 1000):
+        builder.add(y[start:start + 1000])
+
+    split, whole = builder.finish(), peaks_from_signal(y, SR)
+
+    assert split['frames'] == whole['frames'] == len(y)
+    for bucket, pairs in whole['levels'].items():
+        np.testing.assert_array_equal(split['levels'][bucket], pairs)
+
+
+def test_render_collects_peaks_of_the_encoded_blocks(tmp_path):
+    y = synthetic_track('sines', 3, SR)
+    peaks = PeaksBuilder(SR)
+
+    render(y, Gain(0.5), str(tmp_path / 'out.wav'), SR, normalize_to=0.5, block_size=4096, peaks=peaks)
+
+    expected = peaks_from_signal(y * np.float32(0.5 / np.abs(y).max()), SR)
+    for bucket, pairs in expected['levels'].items():
+        np.testing.assert_allclose(peaks.finish()['levels'][bucket], pairs, atol=1)
+
+
+@pytest.mark.parametrize('style', sorted(PRODUCERS))
+def test_producers_collect_peaks_of_their_whole_output(style, tmp_path):
+    output_path = str(tmp_path / f'{style}.wav')
+    peaks = PeaksBuilder(SR)
+
+    PRODUCERS[style](
+        input_path=None, output_path=output_path, task_id='test',
+        y=synthetic_track('drums', 4, SR), sr=SR, peaks=peaks
+    )
+
+    finished = peaks.finish()
+    assert finished['frames'] == sf.info(output_path).frames
+    _, pairs = select_peaks(finished, 100)
+    assert pairs.max() > 0
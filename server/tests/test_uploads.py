@@ -0,0 +1,89 @@
+import base64
+import hashlib
+
+import pytest
+from fastapi import HTTPException
+
+from app import uploads as uploads_module
+from app.uploads import COMMITTED, ResumableUploads, parse_checksum
+
+DATA = bytes(range(256)) * 64
+
+
+def digest(data: bytes) -> bytes:
+    return hashlib.sha256(data).digest()
+
+
+@pytest.fixture
+def uploads(tmp_path):
+    return ResumableUploads(str(tmp_path / 'sessions'))
+
+
+def status_of(call, *args) -> int:
+    with pytest.raises(HTTPException) as error:
+        call(*args)
+    return error.value.status_code
+
+
+def test_parse_checksum():
+    assert parse_checksum('sha256 ' + base64.b64encode(digest(DATA)).decode()) == digest(DATA)
+    assert status_of(parse_checksum, 'md5 abc') == 400
+    assert status_of(parse_checksum, 'sha256 not*base64') == 400
+
+
+def test_chunks_append_at_the_current_offset(uploads, tmp_path):
+    upload = uploads.create('track.mp3', len(DATA), 'client')
+    half = len(DATA) // 2
+
+    assert uploads.append(upload['id'], 0, DATA[:half], digest(DATA[:half]))['offset'] == half
+    assert status_of(uploads.append, upload['id'], 0, DATA[:half], digest(DATA[:half])) == 409
+    assert uploads.get(upload['id'])['offset'] == half
+
+    uploads.append(upload['id'], half, DATA[half:], digest(DATA[half:]))
+    input_path = tmp_path / 'task.mp3'
+    committed = uploads.commit(upload['id'], str(input_path), hashlib.sha256(DATA).hexdigest())
+
+    assert committed['state'] == COMMITTED
+    assert committed['content_hash'] == hashlib.sha256(DATA).hexdigest()
+    assert input_path.read_bytes() == DATA
+    assert status_of(uploads.commit, upload['id'], str(input_path)) == 409
+
+
+def test_chunk_with_a_bad_checksum_is_not_written(uploads):
+    upload = uploads.create('track.mp3', len(DATA), 'client')
+
+    assert status_of(uploads.append, upload['id'], 0, DATA[:100], digest(b'other')) == 400
+    assert uploads.get(upload['id'])['offset'] == 0
+
+
+def test_chunk_past_the_declared_size(uploads):
+    upload = uploads.create('track.mp3', 10, 'client')
+
+    assert status_of(uploads.append, upload['id'], 0, DATA[:11], digest(DATA[:11])) == 400
+
+
+def test_commit_checks_completeness_and_checksum(uploads, tmp_path):
+    upload = uploads.create('track.mp3', len(DATA), 'client')
+    uploads.append(upload['id'], 0, DATA[:100], digest(DATA[:100]))
+    assert status_of(uploads.commit, upload['id'], str(tmp_path / 'task.mp3')) == 409
+
+    uploads.append(upload['id'], 100, DATA[100:], digest(DATA[100:]))
+    assert status_of(uploads.commit, upload['id'], str(tmp_path / 'task.mp3'), '0' * 64) == 400
+
+
+def test_unknown_upload(uploads):
+    assert status_of(uploads.get, 'not-an-id') == 404
+    assert status_of(uploads.get, '00000000-0000-0000-0000-000000000000') == 404
+
+
+def test_untagged_vbr_track_is_measured_on_commit(uploads, tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads_module, 'MAX_UPLOAD_SECONDS', 60)
+    # Untagged VBR, 44.1 kHz: a 32 kbit/s intro, then 320 kbit/s frames
+    data = (b'\xff\xfb\x10\x00' + bytes(100)) * 20 + (b'\xff\xfb\xe0\x00' + bytes(1040)) * 1000
+    upload = uploads.create('track.mp3', len(data), 'client')
+
+    # Over four minutes at the intro's bitrate, but not refused
+    assert uploads.append(upload['id'], 0, data, digest(data))['duration'] > 60
+    committed = uploads.commit(upload['id'], str(tmp_path / 'task.mp3'))
+
+    assert committed['duration'] == pytest.approx(1020 * 1152 / 44100)
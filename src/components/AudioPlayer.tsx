@@ -1,12 +1,15 @@
 import React, { useEffect, useRef, useState } from 'react';
 import WaveSurfer from 'wavesurfer.js';
 import { Play, Pause, RotateCcw, Volume2, VolumeX } from 'lucide-react';
+import { fetchPeaks, Peaks } from '../services/apiService';
 
 interface AudioPlayerProps {
   audioUrl: string;
+  // Precomputed waveform; without it the whole file is decoded to draw one
+  peaksUrl?: string;
 }
 
-const AudioPlayer: React.FC<AudioPlayerProps> = ({ audioUrl }) => {
+const AudioPlayer: React.FC<AudioPlayerProps> = ({ audioUrl, peaksUrl }) => {
   const containerRef = useRef<HTMLDivElement>(null);
   const wavesurferRef = useRef<WaveSurfer | null>(null);
   const [isPlaying, setIsPlaying] = useState(false);
@@ -17,41 +20,60 @@ const AudioPlayer: React.FC<AudioPlayerProps> = ({ audioUrl }) => {
 
   useEffect(() => {
     if (!containerRef.current) return;
+    let cancelled = false;
+
+    const createPlayer = (peaks?: Peaks) => {
+      if (cancelled || !containerRef.current) return;
+
+      // Initialize WaveSurfer
+      const wavesurfer = WaveSurfer.create({
+        container: containerRef.current,
+        waveColor: 'rgba(255, 255, 255, 0.3)',
+        progressColor: '#8b5cf6',
+        cursorColor: 'rgba(255, 255, 255, 0.5)',
+        barWidth: 2,
+        barGap: 2,
+        barRadius: 2,
+        height: 60,
+        url: audioUrl,
+        // With peaks the waveform is drawn at once and the audio streams
+        ...(peaks && { peaks: [peaks.data], duration: peaks.duration }),
+      });
+
+      wavesurferRef.current = wavesurfer;
+
+      wavesurfer.on('ready', () => {
+        setDuration(wavesurfer.getDuration());
+        wavesurfer.setVolume(volume);
+      });
+
+      wavesurfer.on('audioprocess', () => {
+        setCurrentTime(wavesurfer.getCurrentTime());
+      });
+
+      wavesurfer.on('play', () => setIsPlaying(true));
+      wavesurfer.on('pause', () => setIsPlaying(false));
+      wavesurfer.on('finish', () => setIsPlaying(false));
+    };
 
-    // Initialize WaveSurfer
-    const wavesurfer = WaveSurfer.create({
-      container: containerRef.current,
-      waveColor: 'rgba(255, 255, 255, 0.3)',
-      progressColor: '#8b5cf6',
-      cursorColor: 'rgba(255, 255, 255, 0.5)',
-      barWidth: 2,
-      barGap: 2,
-      barRadius: 2,
-      height: 60,
-      url: audioUrl,
-    });
-
-    wavesurferRef.current = wavesurfer;
-
-    wavesurfer.on('ready', () => {
-      setDuration(wavesurfer.getDuration());
-      wavesurfer.setVolume(volume);
-    });
-
-    wavesurfer.on('audioprocess', () => {
-      setCurrentTime(wavesurfer.getCurrentTime());
-    });
-
-    wavesurfer.on('play', () => setIsPlaying(true));
-    wavesurfer.on('pause', () => setIsPlaying(false));
-    wavesurfer.on('finish', () => setIsPlaying(false));
+    if (peaksUrl) {
+      // One bar per 4px (bar plus gap) is all the waveform can show
+      const buckets = Math.max(Math.ceil(containerRef.current.clientWidth / 4), 64);
+      fetchPeaks(peaksUrl, buckets)
+        .then((peaks) => createPlayer(peaks))
+        .catch(() => createPlayer());
+    } else {
+      createPlayer();
+    }
 
     return () => {
+      cancelled = true;
       if (wavesurferRef.current) {
         wavesurferRef.current.destroy();
+        wavesurferRef.current = null;
       }
     };
-  }, [audioUrl]);
+  }, [audioUrl, peaksUrl]);
 
   const togglePlayPause = () => {
     if (wavesurferRef.current) {
@@ -4,14 +4,15 @@ import { Upload, Play, Download, Disc, RefreshCw, X } from 'lucide-react';
 import FileUploader from './FileUploader';
 import ProgressBar from './ProgressBar';
 import AudioPlayer from './AudioPlayer';
-import { processAudio, checkStatus } from '../services/apiService';
+import { uploadAudio, watchTask, busyMessage, API_URL } from '../services/apiService';
 
 export type ProcessingStatus = 'idle' | 'uploading' | 'processing' | 'complete' | 'error';
 const PRODUCERS = ['dilla', 'albini', 'burns'];
 export type mixObject = {
   name:string,
   firstLast: string,
-  mix:string
+  mix:string,
+  peaks?: string
 }
 const RemixStudio: React.FC = () => {
   const [status, setStatus] = useState<ProcessingStatus>('idle');
@@ -34,11 +35,7 @@ const RemixStudio: React.FC = () => {
     setOriginalAudio(URL.createObjectURL(file));
     
     try {
-      // Create FormData object
-      const formData = new FormData();
-      formData.append('audio', file);
-      
-      const response = await processAudio(formData, (progressEvent) => {
+      const response = await uploadAudio(file, (progressEvent) => {
         // Handle progress updates
         const percentCompleted = Math.round(
           (progressEvent.loaded * 30) / progressEvent.total
@@ -51,12 +48,14 @@ const RemixStudio: React.FC = () => {
       });
       // Handle the successful response
       if (response.taskId) {
-          loopStatus(response.taskId)  
+          await loopStatus(response.taskId)
         };
     } catch (error) {
       console.error('Error processing audio:', error);
       setStatus('error');
-      setErrorMessage('There was an error processing your audio file. Please try again.');
+      setErrorMessage(
+        busyMessage(error) ?? 'There was an error processing your audio file. Please try again.'
+      );
     }
   };
 
@@ -75,12 +74,17 @@ const RemixStudio: React.FC = () => {
   };
 
   const loopStatus = async (taskId: string) => {
+    const result = await watchTask(taskId, (update) => {
+      // Upload covers the first 30%, rendering the remaining 70%
+      const styles = Object.values(update.producers);
+      const rendered = styles.reduce((sum, producer) => sum + producer.progress, 0) / styles.length;
+      setProgress(30 + Math.round(rendered * 0.7));
+    });
+
     let holderArray = new Array()
     for (let i = 0; i<PRODUCERS.length; i++) {
-      const status = await checkStatus(taskId, PRODUCERS[i]);
-      if (status) {
-        setProgress(progress+20)
-
+      const producer = result.producers[PRODUCERS[i]];
+      if (producer && producer.audioUrl) {
         let producerName;
         if (PRODUCERS[i] === 'dilla') {
           producerName = 'J. Dilla'
@@ -92,7 +96,8 @@ const RemixStudio: React.FC = () => {
         holderArray.push({
           "name": PRODUCERS[i],
           "firstLast": producerName, 
-          "mix":status
+          "mix": `${API_URL}${producer.audioUrl}`,
+          "peaks": producer.peaksUrl && `${API_URL}${producer.peaksUrl}`
         })
       }
     }
@@ -105,7 +110,7 @@ const RemixStudio: React.FC = () => {
       <div className="grid md:grid-cols-1">
         <div className="space-y-2">
           <h4 className="font-medium text-white/80">Remixed ({mix.firstLast} Style)</h4>
-          <AudioPlayer audioUrl={mix.mix} />
+          <AudioPlayer audioUrl={mix.mix} peaksUrl={mix.peaks} />
         </div>
     </div>
     <div className="flex justify-center">
@@ -1,6 +1,6 @@
 import axios from 'axios';
 
-const API_URL = import.meta.env.PROD 
+export const API_URL = import.meta.env.PROD 
   ? 'https://proto-mixmaster-server-production.up.railway.app'  // Replace with your Railway URL
   : 'http://localhost:8000';
 
@@ -17,10 +17,11 @@ export const processAudio = async (formData: FormData, onProgress?: ProgressCall
       onUploadProgress: onProgress,
     });
 
-    const taskId = response.data.taskId;
+    // 202 Accepted: the job is queued, progress comes from watchTask
+    const { taskId, status, message } = response.data;
     return {
-      status: 'success',
-      message: 'Audio processed successfully',
+      status,
+      message,
       taskId,
     };
     
@@ -30,22 +31,186 @@ export const processAudio = async (formData: FormData, onProgress?: ProgressCall
   }
 };
 
-export const checkStatus = async (taskId: string, style: string) => {
-    console.log(`${taskId}_${style}`)
-    // Poll for completion
-    let audioUrl = null;
-    let attempts = 0;
-    const maxAttempts = 30;
-  while (!audioUrl && attempts < maxAttempts) {
-    const statusResponse = await axios.get(`${API_URL}/status/${taskId}_${style}`);
-    if (statusResponse.data.status === 'complete') {
-      audioUrl = `${API_URL}/audio/${taskId}_${style}`;
-      break;
+// Files above this size go through the resumable chunked upload
+const RESUMABLE_THRESHOLD = 4 * 1024 * 1024;
+const CHUNK_SIZE = 1024 * 1024;
+const MAX_CHUNK_RETRIES = 5;
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+const chunkChecksum = async (chunk: Blob) => {
+  const digest = new Uint8Array(await crypto.subtle.digest('SHA-256', await chunk.arrayBuffer()));
+  return `sha256 ${btoa(String.fromCharCode(...digest))}`;
+};
+
+// Errors worth retrying a chunk for: dropped connections and server hiccups
+const isTransient = (error: unknown) =>
+  axios.isAxiosError(error) && (!error.response || error.response.status >= 500);
+
+// Upload a file in checksummed chunks. The upload id is remembered per file,
+// so a dropped connection or even a page reload carries on from the last
+// chunk the server has instead of starting over.
+export const uploadAudioResumable = async (file: File, onProgress?: ProgressCallback) => {
+  const sessionKey = `upload:${file.name}:${file.size}:${file.lastModified}`;
+  let uploadId = localStorage.getItem(sessionKey);
+  let offset = 0;
+
+  if (uploadId) {
+    try {
+      offset = (await axios.get(`${API_URL}/uploads/${uploadId}`)).data.offset;
+    } catch {
+      uploadId = null;
     }
-    attempts++;
   }
-  if (!audioUrl) {
-    throw new Error('Processing timeout');
+  if (!uploadId) {
+    const response = await axios.post(`${API_URL}/uploads`, {
+      filename: file.name,
+      size: file.size,
+      contentType: file.type || 'audio/mpeg',
+    });
+    uploadId = response.data.uploadId as string;
+    localStorage.setItem(sessionKey, uploadId);
   }
-  return audioUrl
-}
\ No newline at end of file
+
+  let retries = 0;
+  while (offset < file.size) {
+    onProgress?.({ loaded: offset, total: file.size });
+    const chunk = file.slice(offset, offset + CHUNK_SIZE);
+    try {
+      const response = await axios.patch(`${API_URL}/uploads/${uploadId}`, chunk, {
+        headers: {
+          'Content-Type': 'application/offset+octet-stream',
+          'Upload-Offset': String(offset),
+          'Upload-Checksum': await chunkChecksum(chunk),
+        },
+      });
+      offset = response.data.offset;
+      retries = 0;
+    } catch (error) {
+      if (axios.isAxiosError(error) && error.response?.status === 409) {
+        // The server has a different offset (e.g. a lost response): resume there
+        offset = Number(error.response.headers['upload-offset'] ?? offset);
+        continue;
+      }
+      if (!isTransient(error) || retries >= MAX_CHUNK_RETRIES) {
+        if (!isTransient(error)) localStorage.removeItem(sessionKey);
+        throw error;
+      }
+      retries += 1;
+      await sleep(500 * 2 ** retries);
+      try {
+        offset = (await axios.get(`${API_URL}/uploads/${uploadId}`)).data.offset;
+      } catch {
+        // Keep the offset we have and try the chunk again
+      }
+    }
+  }
+  onProgress?.({ loaded: file.size, total: file.size });
+
+  try {
+    const response = await axios.post(`${API_URL}/uploads/${uploadId}/commit`);
+    const { taskId, status, message } = response.data;
+    return { status, message, taskId };
+  } finally {
+    localStorage.removeItem(sessionKey);
+  }
+};
+
+// Upload a track for processing, in resumable chunks when it is large
+export const uploadAudio = async (file: File, onProgress?: ProgressCallback) => {
+  if (file.size > RESUMABLE_THRESHOLD) {
+    return uploadAudioResumable(file, onProgress);
+  }
+  const formData = new FormData();
+  formData.append('audio', file);
+  return processAudio(formData, onProgress);
+};
+
+// Message for an upload the server turned away because it is overloaded
+// (503) or this client has too many uploads in progress (429); null for
+// any other error.
+export const busyMessage = (error: unknown): string | null => {
+  if (!axios.isAxiosError(error) || !error.response) return null;
+  const { status, headers } = error.response;
+  if (status !== 429 && status !== 503) return null;
+  const retryAfter = headers['retry-after'];
+  const when = retryAfter ? `in ${retryAfter} seconds` : 'in a little while';
+  return status === 429
+    ? `You already have several tracks processing. Please try again ${when}.`
+    : `The server is busy right now. Please try again ${when}.`;
+};
+
+export interface ProducerProgress {
+  status: 'queued' | 'processing' | 'complete' | 'failed';
+  progress: number;
+  audioUrl?: string;
+  peaksUrl?: string;
+  // Plays the render while it is still being encoded
+  streamUrl?: string;
+  // Seconds of the track covered when the render was shortened to fit the server's memory budget
+  maxSeconds?: number;
+  // 25s excerpt rendered ahead of the full track
+  preview?: ProducerProgress;
+}
+
+export interface TaskProgress {
+  taskId: string;
+  status: 'queued' | 'processing' | 'complete' | 'failed';
+  producers: Record<string, ProducerProgress>;
+}
+
+// Connection errors in a row before watchTask gives up on the progress stream
+const MAX_STREAM_ERRORS = 5;
+
+// Subscribe to server-pushed progress for a task; resolves with the final
+// snapshot once every producer has finished. EventSource reconnects by
+// itself after a dropped connection and the server sends a full snapshot
+// on every connect, so only a stream the browser has closed, or one that
+// keeps failing, is an error.
+export const watchTask = (taskId: string, onUpdate?: (progress: TaskProgress) => void) =>
+  new Promise<TaskProgress>((resolve, reject) => {
+    const source = new EventSource(`${API_URL}/events/${taskId}`);
+    let errors = 0;
+    source.onopen = () => {
+      errors = 0;
+    };
+    source.onmessage = (event) => {
+      errors = 0;
+      const progress: TaskProgress = JSON.parse(event.data);
+      onUpdate?.(progress);
+      if (progress.status === 'complete' || progress.status === 'failed') {
+        source.close();
+        resolve(progress);
+      }
+    };
+    source.onerror = () => {
+      errors += 1;
+      if (source.readyState === EventSource.CLOSED || errors >= MAX_STREAM_ERRORS) {
+        source.close();
+        reject(new Error('Lost connection to progress stream'));
+      }
+    };
+  });
+
+export interface Peaks {
+  duration: number;
+  // Interleaved min/max pairs scaled to -1..1
+  data: Float32Array;
+}
+
+// Server-computed waveform of a track, so it can be drawn without
+// downloading and decoding the audio first
+export const fetchPeaks = async (peaksUrl: string, buckets: number): Promise<Peaks> => {
+  const response = await axios.get(peaksUrl, { params: { buckets } });
+  const { duration, scale, peaks } = response.data;
+  return { duration, data: Float32Array.from(peaks, (value: number) => value / scale) };
+};
+
+export const checkStatus = async (taskId: string, style: string) => {
+  const progress = await watchTask(taskId);
+  const producer = progress.producers[style];
+  if (!producer || producer.status !== 'complete') {
+    throw new Error('Processing failed');
+  }
+  return `${API_URL}/audio/${taskId}_${style}`;
+}